@@ -0,0 +1,81 @@
+# _cassettes.py - serving responses recorded in the test suite's VCR cassettes, without a network
+
+import os
+import yaml
+import requests
+
+from urllib.parse import urlsplit, parse_qsl
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from mastodon import Mastodon
+
+CASSETTE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "cassettes")
+BASE_URL = "http://localhost:3000"
+
+def load_cassette(name):
+    """
+    Returns the interactions recorded in the cassette `name` (without .yaml) as a list of
+    (method, url, status code, headers, body) tuples.
+    """
+    with open(os.path.join(CASSETTE_DIR, name + ".yaml"), "r", encoding="utf-8") as cassette_file:
+        cassette = yaml.safe_load(cassette_file)
+    interactions = []
+    for interaction in cassette["interactions"]:
+        request = interaction["request"]
+        response = interaction["response"]
+        headers = {key: ", ".join(value) if isinstance(value, list) else value for key, value in response["headers"].items()}
+        body = response["body"]["string"]
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        interactions.append((request["method"], request["uri"], response["status"]["code"], headers, body))
+    return interactions
+
+def response_body(name, method, path):
+    """
+    Returns the body of the first response to `method` `path` (with or without query) in cassette `name`.
+    """
+    for request_method, url, _, _, body in load_cassette(name):
+        split_url = urlsplit(url)
+        if request_method == method and path in (split_url.path, split_url.path + "?" + split_url.query):
+            return body
+    raise KeyError(f"{method} {path} not found in cassette {name}")
+
+def _request_key(method, url):
+    split_url = urlsplit(url)
+    return (method, split_url.path, tuple(sorted(parse_qsl(split_url.query))))
+
+class CassetteAdapter(BaseAdapter):
+    """
+    requests transport adapter that answers requests with the responses recorded for them in
+    the given cassettes, matched on method, path and query parameters (in any order). The same
+    response can be served any number of times. Requests that were not recorded get a 404.
+    """
+    def __init__(self, *names):
+        super(CassetteAdapter, self).__init__()
+        self.responses = {}
+        for name in names:
+            for method, url, status_code, headers, body in load_cassette(name):
+                self.responses.setdefault(_request_key(method, url), (status_code, headers, body))
+
+    def send(self, request, **kwargs):
+        status_code, headers, body = self.responses.get(_request_key(request.method, request.url), (404, {}, b'{"error":"Not recorded"}'))
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+def cassette_api(*names):
+    """
+    Returns a Mastodon instance that is served from the given cassettes.
+    """
+    api = Mastodon(api_base_url=BASE_URL, access_token="benchmark", version_check_mode="none", ratelimit_method="throw")
+    api.session.mount(BASE_URL, CassetteAdapter(*names))
+    return api
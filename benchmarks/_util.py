@@ -0,0 +1,64 @@
+# _util.py - tiny timing helper shared by the benchmark scripts
+
+import json
+import platform
+import time
+import tracemalloc
+
+# Bump when the layout of the JSON written by write_results() changes
+RESULTS_FORMAT_VERSION = 1
+
+def bench(name, func, number=10, items=1, allocations=False):
+    """
+    Run `func` `number` times and print the best time per call and per item.
+    Returns a dict with the results.
+
+    With `allocations`, `func` is run once more with tracemalloc enabled, and the peak memory
+    allocated during that run (in bytes) is added to the results as `alloc_peak_bytes`.
+    """
+    timings = []
+    for _ in range(number):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    result = {
+        "name": name,
+        "best_s": best,
+        "per_item_us": best / items * 1e6,
+        "items_per_s": items / best if best > 0 else float("inf"),
+    }
+    line = f"{name:<50} {best * 1000.0:10.3f} ms {result['per_item_us']:12.2f} us/item"
+    if allocations:
+        tracemalloc.start()
+        try:
+            func()
+            result["alloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        line += f" {result['alloc_peak_bytes'] / 1024.0:10.1f} KiB peak"
+    print(line)
+    return result
+
+def write_results(path, results):
+    """
+    Write benchmark results to `path` as JSON, along with what they were measured on, so that runs
+    can be compared between releases. Results are sorted by name, to keep diffs between runs small.
+    """
+    try:
+        from importlib.metadata import version
+        mastodonpy_version = version("Mastodon.py")
+    except Exception:
+        mastodonpy_version = None
+    data = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "mastodonpy_version": mastodonpy_version,
+        "python_version": platform.python_version(),
+        "python_implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "results": sorted(results, key=lambda result: result["name"]),
+    }
+    with open(path, "w") as results_file:
+        json.dump(data, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
@@ -0,0 +1,43 @@
+# bench_access.py - attribute access on entities, compared to plain dict access
+#
+# Run from the repository root: python -m benchmarks.bench_access [--json results.json]
+
+import argparse
+import json
+
+from mastodon.return_types import Status, Instance
+from mastodon.types_base import try_cast_recurse
+from benchmarks._util import bench, write_results
+from benchmarks._cassettes import response_body
+
+def run(count=100000):
+    statuses_json = json.loads(response_body("test_home_tl", "GET", "/api/v1/timelines/home"))
+    status_json = statuses_json[0]
+    status = try_cast_recurse(Status, dict(status_json, unknown_extra_key=True))
+    instance = Instance(domain="example.com", contact={"email": "admin@example.com"})
+    loop = range(count)
+
+    results = []
+    results.append(bench("dict access (status['account']['acct'])", lambda: [status_json["account"]["acct"] for _ in loop], items=count))
+    results.append(bench("entity item access (status['account']['acct'])", lambda: [status["account"]["acct"] for _ in loop], items=count))
+    results.append(bench("entity attribute access (status.account.acct)", lambda: [status.account.acct for _ in loop], items=count))
+    results.append(bench("entity attribute access (unset field, None)", lambda: [status.in_reply_to_id for _ in loop], items=count))
+    results.append(bench("entity attribute access (key without a field)", lambda: [status.unknown_extra_key for _ in loop], items=count))
+    results.append(bench("entity method lookup (status.items)", lambda: [status.items for _ in loop], items=count))
+    results.append(bench("entity redirected access (instance.uri)", lambda: [instance.uri for _ in loop], items=count))
+    results.append(bench("entity redirected access (instance.email)", lambda: [instance.email for _ in loop], items=count))
+
+    # Writes cast the value, so they are much slower than reads and get fewer iterations
+    write_loop = range(max(count // 100, 1))
+    results.append(bench("entity attribute write (status.content = ...)", lambda: [setattr(status, "content", "") for _ in write_loop],
+                         number=3, items=len(write_loop)))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark attribute access on entities.")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    parser.add_argument("--count", type=int, default=100000, help="how many accesses to time per benchmark")
+    args = parser.parse_args()
+    results = run(args.count)
+    if args.json is not None:
+        write_results(args.json, results)
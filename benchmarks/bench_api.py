@@ -0,0 +1,101 @@
+# bench_api.py - hot paths of API calls, replayed offline from the test suite's cassettes
+#
+# Run from the repository root: python -m benchmarks.bench_api [--json results.json]
+#
+# Responses are served from tests/cassettes through the normal request path (session, __api_request,
+# casting, pagination header parsing), so nothing but the network is left out. --json writes the
+# results in a stable, machine-readable form for comparing releases.
+
+import argparse
+import json
+
+from mastodon import Mastodon, StreamListener
+from mastodon.types_base import Entity
+from mastodon.return_types import Filter
+from benchmarks._util import bench, write_results
+from benchmarks._cassettes import cassette_api, response_body
+
+TAG = "fgiztsshwiaqqiztpmmjbtvmescsculuvmgjgopwoeidbcrixp"
+
+FILTERS = [
+    {"id": "1", "phrase": "cat", "context": ["home", "public"], "whole_word": True, "irreversible": False, "expires_at": None},
+    {"id": "2", "phrase": "gura", "context": ["home"], "whole_word": False, "irreversible": False, "expires_at": None},
+    {"id": "3", "phrase": "unrelated", "context": ["notifications"], "whole_word": True, "irreversible": False, "expires_at": None},
+]
+
+class UpdateListener(StreamListener):
+    def __init__(self):
+        self.count = 0
+
+    def on_update(self, status):
+        self.count += 1
+
+class FakeResponse():
+    def __init__(self, data):
+        self.data = data
+
+    def iter_content(self, chunk_size=1):
+        yield self.data
+
+def run(repeat=3):
+    api = cassette_api("test_home_tl", "test_notifications", "test_grouped_notifications", "test_pagination_iterator")
+    results = []
+
+    # Casting of whole API responses
+    timeline = api.timeline_home()
+    results.append(bench("timeline_home (page casting)", api.timeline_home, number=repeat, items=len(timeline), allocations=True))
+    api.entity_interning = "response"
+    results.append(bench("timeline_home (page casting, interning)", api.timeline_home, number=repeat, items=len(timeline), allocations=True))
+    api.entity_interning = None
+    notifications = api.notifications()
+    results.append(bench("notifications (page casting)", api.notifications, number=repeat, items=len(notifications), allocations=True))
+    grouped = api.grouped_notifications(limit=10, expand_accounts="partial_avatars")
+    results.append(bench("grouped_notifications (GroupedNotificationsResults)",
+                         lambda: api.grouped_notifications(limit=10, expand_accounts="partial_avatars"),
+                         number=repeat, items=len(grouped.notification_groups), allocations=True))
+
+    # Serialization
+    timeline_json = timeline.to_json()
+    results.append(bench("Entity.to_json (timeline page)", timeline.to_json, number=repeat, items=len(timeline), allocations=True))
+    results.append(bench("Entity.from_json (timeline page)", lambda: Entity.from_json(timeline_json), number=repeat, items=len(timeline), allocations=True))
+
+    # Helpers that work on already fetched data
+    filters = [Filter(**keyword_filter) for keyword_filter in FILTERS]
+    statuses = list(timeline) * 10
+    results.append(bench("filters_apply (home context)", lambda: api.filters_apply(statuses, filters, "home"), number=repeat * 5, items=len(statuses)))
+    results.append(bench("deduplicate_entities (timeline page, 10 times)", lambda: Mastodon.deduplicate_entities(statuses),
+                         number=repeat * 5, items=len(statuses)))
+    timeline_dicts = json.loads(response_body("test_home_tl", "GET", "/api/v1/timelines/home"))
+    results.append(bench("Entity == dict (timeline page, other ids)", lambda: [status == timeline_dicts[0] for status in timeline[1:]],
+                         number=repeat, items=len(timeline) - 1))
+    texts = [(status.content, status.spoiler_text) for status in statuses]
+    results.append(bench("get_status_length", lambda: [Mastodon.get_status_length(text, spoiler_text) for text, spoiler_text in texts],
+                         number=repeat * 5, items=len(texts)))
+
+    # Streaming: parsing the recorded SSE stream, once without and once with decoding the events
+    stream_data = response_body("test_stream_user_local", "GET", "/api/v1/streaming/user")
+    stream_repeats = 100
+    update_count = stream_data.count(b"event: update")
+    stream = FakeResponse(stream_data * stream_repeats)
+    results.append(bench("handle_stream (SSE parsing, no handlers)", lambda: StreamListener().handle_stream(stream),
+                         number=repeat * 5, items=update_count * stream_repeats))
+    single_stream = FakeResponse(stream_data)
+    results.append(bench("handle_stream (SSE parsing, on_update)", lambda: UpdateListener().handle_stream(single_stream),
+                         number=repeat, items=update_count))
+
+    # Pagination helpers, following a recorded hashtag timeline to the end
+    first_page = api.timeline_hashtag(TAG, limit=10)
+    results.append(bench("get_pagination_info", lambda: [api.get_pagination_info(first_page, "next") for _ in range(1000)],
+                         number=repeat * 5, items=1000))
+    results.append(bench("fetch_remaining (hashtag timeline)", lambda: api.fetch_remaining(first_page), number=repeat,
+                         items=len(api.fetch_remaining(first_page)), allocations=True))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark API call hot paths against recorded cassettes.")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    parser.add_argument("--repeat", type=int, default=3, help="how often to repeat each (slow) benchmark, best run counts")
+    args = parser.parse_args()
+    results = run(args.repeat)
+    if args.json is not None:
+        write_results(args.json, results)
@@ -0,0 +1,34 @@
+# bench_blurhash.py - batch (numpy) vs. one-by-one blurhash decoding, numpy blurhash encoding
+#
+# Run from the repository root: python -m benchmarks.bench_blurhash
+
+from mastodon import Mastodon
+from mastodon.compat import numpy, blurhash
+from benchmarks._util import bench
+
+BLURHASHES = [
+    '=~NdOWof1PbIPUXSvgbI$f',
+    'LEHV6nWB2yk8pyo0adR*.7kCMdnj',
+    'LGF5]+Yk^6#M@-5c,1J5@[or[Q6.',
+    'L6PZfSi_.AyE_3t7t7R**0o#DgR4',
+]
+
+def run(count=200):
+    api = Mastodon(api_base_url="http://localhost", version_check_mode="none")
+    media_dicts = [{"blurhash": BLURHASHES[i % len(BLURHASHES)]} for i in range(count)]
+
+    results = []
+    results.append(bench("decode_blurhash (one by one)", lambda: [api.decode_blurhash(x) for x in media_dicts], number=3, items=count))
+    results.append(bench("decode_blurhash_batch", lambda: api.decode_blurhash_batch(media_dicts), number=3, items=count))
+    results.append(bench("decode_blurhash_batch (absolute size, stacked)", 
+                         lambda: api.decode_blurhash_batch(media_dicts, out_size=(32, 32), size_per_component=False, stack=True), number=3, items=count))
+
+    image = numpy.random.default_rng(0).integers(0, 256, (240, 320, 3))
+    image_list = image.tolist()
+    results.append(bench("blurhash.encode (reference, 320x240)", lambda: blurhash.encode(image_list, 4, 3), number=1, items=1))
+    results.append(bench("encode_blurhash (full size, 320x240)", lambda: api.encode_blurhash(image, (4, 3), max_size=None), number=3, items=1))
+    results.append(bench("encode_blurhash (downscaled, 320x240)", lambda: api.encode_blurhash(image, (4, 3)), number=3, items=1))
+    return results
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,58 @@
+# bench_memory.py - memory used per entity, for entities cast from recorded API responses
+#
+# Run from the repository root: python -m benchmarks.bench_memory [--json results.json]
+
+import argparse
+import gc
+import json
+import tracemalloc
+
+from mastodon.return_types import Status, Account, Notification
+from mastodon.types_base import try_cast_recurse
+from benchmarks._util import write_results
+from benchmarks._cassettes import response_body
+
+def measure(name, make, count):
+    """
+    Make `count` objects and print the memory they hold on to per object. Returns a dict with the results.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [make(i) for i in range(count)]
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    result = {
+        "name": name,
+        "bytes_per_item": (after - before) / len(objects),
+    }
+    print(f"{name:<50} {result['bytes_per_item']:12.0f} bytes/item")
+    return result
+
+def run(count=50):
+    statuses = json.loads(response_body("test_home_tl", "GET", "/api/v1/timelines/home"))
+    notifications = json.loads(response_body("test_notifications", "GET", "/api/v1/notifications"))
+
+    # Every object gets a fresh copy of its data, as if it came from its own response
+    def fresh(data):
+        return json.loads(json.dumps(data))
+
+    results = []
+    results.append(measure("dict (parsed JSON, status)", lambda i: fresh(statuses[i % len(statuses)]), count))
+    results.append(measure("Status", lambda i: try_cast_recurse(Status, fresh(statuses[i % len(statuses)])), count))
+    results.append(measure("dict (parsed JSON, account)", lambda i: fresh(statuses[i % len(statuses)]["account"]), count))
+    results.append(measure("Account", lambda i: try_cast_recurse(Account, fresh(statuses[i % len(statuses)]["account"])), count))
+    results.append(measure("Notification", lambda i: try_cast_recurse(Notification, fresh(notifications[i % len(notifications)])), count))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure memory used per entity.")
+    parser.add_argument("--json", metavar="PATH", help="also write the results to PATH as JSON")
+    parser.add_argument("--count", type=int, default=50, help="how many objects of every kind to create")
+    args = parser.parse_args()
+    results = run(args.count)
+    if args.json is not None:
+        write_results(args.json, results)
@@ -0,0 +1,75 @@
+# bench_streaming.py - stream event parsing and dispatch throughput
+#
+# Run from the repository root: python -m benchmarks.bench_streaming
+
+import io
+import json
+
+from mastodon.streaming import StreamListener, CallbackStreamListener
+from mastodon.stream_recording import RecordingStreamListener, StreamReplay
+from benchmarks._util import bench
+
+STATUS = {
+    "id": "110000000000000000",
+    "created_at": "2025-01-01T00:00:00.000Z",
+    "content": "<p>Hello, world</p>",
+    "visibility": "public",
+    "account": {"id": "1", "username": "test", "acct": "test", "created_at": "2025-01-01T00:00:00.000Z"},
+    "media_attachments": [],
+    "mentions": [],
+    "tags": [],
+    "emojis": [],
+}
+
+class CountingListener(StreamListener):
+    def __init__(self):
+        self.count = 0
+
+    def on_update(self, status):
+        self.count += 1
+
+    def on_delete(self, status_id):
+        self.count += 1
+
+class FakeResponse():
+    def __init__(self, data):
+        self.data = data
+
+    def iter_content(self, chunk_size=1):
+        yield self.data
+
+def make_recording(count):
+    """
+    Record a stream of deletes with a heartbeat every 10 events, in memory.
+    """
+    recording = io.StringIO()
+    recorder = RecordingStreamListener(StreamListener(), recording)
+    data = "".join(
+        (":thump\n" if i % 10 == 0 else "") + f"event: delete\ndata: {110000000000000000 + i}\n\n" for i in range(count)
+    )
+    recorder.handle_stream(FakeResponse(data.encode("utf-8")))
+    recorder.close()
+    recording.seek(0)
+    return StreamReplay(recording, speed=None)
+
+def run(count=5000, cast_count=50):
+    update_event = {"event": "update", "data": json.dumps(STATUS)}
+    delete_event = {"event": "delete", "data": "110000000000000000"}
+    deletes = [delete_event] * count
+    updates = [update_event] * cast_count
+
+    results = []
+    listener = CountingListener()
+    results.append(bench("_dispatch_parsed (update, pre-parsed)", lambda: [listener._dispatch_parsed("update", STATUS) for _ in range(count)], number=5, items=count))
+    results.append(bench("_dispatch (delete)", lambda: [listener._dispatch(event) for event in deletes], number=5, items=count))
+    results.append(bench("_dispatch (update, with casting)", lambda: [listener._dispatch(event) for event in updates], number=3, items=cast_count))
+
+    deletes_only = CallbackStreamListener(delete_handler=lambda status_id: None)
+    results.append(bench("_dispatch (update, delete-only callback listener)", lambda: [deletes_only._dispatch(event) for event in updates * 100], number=5, items=cast_count * 100))
+
+    replay = make_recording(count)
+    results.append(bench("handle_stream (replayed recording, delete)", lambda: replay.replay(CountingListener()), number=3, items=count))
+    return results
+
+if __name__ == "__main__":
+    run()
@@ -1,6 +1,10 @@
 from mastodon.Mastodon import Mastodon, MastodonError, MastodonVersionError, MastodonIllegalArgumentError, MastodonIOError, MastodonFileNotFoundError, MastodonNetworkError, MastodonAPIError, MastodonNotFoundError, MastodonUnauthorizedError, MastodonRatelimitError, MastodonMalformedEventError, MastodonServerError, MastodonInternalServerError, MastodonBadGatewayError, MastodonServiceUnavailableError, MastodonGatewayTimeoutError
-from mastodon.streaming import StreamListener, CallbackStreamListener
+from mastodon.streaming import StreamListener, CallbackStreamListener, QueuedStreamListener, BatchingStreamListener, MultiplexedStream
+from mastodon.streaming_hub import StreamHub
+from mastodon.stream_recording import RecordingStreamListener, StreamReplay
+from mastodon.instrumentation import RequestObserver, RequestMetricsCollector, LoggingRequestObserver
+from mastodon.timeline_sync import TimelineSync, TimelineStore, SQLiteTimelineStore
 from mastodon.types_base import AttribAccessDict
 
-__all__ = ['Mastodon', 'AttribAccessDict', 'StreamListener', 'CallbackStreamListener', 'MastodonError', 'MastodonVersionError', 'MastodonIllegalArgumentError', 'MastodonIOError', 'MastodonFileNotFoundError', 'MastodonNetworkError', 'MastodonAPIError', 'MastodonNotFoundError', 'MastodonUnauthorizedError', 'MastodonRatelimitError', 'MastodonMalformedEventError',
+__all__ = ['Mastodon', 'AttribAccessDict', 'StreamListener', 'CallbackStreamListener', 'QueuedStreamListener', 'BatchingStreamListener', 'MultiplexedStream', 'StreamHub', 'RecordingStreamListener', 'StreamReplay', 'RequestObserver', 'RequestMetricsCollector', 'LoggingRequestObserver', 'TimelineSync', 'TimelineStore', 'SQLiteTimelineStore', 'MastodonError', 'MastodonVersionError', 'MastodonIllegalArgumentError', 'MastodonIOError', 'MastodonFileNotFoundError', 'MastodonNetworkError', 'MastodonAPIError', 'MastodonNotFoundError', 'MastodonUnauthorizedError', 'MastodonRatelimitError', 'MastodonMalformedEventError',
 'MastodonServerError', 'MastodonInternalServerError', 'MastodonBadGatewayError', 'MastodonServiceUnavailableError', 'MastodonGatewayTimeoutError']
@@ -0,0 +1,151 @@
+# _blurhash.py - vectorized blurhash helpers, numpy based
+
+import functools
+
+from mastodon.compat import numpy
+
+# Alphabet for base 83, as used by blurhash
+_BASE83_ALPHABET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+_BASE83_VALUES = {char: value for value, char in enumerate(_BASE83_ALPHABET)}
+
+def _base83_decode(base83_str):
+    value = 0
+    for base83_char in base83_str:
+        value = value * 83 + _BASE83_VALUES[base83_char]
+    return value
+
+def _srgb_to_linear(values):
+    """sRGB 0-255 to linear 0.0-1.0, elementwise"""
+    values = numpy.asarray(values, dtype=numpy.float64) / 255.0
+    return numpy.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+def _linear_to_srgb(values):
+    """Linear 0.0-1.0 to sRGB 0-255 (as uint8), elementwise, rounding like the reference implementation"""
+    values = numpy.clip(values, 0.0, 1.0)
+    srgb = numpy.where(values <= 0.0031308, values * 12.92, 1.055 * values ** (1.0 / 2.4) - 0.055)
+    return numpy.floor(srgb * 255.0 + 0.5).astype(numpy.uint8)
+
+@functools.lru_cache(maxsize=64)
+def _cosine_basis(components, size):
+    """
+    DCT basis for one axis, shape (components, size). Cached, since for a given page of media,
+    there are only ever a handful of distinct (components, size) combinations.
+    """
+    basis = numpy.cos(numpy.pi * numpy.outer(numpy.arange(components), numpy.arange(size)) / size)
+    basis.flags.writeable = False
+    return basis
+
+def components(blurhash):
+    """
+    Number of x and y components in the given blurhash.
+    """
+    if len(blurhash) < 6:
+        raise ValueError("BlurHash must be at least 6 characters long.")
+    size_info = _base83_decode(blurhash[0])
+    return size_info % 9 + 1, size_info // 9 + 1
+
+def _decode_colours(blurhash, punch=1.0):
+    """
+    Decode the component colours of a blurhash, returns (components_x, components_y, colours),
+    where colours is a (components_y, components_x, 3) array of linear RGB values.
+    """
+    if len(blurhash) < 6:
+        raise ValueError("BlurHash must be at least 6 characters long.")
+    size_info = _base83_decode(blurhash[0])
+    components_y = size_info // 9 + 1
+    components_x = size_info % 9 + 1
+    if len(blurhash) != 4 + 2 * components_x * components_y:
+        raise ValueError("Invalid BlurHash length.")
+    real_max_value = (float(_base83_decode(blurhash[1]) + 1) / 166.0) * punch
+
+    dc_value = _base83_decode(blurhash[2:6])
+    colours = numpy.empty((components_x * components_y, 3), dtype=numpy.float64)
+    colours[0] = _srgb_to_linear([dc_value >> 16, (dc_value >> 8) & 255, dc_value & 255])
+
+    if components_x * components_y > 1:
+        ac_values = numpy.array([_base83_decode(blurhash[4 + i * 2:6 + i * 2]) for i in range(1, components_x * components_y)])
+        quantized = numpy.stack([ac_values // (19 * 19), (ac_values // 19) % 19, ac_values % 19], axis=-1)
+        normalized = (quantized.astype(numpy.float64) - 9.0) / 9.0
+        colours[1:] = numpy.copysign(normalized ** 2, normalized) * real_max_value
+    return components_x, components_y, colours.reshape(components_y, components_x, 3)
+
+def decode(blurhash, width, height, linear=False):
+    """
+    Decode a blurhash to a (height, width, 3) array. Linear float RGB if `linear`
+    is set, 8 bit sRGB otherwise.
+    """
+    components_x, components_y, colours = _decode_colours(blurhash)
+    pixels = numpy.einsum("jy,ix,jic->yxc", _cosine_basis(components_y, height), _cosine_basis(components_x, width), colours)
+    if linear:
+        return pixels
+    return _linear_to_srgb(pixels)
+
+def _base83_encode(value, length):
+    if value // (83 ** length) != 0:
+        raise ValueError("Specified length is too short to encode given value.")
+    return "".join(_BASE83_ALPHABET[(value // (83 ** (length - i))) % 83] for i in range(1, length + 1))
+
+def _downscale(image, max_size):
+    """
+    Area-average downscale of a (height, width, 3) array so that neither side exceeds `max_size`.
+    """
+    height, width = image.shape[0], image.shape[1]
+    scale = max(height, width) / float(max_size)
+    if scale <= 1.0:
+        return image
+    target_height = max(1, int(round(height / scale)))
+    target_width = max(1, int(round(width / scale)))
+    row_starts = (numpy.arange(target_height) * height) // target_height
+    col_starts = (numpy.arange(target_width) * width) // target_width
+    row_counts = numpy.diff(numpy.append(row_starts, height))
+    col_counts = numpy.diff(numpy.append(col_starts, width))
+    summed = numpy.add.reduceat(numpy.add.reduceat(image, row_starts, axis=0), col_starts, axis=1)
+    return summed / (row_counts[:, None, None] * col_counts[None, :, None])
+
+def encode(image, components_x=4, components_y=4, linear=False, max_size=None):
+    """
+    Calculate the blurhash for a (height, width, 3) array, which is either 0-255 sRGB or, if `linear`
+    is set, linear 0.0-1.0 RGB. If `max_size` is given, the image is first downscaled (in linear colour)
+    so that neither side is larger than that, which is much faster and changes the result very little.
+    """
+    if components_x < 1 or components_x > 9 or components_y < 1 or components_y > 9:
+        raise ValueError("x and y component counts must be between 1 and 9 inclusive.")
+    image = numpy.asarray(image)
+    if image.ndim != 3 or image.shape[2] < 3:
+        raise ValueError("Image must be an array of shape (height, width, 3).")
+    image = image[:, :, :3]
+    if linear:
+        image_linear = image.astype(numpy.float64)
+    else:
+        image_linear = _srgb_to_linear(image)
+    if max_size is not None:
+        image_linear = _downscale(image_linear, max_size)
+    height, width = image_linear.shape[0], image_linear.shape[1]
+
+    # Calculate components
+    factors = numpy.einsum("jy,ix,yxc->jic", _cosine_basis(components_y, height), _cosine_basis(components_x, width), image_linear)
+    factors /= width * height
+    factors[1:, :, :] *= 2.0
+    factors[0, 1:, :] *= 2.0
+    factors = factors.reshape(components_x * components_y, 3)
+
+    # Encode components
+    dc_srgb = _linear_to_srgb(factors[0]).astype(int)
+    dc_value = (int(dc_srgb[0]) << 16) + (int(dc_srgb[1]) << 8) + int(dc_srgb[2])
+    if len(factors) > 1:
+        max_ac_component = float(numpy.max(numpy.abs(factors[1:])))
+    else:
+        max_ac_component = 0.0
+    quant_max_ac_component = int(max(0, min(82, numpy.floor(max_ac_component * 166 - 0.5))))
+    ac_component_norm_factor = float(quant_max_ac_component + 1) / 166.0
+    ac_normalized = factors[1:] / ac_component_norm_factor
+    ac_quantized = numpy.clip(numpy.floor(numpy.copysign(numpy.abs(ac_normalized) ** 0.5, ac_normalized) * 9.0 + 9.5), 0, 18).astype(int)
+    ac_values = ac_quantized[:, 0] * 19 * 19 + ac_quantized[:, 1] * 19 + ac_quantized[:, 2]
+
+    # Build final blurhash
+    blurhash = _base83_encode((components_x - 1) + (components_y - 1) * 9, 1)
+    blurhash += _base83_encode(quant_max_ac_component, 1)
+    blurhash += _base83_encode(dc_value, 4)
+    for ac_value in ac_values:
+        blurhash += _base83_encode(int(ac_value), 2)
+    return blurhash
@@ -137,14 +137,19 @@ class Mastodon(Internals):
         return self.__api_request('GET', f'/api/v1/accounts/{id}')
 
     @api_version("4.3.0", "4.3.0")
-    def accounts(self, ids: List[Union[Account, IdType]]) -> List[Account]:
+    def accounts(self, ids: List[Union[Account, IdType]]) -> NonPaginatableList[Account]:
         """
         Fetch information from multiple accounts by a list of user `id`.
 
+        The list can be arbitrarily long: Duplicate ids are removed, and the ids are
+        requested in chunks of as many as the server accepts at once, in parallel. The
+        accounts are returned in the order of `ids`. Ids that the server did not return
+        an account for (e.g. because it does not exist) are listed in the returned lists
+        `_missing_ids` attribute.
+
         Does not require authentication for publicly visible accounts.
         """
-        ids = [self.__unpack_id(id, dateconv=True) for id in ids]
-        return self.__api_request('GET', '/api/v1/accounts', {"id[]": ids})
+        return self.__api_request_chunked('GET', '/api/v1/accounts', ids, NonPaginatableList[Account])
 
     @api_version("1.0.0", "2.1.0")
     def account_verify_credentials(self) -> Account:
@@ -233,8 +238,15 @@ class Mastodon(Internals):
         Fetch relationship (following, followed_by, blocking, follow requested) of
         the logged in user to a given account. `id` can be a list.
 
+        Lists of ids are handled as in :ref:`accounts() <accounts()>`: They can be arbitrarily
+        long, are de-duplicated and fetched in parallel chunks, and the result is in the order
+        of `id`, with ids the server returned nothing for in `_missing_ids`.
+
         Pass `with_suspended = True` to include relationships with suspended accounts.
         """
+        if isinstance(id, list):
+            params = self.__generate_params(locals(), ['id'])
+            return self.__api_request_chunked('GET', '/api/v1/accounts/relationships', id, NonPaginatableList[Relationship], params)
         id = self.__unpack_id(id)
         params = self.__generate_params(locals())
         return self.__api_request('GET', '/api/v1/accounts/relationships',
@@ -282,9 +294,13 @@ class Mastodon(Internals):
         """
         Find followers for the account given by id (can be a list) that also follow the
         logged in account.
+
+        Lists of ids are handled as in :ref:`accounts() <accounts()>`.
         """
-        id = self.__unpack_id(id, listify = True)
-        return self.__api_request('GET', '/api/v1/accounts/familiar_followers', {'id': id}, use_json=True)
+        if not isinstance(id, list):
+            id = [id]
+        return self.__api_request_chunked('GET', '/api/v1/accounts/familiar_followers', id, NonPaginatableList[FamiliarFollowers],
+                                          id_param='id', use_json=True)
 
     ###
     # Writing data: Accounts
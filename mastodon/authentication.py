@@ -6,6 +6,8 @@ import datetime
 import os
 import time
 import collections
+import threading
+import weakref
 
 from mastodon.errors import MastodonIllegalArgumentError, MastodonNetworkError, MastodonVersionError, MastodonAPIError, MastodonNotFoundError
 from mastodon.defaults import _DEFAULT_SCOPES, _SCOPE_SETS, _DEFAULT_TIMEOUT, _DEFAULT_USER_AGENT
@@ -94,7 +96,8 @@ class Mastodon(Internals):
                  access_token: Optional[Union[str, PurePath]] = None, api_base_url: Optional[str] = None, debug_requests: bool = False,
                  ratelimit_method: str = "wait", ratelimit_pacefactor: float = 1.1, request_timeout: float = _DEFAULT_TIMEOUT, 
                  mastodon_version: Optional[str] = None, version_check_mode: str = "none", session: Optional[requests.Session] = None, 
-                 feature_set: str = "mainline", user_agent: str = _DEFAULT_USER_AGENT, lang: Optional[str] = None):
+                 feature_set: str = "mainline", user_agent: str = _DEFAULT_USER_AGENT, lang: Optional[str] = None,
+                 request_timing: bool = False, entity_interning: Optional[str] = None):
         """
         Create a new API wrapper instance based on the given `client_secret` and `client_id` on the
         instance given by `api_base_url`. If you give a `client_id` and it is not a file, you must
@@ -146,6 +149,20 @@ class Mastodon(Internals):
         version checking is disabled. When encountering problems, I would recommend setting this to "created"
         and/or setting `debug_requests` to True to get a better idea of what is going on.
 
+        If `request_timing` is set to True, results of API calls get a `_timing` attribute (if they can hold one,
+        i.e. for entities and lists) that breaks down where the time for the call went, in seconds: `ratelimit_wait`
+        (sleeping for the rate limit), `ttfb` (sending the request until the response headers arrived), `download`
+        (receiving the response body), `json_parse`, `cast` (turning the response into return types), `link_parse`
+        (pagination headers) and `total`. The same record is available to request observers as `call.timing`,
+        see :ref:`add_request_observer() <add_request_observer()>`.
+
+        `entity_interning` makes casting share identical accounts, custom emoji and tags instead of creating
+        a separate object for every occurrence, which saves time and memory on large pages with the same
+        accounts appearing many times (e.g. as authors of several statuses). Set it to "response" to share them
+        within every API response, or to "client" to share them across all responses of this instance for
+        as long as they are still referenced somewhere. Note that shared objects are the same object
+        everywhere, so modifying one modifies all of its occurrences. The default, None, disables interning.
+
         If no other `User-Agent` is specified, "mastodonpy" will be used.
         """
         self.api_base_url = api_base_url
@@ -166,8 +183,18 @@ class Mastodon(Internals):
         self.ratelimit_remaining = 300
         self.ratelimit_lastcall = time.time()
         self.ratelimit_pacefactor = ratelimit_pacefactor
+        self.__ratelimit_lock = threading.Lock()
 
         self.request_timeout = request_timeout
+        self.request_timing = request_timing
+
+        self.entity_interning = entity_interning
+        if not self.entity_interning in [None, "response", "client"]:
+            raise MastodonIllegalArgumentError('Invalid entity interning mode')
+        self.__entity_intern_table = weakref.WeakValueDictionary()
+
+        # Request observers (see add_request_observer())
+        self.__request_observers = []
 
         if session:
             self.session = session
@@ -27,6 +27,20 @@ except:
     IMPL_HAS_BLURHASH = False
     blurhash = None
 
+IMPL_HAS_NUMPY = True
+try:
+    import numpy
+except:
+    IMPL_HAS_NUMPY = False
+    numpy = None
+
+IMPL_HAS_WEBSOCKET = True
+try:
+    import websocket
+except:
+    IMPL_HAS_WEBSOCKET = False
+    websocket = None
+
 try:
     from urllib.parse import urlparse
 except ImportError:
@@ -3,6 +3,10 @@
 _DEFAULT_TIMEOUT = 300
 _DEFAULT_STREAM_TIMEOUT = 300
 _DEFAULT_STREAM_RECONNECT_WAIT_SEC = 5
+_DEFAULT_STREAM_MAX_RECONNECT_WAIT_SEC = 300
+_DEFAULT_BULK_CHUNK_SIZE = 40
+_DEFAULT_BULK_MAX_WORKERS = 4
+_MAX_TIMELINE_PAGE_SIZE = 40
 _DEFAULT_USER_AGENT = "mastodonpy"
 _DEFAULT_SCOPES = ['read', 'write', 'follow', 'push']
 _SCOPE_SETS = {
@@ -0,0 +1,250 @@
+# instrumentation.py - request hooks and metrics
+
+import collections
+import logging
+import math
+import re
+import threading
+
+from mastodon.types_base import AttribAccessDict
+
+from typing import Optional, Dict
+
+# Path segments that are ids, which would otherwise make every request its own endpoint
+_ID_SEGMENT_RE = re.compile(r"^[0-9]+$")
+
+# Non-numeric ids (Pleroma / Akkoma flake ids, GoToSocial ULIDs, grouped notification keys) can't be told
+# apart from action names on their own, so they are only recognized right after a collection that is
+# followed by ids. Action names never contain digits, ids practically always do.
+_ALNUM_ID_SEGMENT_RE = re.compile(r"^(?=.*[0-9])[0-9A-Za-z-]+$")
+_ID_COLLECTIONS = frozenset((
+    "accounts", "statuses", "notifications", "lists", "media", "polls", "scheduled_statuses", "filters",
+    "keywords", "conversations", "reports", "announcements", "follow_requests", "featured_tags",
+    "suggestions", "domain_blocks", "domain_allows", "canonical_email_blocks", "email_domain_blocks",
+    "ip_blocks",
+))
+
+def _endpoint_key(method, endpoint):
+    """
+    Normalize a request to a low-cardinality key like "GET /api/v1/statuses/:id", so that
+    metrics can be grouped by endpoint.
+    """
+    path = endpoint.split("?", 1)[0]
+    segments = path.split("/")
+    for index, segment in enumerate(segments):
+        if _ID_SEGMENT_RE.match(segment):
+            segments[index] = ":id"
+        elif index > 0 and segments[index - 1] in _ID_COLLECTIONS and _ALNUM_ID_SEGMENT_RE.match(segment):
+            segments[index] = ":id"
+        elif index > 0 and segments[index - 1] in ("tag", "tags") and segment != "":
+            # Hashtag names, e.g. /api/v1/timelines/tag/cats
+            segments[index] = ":name"
+    return f"{method} {'/'.join(segments)}"
+
+class RequestObserver(object):
+    """
+    Hooks into every API request Mastodon.py makes. Create a subclass, override the on_xxx methods you are
+    interested in, and add an instance with :ref:`add_request_observer() <add_request_observer()>`.
+
+    All hooks receive `call`, an :class:`AttribAccessDict` describing the request, which is the same object
+    for all hooks of one API call and gets filled in as the call progresses: `method`, `endpoint` (the path
+    as requested), `endpoint_key` (the path with ids replaced, e.g. "GET /api/v1/statuses/:id"), `url`,
+    `attempt` (starting at 1, higher when retried after hitting the rate limit), `status_code`, `latency`
+    (seconds from sending the request to having the full response), `bytes_sent`, `bytes_received`,
+    `ratelimit_wait` (total seconds slept for rate limiting), `cast_time` (seconds spent turning the
+    response into return types) and `timing`, a per-phase breakdown of where the time went (see the
+    `request_timing` parameter of the constructor). Fields that are not known yet are None. Headers and parameters are not
+    included, so access tokens and passwords can't leak into logs or metrics.
+
+    Hooks are called on the thread making the request, and exceptions raised in them are not caught.
+    """
+    def on_request(self, call: AttribAccessDict):
+        """A request is about to be sent (called again for every retry)."""
+        pass
+
+    def on_response(self, call: AttribAccessDict):
+        """A response (of any status code) has been received."""
+        pass
+
+    def on_cast(self, call: AttribAccessDict):
+        """The response has been parsed and cast to the return type. `cast_time` is now set."""
+        pass
+
+    def on_complete(self, call: AttribAccessDict):
+        """The call has finished successfully, and `timing` is complete."""
+        pass
+
+    def on_ratelimit_wait(self, call: AttribAccessDict, seconds: float, reason: str):
+        """Mastodon.py is about to sleep for `seconds` because of the rate limit. `reason` is "pace" when
+        pacing requests in "pace" mode, and "limit" when waiting for the rate limit to reset."""
+        pass
+
+    def on_error(self, call: AttribAccessDict, exception: Exception):
+        """The call is about to raise `exception`, e.g. because of a network problem or an error response."""
+        pass
+
+class RequestMetricsCollector(RequestObserver):
+    """
+    :class:`RequestObserver` that keeps statistics about requests in memory, grouped by endpoint: Counts of
+    requests, status codes, errors and retries, bytes transferred, time spent waiting for the rate limit and
+    casting responses, and latency percentiles (over the most recent `max_samples` requests per endpoint).
+
+    Use `metrics()` to read them, `to_prometheus()` to get them in the Prometheus text format, and `reset()` to
+    start over.
+    """
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.__lock = threading.Lock()
+        self.__endpoints = {}
+
+    def __endpoint(self, call):
+        endpoint = self.__endpoints.get(call.endpoint_key)
+        if endpoint is None:
+            endpoint = self.__endpoints[call.endpoint_key] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "status_codes": collections.Counter(),
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "ratelimit_waits": 0,
+                "ratelimit_wait_time": 0.0,
+                "cast_time": 0.0,
+                "latency_total": 0.0,
+                "latency_max": 0.0,
+                "latency_samples": collections.deque(maxlen=self.max_samples),
+            }
+        return endpoint
+
+    def on_response(self, call):
+        with self.__lock:
+            endpoint = self.__endpoint(call)
+            endpoint["requests"] += 1
+            if call.attempt > 1:
+                endpoint["retries"] += 1
+            endpoint["status_codes"][call.status_code] += 1
+            endpoint["bytes_sent"] += call.bytes_sent or 0
+            endpoint["bytes_received"] += call.bytes_received or 0
+            endpoint["latency_total"] += call.latency
+            endpoint["latency_max"] = max(endpoint["latency_max"], call.latency)
+            endpoint["latency_samples"].append(call.latency)
+
+    def on_cast(self, call):
+        with self.__lock:
+            self.__endpoint(call)["cast_time"] += call.cast_time
+
+    def on_ratelimit_wait(self, call, seconds, reason):
+        with self.__lock:
+            endpoint = self.__endpoint(call)
+            endpoint["ratelimit_waits"] += 1
+            endpoint["ratelimit_wait_time"] += seconds
+
+    def on_error(self, call, exception):
+        with self.__lock:
+            self.__endpoint(call)["errors"] += 1
+
+    @staticmethod
+    def __percentile(sorted_samples, fraction):
+        if len(sorted_samples) == 0:
+            return None
+        # Nearest rank
+        index = min(len(sorted_samples) - 1, max(0, math.ceil(fraction * len(sorted_samples)) - 1))
+        return sorted_samples[index]
+
+    def metrics(self) -> Dict[str, AttribAccessDict]:
+        """
+        Returns the statistics for every endpoint, keyed by endpoint (e.g. "GET /api/v1/statuses/:id"):
+        `requests`, `errors`, `retries`, `status_codes` (a dict of status code -> count), `bytes_sent`,
+        `bytes_received`, `ratelimit_waits`, `ratelimit_wait_time`, `cast_time`, and latency statistics in
+        seconds: `latency_avg`, `latency_max`, `latency_p50`, `latency_p90` and `latency_p99`.
+        """
+        result = {}
+        with self.__lock:
+            for key, endpoint in self.__endpoints.items():
+                samples = sorted(endpoint["latency_samples"])
+                endpoint_metrics = AttribAccessDict(
+                    requests=endpoint["requests"],
+                    errors=endpoint["errors"],
+                    retries=endpoint["retries"],
+                    status_codes=dict(endpoint["status_codes"]),
+                    bytes_sent=endpoint["bytes_sent"],
+                    bytes_received=endpoint["bytes_received"],
+                    ratelimit_waits=endpoint["ratelimit_waits"],
+                    ratelimit_wait_time=endpoint["ratelimit_wait_time"],
+                    cast_time=endpoint["cast_time"],
+                    latency_avg=endpoint["latency_total"] / endpoint["requests"] if endpoint["requests"] > 0 else None,
+                    latency_max=endpoint["latency_max"],
+                    latency_p50=self.__percentile(samples, 0.5),
+                    latency_p90=self.__percentile(samples, 0.9),
+                    latency_p99=self.__percentile(samples, 0.99),
+                )
+                result[key] = endpoint_metrics
+        return result
+
+    def reset(self):
+        """
+        Forget all statistics collected so far.
+        """
+        with self.__lock:
+            self.__endpoints = {}
+
+    def to_prometheus(self, prefix: str = "mastodonpy") -> str:
+        """
+        Returns the statistics in the Prometheus text exposition format, e.g. for serving from a
+        `/metrics` endpoint. Latencies are exported as a summary with 0.5, 0.9 and 0.99 quantiles.
+        """
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+        def labels(key, **extra):
+            method, _, endpoint = key.partition(" ")
+            label_values = [("method", method), ("endpoint", endpoint)] + list(extra.items())
+            return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in label_values) + "}"
+
+        metrics = self.metrics()
+        lines = []
+        def add(name, metric_type, help_text, values):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for label_str, value in values:
+                lines.append(f"{prefix}_{name}{label_str} {value}")
+
+        add("requests_total", "counter", "Responses received, by status code.",
+            [(labels(key, code=code), count) for key, endpoint in metrics.items() for code, count in sorted(endpoint.status_codes.items())])
+        add("request_errors_total", "counter", "API calls that raised an error.", [(labels(key), endpoint.errors) for key, endpoint in metrics.items()])
+        add("request_retries_total", "counter", "Requests retried after hitting the rate limit.", [(labels(key), endpoint.retries) for key, endpoint in metrics.items()])
+        add("request_bytes_sent_total", "counter", "Request body bytes sent.", [(labels(key), endpoint.bytes_sent) for key, endpoint in metrics.items()])
+        add("response_bytes_received_total", "counter", "Response body bytes received.", [(labels(key), endpoint.bytes_received) for key, endpoint in metrics.items()])
+        add("ratelimit_wait_seconds_total", "counter", "Time spent sleeping for rate limiting.", [(labels(key), endpoint.ratelimit_wait_time) for key, endpoint in metrics.items()])
+        add("cast_seconds_total", "counter", "Time spent casting responses to return types.", [(labels(key), endpoint.cast_time) for key, endpoint in metrics.items()])
+        lines.append(f"# HELP {prefix}_request_latency_seconds Request latency.")
+        lines.append(f"# TYPE {prefix}_request_latency_seconds summary")
+        for key, endpoint in metrics.items():
+            for quantile, value in (("0.5", endpoint.latency_p50), ("0.9", endpoint.latency_p90), ("0.99", endpoint.latency_p99)):
+                if value is not None:
+                    lines.append(f"{prefix}_request_latency_seconds{labels(key, quantile=quantile)} {value}")
+            latency_sum = endpoint.latency_avg * endpoint.requests if endpoint.requests > 0 else 0.0
+            lines.append(f"{prefix}_request_latency_seconds_sum{labels(key)} {latency_sum}")
+            lines.append(f"{prefix}_request_latency_seconds_count{labels(key)} {endpoint.requests}")
+        return "\n".join(lines) + "\n"
+
+class LoggingRequestObserver(RequestObserver):
+    """
+    :class:`RequestObserver` that logs one line per response, rate limit wait and error to `logger`
+    (by default, the "mastodon" logger), at `level` (errors and rate limit waits at WARNING, if that is higher).
+    Unlike `debug_requests`, it never logs headers, parameters or response bodies.
+    """
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.DEBUG):
+        self.logger = logger if logger is not None else logging.getLogger("mastodon")
+        self.level = level
+
+    def on_response(self, call):
+        self.logger.log(self.level, "%s %s -> %s in %.1f ms (%s bytes, attempt %d)", call.method, call.endpoint, call.status_code,
+                        call.latency * 1000.0, call.bytes_received, call.attempt)
+
+    def on_ratelimit_wait(self, call, seconds, reason):
+        self.logger.log(max(self.level, logging.WARNING) if reason == "limit" else self.level,
+                        "%s %s: waiting %.2f s for rate limit (%s)", call.method, call.endpoint, seconds, reason)
+
+    def on_error(self, call, exception):
+        self.logger.log(max(self.level, logging.WARNING), "%s %s failed: %r", call.method, call.endpoint, exception)
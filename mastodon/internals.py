@@ -15,16 +15,92 @@ import base64
 import os
 import inspect
 import warnings
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 from mastodon.versions import parse_version_string
-from mastodon.errors import MastodonNetworkError, MastodonIllegalArgumentError, MastodonRatelimitError, MastodonNotFoundError, \
+from mastodon.errors import MastodonError, MastodonNetworkError, MastodonIllegalArgumentError, MastodonRatelimitError, MastodonNotFoundError, \
                     MastodonUnauthorizedError, MastodonInternalServerError, MastodonBadGatewayError, MastodonServiceUnavailableError, \
                     MastodonGatewayTimeoutError, MastodonServerError, MastodonAPIError, MastodonMalformedEventError, MastodonDeprecationWarning, MastodonWarning
 from mastodon.compat import urlparse, magic, PurePath, Path
-from mastodon.defaults import _DEFAULT_STREAM_TIMEOUT, _DEFAULT_STREAM_RECONNECT_WAIT_SEC
+from mastodon.defaults import _DEFAULT_STREAM_TIMEOUT, _DEFAULT_STREAM_RECONNECT_WAIT_SEC, _DEFAULT_BULK_CHUNK_SIZE, _DEFAULT_BULK_MAX_WORKERS
 from mastodon.return_types import AttribAccessDict, PaginatableList, try_cast_recurse
+from mastodon.types_base import entity_interning
+from mastodon.streaming import _BackfillStreamListener, _ActivityTrackingStreamListener, _shutdown_response
+from mastodon.instrumentation import _endpoint_key
 from mastodon.return_types import *
 
+###
+# Media type sniffing
+#
+# Recognizes the formats that Mastodon accepts for uploads by looking at the first couple of bytes only,
+# so that we don't have to load libmagic (or know the type in advance, for data passed in directly).
+###
+_SNIFF_HEADER_LENGTH = 64
+
+_ISOBMFF_BRAND_TYPES = {
+    b"avif": "image/avif",
+    b"avis": "image/avif",
+    b"heic": "image/heic",
+    b"heix": "image/heic",
+    b"heim": "image/heic",
+    b"heis": "image/heic",
+    b"hevc": "image/heic",
+    b"hevx": "image/heic",
+    b"qt  ": "video/quicktime",
+    b"M4A ": "audio/mp4",
+}
+
+def _sniff_mime_type(header):
+    """
+    Guess the mime type of media data from its first bytes. Returns None if the format is not recognized.
+    """
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header.startswith(b"GIF87a") or header.startswith(b"GIF89a"):
+        return "image/gif"
+    if header.startswith(b"RIFF") and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header.startswith(b"RIFF") and header[8:12] == b"WAVE":
+        return "audio/wav"
+    if header[4:8] == b"ftyp":
+        # ISO base media file: Decide by major brand, then by compatible brands
+        box_size = int.from_bytes(header[0:4], "big")
+        brands = [header[8:12]] + [header[i:i + 4] for i in range(16, min(box_size, len(header)) - 3, 4)]
+        for brand in brands:
+            if brand in _ISOBMFF_BRAND_TYPES:
+                return _ISOBMFF_BRAND_TYPES[brand]
+        return "video/mp4"
+    if header[4:8] in (b"moov", b"mdat", b"wide", b"free", b"skip"):
+        return "video/quicktime"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        if b"webm" in header:
+            return "video/webm"
+        return "video/x-matroska"
+    if header.startswith(b"OggS"):
+        if b"theora" in header:
+            return "video/ogg"
+        return "audio/ogg"
+    if header.startswith(b"fLaC"):
+        return "audio/flac"
+    if len(header) > 1 and header[0] == 0xff and header[1] & 0xf6 == 0xf0:
+        # AAC ADTS: Same frame sync as MP3, but the layer bits are always zero
+        return "audio/aac"
+    if header.startswith(b"ID3") or (len(header) > 1 and header[0] == 0xff and header[1] & 0xe0 == 0xe0):
+        return "audio/mpeg"
+    return None
+
+@functools.lru_cache(maxsize=256)
+def _sniff_file_mime_type(path, mtime, size):
+    """
+    Sniff the mime type of a file on disk. Cached by path, modification time and size,
+    so repeatedly uploading the same file does not touch the disk for type detection again.
+    """
+    with open(path, 'rb') as media_file:
+        return _sniff_mime_type(media_file.read(_SNIFF_HEADER_LENGTH))
+
 ###
 # Internal helpers, dragons probably
 # timeline_is_available is exported and can be used, it is here for import circularity reasons
@@ -132,7 +208,11 @@ class Mastodon():
                 return_type = override_type
         except:
             return_type = AttribAccessDict
-        return_val = try_cast_recurse(return_type, value)
+        if self.entity_interning is None:
+            return_val = try_cast_recurse(return_type, value)
+        else:
+            with entity_interning(self.__entity_intern_table if self.entity_interning == "client" else None):
+                return_val = try_cast_recurse(return_type, value)
         return_type_repr = None
         try:
             return_type_repr = return_val._mastopy_type
@@ -140,6 +220,30 @@ class Mastodon():
             pass
         return return_val, return_type_repr
 
+    def __notify_request_observers(self, hook, call, *args):
+        """
+        Call the given hook on all request observers.
+        """
+        for observer in self.__request_observers:
+            getattr(observer, hook)(call, *args)
+
+    def __finish_call(self, call, call_started):
+        """
+        Fill in the remaining timing information for a successful call and tell request observers that it is done.
+        """
+        call.timing.ratelimit_wait = call.ratelimit_wait
+        call.timing.total = time.perf_counter() - call_started
+        self.__notify_request_observers("on_complete", call)
+
+    def __observed_error(self, call, exception):
+        """
+        Tell request observers (if the call is observed) that the call is about to fail with
+        `exception`, then return the exception for raising.
+        """
+        if call is not None:
+            self.__notify_request_observers("on_error", call, exception)
+        return exception
+
     def __api_request(self, method, endpoint, params={}, files={}, headers={}, access_token_override=None, base_url_override=None,
                         do_ratelimiting=True, use_json=False, parse=True, return_response_object=False, skip_error_check=False, lang_override=None, override_type=None,
                         force_pagination=False):
@@ -150,7 +254,16 @@ class Mastodon():
         """
         response = None
         final_type = None
-        remaining_wait = 0
+
+        # Request observers (and request timing) get a record of the call that is filled in as it progresses
+        call = None
+        if self.__request_observers or self.request_timing:
+            call_started = time.perf_counter()
+            call = AttribAccessDict(
+                method=method, endpoint=endpoint, endpoint_key=_endpoint_key(method, endpoint), url=None, attempt=0, status_code=None,
+                latency=None, bytes_sent=None, bytes_received=None, ratelimit_wait=0.0, cast_time=None,
+                timing=AttribAccessDict(ratelimit_wait=0.0, ttfb=None, download=None, json_parse=None, cast=None, link_parse=None, total=None),
+            )
 
         # Add language to params if not None
         lang = self.lang
@@ -162,20 +275,33 @@ class Mastodon():
         # "pace" mode ratelimiting: Assume constant rate of requests, sleep a little less long than it
         # would take to not hit the rate limit at that request rate.
         if do_ratelimiting and self.ratelimit_method == "pace":
-            if self.ratelimit_remaining == 0:
-                to_next = self.ratelimit_reset - time.time()
-                if to_next > 0:
-                    # As a precaution, never sleep longer than 5 minutes
-                    to_next = min(to_next, 5 * 60)
-                    time.sleep(to_next)
-            else:
-                time_waited = time.time() - self.ratelimit_lastcall
-                time_wait = float(self.ratelimit_reset - time.time()) / float(self.ratelimit_remaining)
-                remaining_wait = time_wait - time_waited
-
-            if remaining_wait > 0:
-                to_next = remaining_wait / self.ratelimit_pacefactor
-                to_next = min(to_next, 5 * 60)
+            # Locked, since requests made from several threads at once (e.g. by status_post_with_media)
+            # would otherwise all read the same state and then go out at the same time.
+            with self.__ratelimit_lock:
+                now = time.time()
+                if self.ratelimit_remaining == 0:
+                    wait_reason = "limit"
+                    to_next = self.ratelimit_reset - now
+                else:
+                    wait_reason = "pace"
+                    time_waited = now - self.ratelimit_lastcall
+                    time_wait = float(self.ratelimit_reset - now) / float(self.ratelimit_remaining)
+                    remaining_wait = time_wait - time_waited
+                    to_next = remaining_wait / self.ratelimit_pacefactor
+
+                # As a precaution, never sleep longer than 5 minutes
+                to_next = min(max(to_next, 0), 5 * 60)
+
+                # Claim this request's slot, so that the next request paces itself relative to this one.
+                # The real values are filled in from the response headers.
+                if self.ratelimit_remaining > 0:
+                    self.ratelimit_remaining -= 1
+                self.ratelimit_lastcall = now + to_next
+
+            if to_next > 0:
+                if call is not None:
+                    self.__notify_request_observers("on_ratelimit_wait", call, to_next, wait_reason)
+                    call.ratelimit_wait += to_next
                 time.sleep(to_next)
 
         # Generate request headers
@@ -206,6 +332,11 @@ class Mastodon():
             request_complete = True
 
             response_object = None
+            if call is not None:
+                call.attempt += 1
+                call.url = base_url + endpoint
+                self.__notify_request_observers("on_request", call)
+                request_started = time.perf_counter()
             try:
                 kwargs = dict(headers=headers, files=files, timeout=self.request_timeout)
                 if use_json:
@@ -227,45 +358,63 @@ class Mastodon():
                     print(f'Mastodon: Request body: {response_object.request.body}')
                     print(f'Mastodon: Response body: {response_object.text}')
             except Exception as e:
-                raise MastodonNetworkError(f"Could not complete request: {e}")
+                raise self.__observed_error(call, MastodonNetworkError(f"Could not complete request: {e}"))
 
             if response_object is None:
                 raise MastodonIllegalArgumentError("Illegal request.")
 
+            if call is not None:
+                call.latency = time.perf_counter() - request_started
+                call.status_code = response_object.status_code
+                request_body = response_object.request.body if response_object.request is not None else None
+                if isinstance(request_body, str):
+                    call.bytes_sent = len(request_body.encode("utf-8"))
+                elif isinstance(request_body, bytes):
+                    call.bytes_sent = len(request_body)
+                else:
+                    call.bytes_sent = 0
+                call.bytes_received = len(response_object.content)
+                # requests measures "elapsed" up to having parsed the response headers, and then downloads the body
+                call.timing.ttfb = min(response_object.elapsed.total_seconds(), call.latency)
+                call.timing.download = call.latency - call.timing.ttfb
+                self.__notify_request_observers("on_response", call)
+
             # Is there a "deprecation" header present?
             if 'deprecation' in response_object.headers:
                 warnings.warn("Endpoint " + endpoint + " is marked as deprecated and may be removed in future Mastodon versions.", MastodonDeprecationWarning)
 
-            # Parse rate limiting headers
-            if 'X-RateLimit-Remaining' in response_object.headers and do_ratelimiting:
-                self.ratelimit_remaining = int(
-                    response_object.headers['X-RateLimit-Remaining'])
-                self.ratelimit_limit = int(
-                    response_object.headers['X-RateLimit-Limit'])
-
-                # For gotosocial, we need an int representation, but for non-ints this would crash
-                try:
-                    ratelimit_intrep = str(int(response_object.headers['X-RateLimit-Reset']))
-                except:
-                    ratelimit_intrep = None
-
-                try:
-                    if ratelimit_intrep is not None and ratelimit_intrep == response_object.headers['X-RateLimit-Reset']:
-                        self.ratelimit_reset = int(
-                            response_object.headers['X-RateLimit-Reset'])
-                    else:
-                        ratelimit_reset_datetime = dateutil.parser.parse(response_object.headers['X-RateLimit-Reset'])
-                        self.ratelimit_reset = self.__datetime_to_epoch(ratelimit_reset_datetime)
-
-                    # Adjust server time to local clock
-                    if 'Date' in response_object.headers:
-                        server_time_datetime = dateutil.parser.parse(response_object.headers['Date'])
-                        server_time = self.__datetime_to_epoch(server_time_datetime)
-                        server_time_diff = time.time() - server_time
-                        self.ratelimit_reset += server_time_diff
-                        self.ratelimit_lastcall = time.time()
-                except Exception as e:
-                    raise MastodonRatelimitError(f"Rate limit time calculations failed: {e}")
+            # Parse rate limiting headers. Locked, since some helpers (e.g. status_post_with_media)
+            # make requests from several threads at once.
+            with self.__ratelimit_lock:
+                if 'X-RateLimit-Remaining' in response_object.headers and do_ratelimiting:
+                    self.ratelimit_remaining = int(
+                        response_object.headers['X-RateLimit-Remaining'])
+                    self.ratelimit_limit = int(
+                        response_object.headers['X-RateLimit-Limit'])
+
+                    # For gotosocial, we need an int representation, but for non-ints this would crash
+                    try:
+                        ratelimit_intrep = str(int(response_object.headers['X-RateLimit-Reset']))
+                    except:
+                        ratelimit_intrep = None
+
+                    try:
+                        if ratelimit_intrep is not None and ratelimit_intrep == response_object.headers['X-RateLimit-Reset']:
+                            self.ratelimit_reset = int(
+                                response_object.headers['X-RateLimit-Reset'])
+                        else:
+                            ratelimit_reset_datetime = dateutil.parser.parse(response_object.headers['X-RateLimit-Reset'])
+                            self.ratelimit_reset = self.__datetime_to_epoch(ratelimit_reset_datetime)
+
+                        # Adjust server time to local clock
+                        if 'Date' in response_object.headers:
+                            server_time_datetime = dateutil.parser.parse(response_object.headers['Date'])
+                            server_time = self.__datetime_to_epoch(server_time_datetime)
+                            server_time_diff = time.time() - server_time
+                            self.ratelimit_reset += server_time_diff
+                            self.ratelimit_lastcall = time.time()
+                    except Exception as e:
+                        raise self.__observed_error(call, MastodonRatelimitError(f"Rate limit time calculations failed: {e}"))
 
             # Handle response
             if self.debug_requests:
@@ -288,12 +437,16 @@ class Mastodon():
                 # Handle rate limiting
                 if response_object.status_code == 429:
                     if self.ratelimit_method == 'throw' or not do_ratelimiting:
-                        raise MastodonRatelimitError('Hit rate limit.')
+                        raise self.__observed_error(call, MastodonRatelimitError('Hit rate limit.'))
                     elif self.ratelimit_method in ('wait', 'pace'):
-                        to_next = self.ratelimit_reset - time.time()
+                        with self.__ratelimit_lock:
+                            to_next = self.ratelimit_reset - time.time()
                         if to_next > 0:
                             # As a precaution, never sleep longer than 5 minutes
                             to_next = min(to_next, 5 * 60)
+                            if call is not None:
+                                self.__notify_request_observers("on_ratelimit_wait", call, to_next, "limit")
+                                call.ratelimit_wait += to_next
                             time.sleep(to_next)
                             request_complete = False
                             continue
@@ -321,27 +474,40 @@ class Mastodon():
                     else:
                         ex_type = MastodonAPIError
 
-                    raise ex_type('Mastodon API returned error', response_object.status_code, response_object.reason, error_msg)
+                    raise self.__observed_error(call, ex_type('Mastodon API returned error', response_object.status_code, response_object.reason, error_msg))
 
             if return_response_object:
+                if call is not None:
+                    self.__finish_call(call, call_started)
                 return response_object
 
             if parse:
                 try:
                     # The new parsing is very basic, type conversion happens later,
                     # within the new type system. This should be overall more robust.
+                    if call is not None:
+                        parse_started = time.perf_counter()
                     response = response_object.json()
+                    if call is not None:
+                        call.timing.json_parse = time.perf_counter() - parse_started
                 except Exception as e:
-                    raise MastodonAPIError(
+                    raise self.__observed_error(call, MastodonAPIError(
                         f"Could not parse response as JSON, response code was {response_object.status_code}, "
                         f"bad json content was {response_object.content!r}.",
                         f"Exception was: {e}"
-                    )
+                    ))
+                if call is not None:
+                    cast_started = time.perf_counter()
                 response, final_type = self.__try_cast_to_type(response, override_type = override_type)
+                if call is not None:
+                    call.cast_time = call.timing.cast = time.perf_counter() - cast_started
+                    self.__notify_request_observers("on_cast", call)
             else:
                 response = response_object.content
 
             # Parse link headers
+            if call is not None:
+                link_parse_started = time.perf_counter()
             if (isinstance(response, list) or force_pagination) and 'Link' in response_object.headers and response_object.headers['Link'] != "":
                 if not isinstance(response, PaginatableList) and not force_pagination:
                     response = PaginatableList(response)
@@ -408,7 +574,9 @@ class Mastodon():
                             if "max_id" in prev_params:
                                 del prev_params['max_id']
                             response._pagination_prev = prev_params
-        
+            if call is not None:
+                call.timing.link_parse = time.perf_counter() - link_parse_started
+
             # Parse Mastodon-Async-Refresh header
             if 'Mastodon-Async-Refresh' in response_object.headers:
                 async_refresh_header = response_object.headers['Mastodon-Async-Refresh']
@@ -432,8 +600,56 @@ class Mastodon():
                 if hasattr(response, '__dict__') or isinstance(response, dict):
                     response._async_refresh = async_refresh_info
 
+            if call is not None:
+                self.__finish_call(call, call_started)
+                if self.request_timing and (hasattr(response, '__dict__') or isinstance(response, dict)):
+                    response._timing = call.timing
+
         return response
 
+    def __api_request_chunked(self, method, endpoint, ids, override_type, params={}, id_param="id[]", use_json=False, id_field="id",
+                              chunk_size=_DEFAULT_BULK_CHUNK_SIZE, max_workers=_DEFAULT_BULK_MAX_WORKERS):
+        """
+        Internal API request helper for endpoints that take a list of ids, but only accept a limited
+        number of them per request.
+
+        De-duplicates `ids`, splits them into chunks of at most `chunk_size` and requests every chunk,
+        from up to `max_workers` threads at once. `override_type` must be given, since the return type
+        can't be determined from the calling function when requesting from other threads.
+
+        Returns a NonPaginatableList of the results in the order of `ids`, with the ids that the server
+        did not return anything for in `_missing_ids`.
+        """
+        unique_ids = []
+        seen_ids = set()
+        for id in self.__unpack_id(list(ids), dateconv=True):
+            if str(id) not in seen_ids:
+                seen_ids.add(str(id))
+                unique_ids.append(id)
+        chunks = [unique_ids[i:i + chunk_size] for i in range(0, len(unique_ids), chunk_size)]
+
+        def request_chunk(chunk):
+            chunk_params = copy.deepcopy(params)
+            chunk_params[id_param] = chunk
+            return self.__api_request(method, endpoint, chunk_params, use_json=use_json, override_type=override_type)
+
+        if len(chunks) <= 1:
+            chunk_results = [request_chunk(chunk) for chunk in chunks]
+        else:
+            # Don't run more requests in parallel than the rate limit has room for
+            workers = max(1, min(max_workers, len(chunks), self.ratelimit_remaining))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                chunk_results = list(executor.map(request_chunk, chunks))
+
+        results_by_id = {}
+        for chunk_result in chunk_results:
+            for entity in chunk_result:
+                results_by_id[str(entity[id_field])] = entity
+        result, _ = self.__try_cast_to_type([], override_type=override_type)
+        result.extend(results_by_id[str(id)] for id in unique_ids if str(id) in results_by_id)
+        result._missing_ids = [id for id in unique_ids if str(id) not in results_by_id]
+        return result
+
     def __get_streaming_base(self) -> str:
         """
         Internal streaming API helper.
@@ -481,13 +697,28 @@ class Mastodon():
         self.__streaming_base = url
         return url
 
-    def __stream(self, endpoint, listener, params={}, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC):
+    def __stream(self, endpoint, listener, params={}, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                 backfill_funcs=None, heartbeat_timeout=None):
         """
         Internal streaming API helper.
 
         Returns a handle to the open connection that the user can close if they
         wish to terminate it.
+
+        If `backfill_funcs` (a dict of event name -> function taking a min_id and returning the first
+        page of events of that type from the REST API) is given, events missed while reconnecting are
+        fetched and dispatched after every reconnect. This needs `run_async` and `reconnect_async`.
+
+        If `heartbeat_timeout` is set (async streams only, so this needs `run_async`), a watchdog thread shuts down the connection
+        once neither an event nor a heartbeat has been received for that many seconds, so that dead
+        connections are noticed (and, with `reconnect_async`, reconnected) long before the read timeout.
         """
+        if backfill_funcs:
+            if not (run_async and reconnect_async):
+                raise MastodonIllegalArgumentError("Backfilling happens on reconnects, so it requires run_async and reconnect_async")
+            listener = _BackfillStreamListener(listener, self, backfill_funcs)
+        if heartbeat_timeout is not None and not run_async:
+            raise MastodonIllegalArgumentError("heartbeat_timeout is watched by a separate thread, so it requires run_async")
 
         # Check if we have to redirect
         url = self.__get_streaming_base()
@@ -511,18 +742,32 @@ class Mastodon():
 
         # Async stream handler
         class __stream_handle():
-            def __init__(self, connection, connect_func, reconnect_async, reconnect_async_wait_sec):
+            def __init__(self, connection, connect_func, reconnect_async, reconnect_async_wait_sec, heartbeat_timeout):
                 self.closed = False
                 self.running = True
                 self.connection = connection
                 self.connect_func = connect_func
                 self.reconnect_async = reconnect_async
                 self.reconnect_async_wait_sec = reconnect_async_wait_sec
+                self.heartbeat_timeout = heartbeat_timeout
                 self.reconnecting = False
+                self.activity = _ActivityTrackingStreamListener(listener)
+
+            @property
+            def last_event_at(self):
+                """Unix timestamp of the last event received, or None."""
+                return self.activity.last_event_at
+
+            @property
+            def last_heartbeat_at(self):
+                """Unix timestamp of the last heartbeat received, or None."""
+                return self.activity.last_heartbeat_at
 
             def close(self):
                 self.closed = True
                 if self.connection is not None:
+                    # Closing alone blocks until a read in progress on the stream thread returns
+                    _shutdown_response(self.connection)
                     self.connection.close()
 
             def is_alive(self):
@@ -543,15 +788,32 @@ class Mastodon():
                     time.sleep(0.5)
                     time_remaining -= 0.5
 
+            def _watchdogproc(self):
+                check_interval = min(1.0, self.heartbeat_timeout / 4.0)
+                while self.running and not self.closed and self._thread.is_alive():
+                    time.sleep(check_interval)
+                    connection = self.connection
+                    if connection is None or self.reconnecting or self.closed:
+                        continue
+                    if time.monotonic() - self.activity.last_activity > self.heartbeat_timeout:
+                        # Reading fails once the socket is shut down, which the stream thread handles like any other error
+                        self.activity.last_activity = time.monotonic()
+                        _shutdown_response(connection)
+
             def _threadproc(self):
                 self._thread = threading.current_thread()
+                if self.heartbeat_timeout is not None:
+                    watchdog = threading.Thread(args=(), target=self._watchdogproc)
+                    watchdog.daemon = True
+                    watchdog.start()
 
                 # Run until closed or until error if not autoreconnecting
                 while self.running:
                     if self.connection is not None:
                         with closing(self.connection) as r:
                             try:
-                                listener.handle_stream(r)
+                                self.activity.last_activity = time.monotonic()
+                                self.activity.handle_stream(r)
                             except (AttributeError, MastodonMalformedEventError, MastodonNetworkError) as e:
                                 if not (self.closed or self.reconnect_async):
                                     raise e
@@ -585,6 +847,13 @@ class Mastodon():
                             except:
                                 self._sleep_attentive()
                                 connect_success = False
+                        if connect_success and backfill_funcs:
+                            # Catch up on what happened while disconnected. If this fails, the
+                            # last seen ids stay the same, so we will try again on the next reconnect.
+                            try:
+                                listener.backfill()
+                            except MastodonError as e:
+                                listener.on_abort(e)
                         self.reconnecting = False
                     else:
                         self.running = False
@@ -592,7 +861,7 @@ class Mastodon():
 
         if run_async:
             handle = __stream_handle(
-                connection, connect_func, reconnect_async, reconnect_async_wait_sec)
+                connection, connect_func, reconnect_async, reconnect_async_wait_sec, heartbeat_timeout)
             t = threading.Thread(args=(), target=handle._threadproc)
             t.daemon = True
             t.start()
@@ -696,11 +965,32 @@ class Mastodon():
         """Internal helper to guess media file type"""
         mime_type = None
         try:
-            mime_type = magic.from_file(media_file, mime=True)
-        except AttributeError:
-            mime_type = mimetypes.guess_type(media_file)[0]
+            file_stat = os.stat(media_file)
+            mime_type = _sniff_file_mime_type(media_file, file_stat.st_mtime_ns, file_stat.st_size)
+        except OSError:
+            pass
+        if mime_type is None:
+            try:
+                mime_type = magic.from_file(media_file, mime=True)
+            except AttributeError:
+                mime_type = mimetypes.guess_type(media_file)[0]
         return mime_type
 
+    def __guess_data_type(self, media_data):
+        """Internal helper to guess the type of media passed as bytes or a file-like object"""
+        if isinstance(media_data, (bytes, bytearray)):
+            return _sniff_mime_type(bytes(media_data[:_SNIFF_HEADER_LENGTH]))
+        try:
+            # Peek at the header and rewind, only works for seekable file-likes
+            start_pos = media_data.tell()
+            header = media_data.read(_SNIFF_HEADER_LENGTH)
+            media_data.seek(start_pos)
+        except Exception:
+            return None
+        if not isinstance(header, bytes):
+            return None
+        return _sniff_mime_type(header)
+
     def __load_media_file(self, media_file, mime_type=None, file_name=None):
         """Internal helper to load a media file"""
         if isinstance(media_file, PurePath):
@@ -713,6 +1003,8 @@ class Mastodon():
         if isinstance(media_file, str) and os.path.isfile(media_file):
             mime_type = self.__guess_type(media_file)
             media_file = open(media_file, 'rb')
+        if mime_type is None and not isinstance(media_file, str):
+            mime_type = self.__guess_data_type(media_file)
         if mime_type is None:
             raise MastodonIllegalArgumentError('Could not determine mime type or data passed directly without mime type.')
         if file_name is None:
@@ -1,8 +1,12 @@
 # list.py - list endpoints
+from concurrent.futures import ThreadPoolExecutor
+
+from mastodon.defaults import _DEFAULT_BULK_CHUNK_SIZE, _DEFAULT_BULK_MAX_WORKERS
+from mastodon.errors import MastodonAPIError
 from mastodon.utility import api_version
 
 from mastodon.internals import Mastodon as Internals
-from mastodon.return_types import NonPaginatableList, UserList, IdType, PaginatableList, Account
+from mastodon.return_types import NonPaginatableList, UserList, IdType, PaginatableList, Account, AttribAccessDict
 
 from typing import List, Union, Optional
 
@@ -100,3 +104,74 @@ class Mastodon(Internals):
         account_ids = self.__unpack_id(account_ids, listify = True)
         params = self.__generate_params(locals(), ['id'])
         self.__api_request('DELETE', f'/api/v1/lists/{id}/accounts', params)
+
+    @api_version("2.1.0", "2.1.0")
+    def list_accounts_sync(self, id: Union[UserList, IdType], account_ids: List[Union[Account, IdType]], 
+                           max_workers: int = _DEFAULT_BULK_MAX_WORKERS) -> AttribAccessDict:
+        """
+        Make the list contain exactly the account(s) given in `account_ids`.
+
+        Fetches the current members of the list once, then adds the accounts that are missing and
+        removes the ones that are not in `account_ids`. Changes are sent in chunks of as many accounts
+        as the server accepts at once, with up to `max_workers` requests in parallel. If the server
+        rejects a chunk because of one of the accounts in it (with a 422 error, for example because the
+        account isn't followed, or a 404 error because the account doesn't exist or was deleted), the
+        chunk is split and retried until the problematic accounts are isolated, so that one bad id does
+        not prevent all the others from being applied. Any other error is raised.
+
+        Returns a dict with the ids of the accounts that were `added` and `removed`, and the ids
+        that could not be added or removed in `failed_add` and `failed_remove`.
+        """
+        id = self.__unpack_id(id)
+        desired_ids = []
+        desired_id_set = set()
+        for account_id in self.__unpack_id(list(account_ids)):
+            if str(account_id) not in desired_id_set:
+                desired_id_set.add(str(account_id))
+                desired_ids.append(account_id)
+
+        current_ids = [account.id for account in self.pagination_iterator(self.list_accounts(id, limit=80))]
+        current_id_set = set(str(account_id) for account_id in current_ids)
+
+        to_add = [account_id for account_id in desired_ids if str(account_id) not in current_id_set]
+        to_remove = [account_id for account_id in current_ids if str(account_id) not in desired_id_set]
+
+        jobs = []
+        for method, ids in (('POST', to_add), ('DELETE', to_remove)):
+            for i in range(0, len(ids), _DEFAULT_BULK_CHUNK_SIZE):
+                jobs.append((method, ids[i:i + _DEFAULT_BULK_CHUNK_SIZE]))
+
+        # Don't run more requests in parallel than the rate limit has room for
+        workers = max(1, min(max_workers, len(jobs), self.ratelimit_remaining))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            failed_chunks = list(executor.map(lambda job: self.__list_accounts_apply(id, job[0], job[1]), jobs))
+
+        failed_ids = {'POST': set(), 'DELETE': set()}
+        for (method, _), failed in zip(jobs, failed_chunks):
+            failed_ids[method].update(str(account_id) for account_id in failed)
+        return AttribAccessDict(
+            added = [account_id for account_id in to_add if str(account_id) not in failed_ids['POST']],
+            removed = [account_id for account_id in to_remove if str(account_id) not in failed_ids['DELETE']],
+            failed_add = [account_id for account_id in to_add if str(account_id) in failed_ids['POST']],
+            failed_remove = [account_id for account_id in to_remove if str(account_id) in failed_ids['DELETE']],
+        )
+
+    def __list_accounts_apply(self, id, method, account_ids):
+        """
+        Internal helper for list_accounts_sync: Adds (POST) or removes (DELETE) a chunk of accounts,
+        bisecting the chunk when the server rejects some of the accounts in it (422), or can't find some of
+        them (404 - the list itself is known to exist, since its members were just fetched). Returns the ids
+        that could not be applied. Other errors (missing scopes, rate limits, ...) apply to every request
+        alike, so they are raised right away instead.
+        """
+        try:
+            self.__api_request(method, f'/api/v1/lists/{id}/accounts', {'account_ids[]': account_ids})
+            return []
+        except MastodonAPIError as e:
+            status_code = e.args[1] if len(e.args) > 1 else None
+            if status_code not in (404, 422):
+                raise
+            if len(account_ids) == 1:
+                return account_ids
+            split = len(account_ids) // 2
+            return self.__list_accounts_apply(id, method, account_ids[:split]) + self.__list_accounts_apply(id, method, account_ids[split:])
@@ -32,9 +32,11 @@ class Mastodon(Internals):
                    thumbnail: Optional[PathOrFile] = None, thumbnail_mime_type: Optional[str] = None, 
                    synchronous: bool = False) -> MediaAttachment:
         """
-        Post an image, video or audio file. `media_file` can either be data or
-        a file name. If data is passed directly, the mime type has to be specified
-        manually, otherwise, it is determined from the file name. `focus` should be a tuple
+        Post an image, video or audio file. `media_file` can either be data (bytes
+        or a file-like object) or a file name. The mime type is determined from the
+        first few bytes of the data for all the formats Mastodon accepts. For anything
+        else, or for file-like objects that can't be rewound, the mime type has to be
+        specified manually when passing data directly. `focus` should be a tuple
         of floats between -1 and 1, giving the x and y coordinates of the images
         focus point for cropping (with the origin being the images center).
 
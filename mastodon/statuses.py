@@ -3,8 +3,10 @@
 import collections
 from datetime import datetime
 import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from mastodon.errors import MastodonIllegalArgumentError, MastodonVersionError
+from mastodon.errors import MastodonIllegalArgumentError, MastodonVersionError, MastodonAPIError
 from mastodon.utility import api_version
 
 from mastodon.internals import Mastodon as Internals
@@ -28,14 +30,17 @@ class Mastodon(Internals):
         return self.__api_request('GET', f'/api/v1/statuses/{id}')
 
     @api_version("4.3.0", "4.3.0")
-    def statuses(self, ids: List[Union[Status, IdType]]) -> List[Status]:
+    def statuses(self, ids: List[Union[Status, IdType]]) -> NonPaginatableList[Status]:
         """
         Fetch information from multiple statuses by a list of status `id`.
 
+        Lists of ids are handled as in :ref:`accounts() <accounts()>`: They can be arbitrarily
+        long, are de-duplicated and fetched in parallel chunks, and the result is in the order
+        of `ids`, with ids the server returned nothing for in `_missing_ids`.
+
         Does not require authentication for publicly visible accounts.
         """
-        ids = [self.__unpack_id(id, dateconv=True) for id in ids]
-        return self.__api_request('GET', '/api/v1/statuses', {"id[]": ids})
+        return self.__api_request_chunked('GET', '/api/v1/statuses', ids, NonPaginatableList[Status])
 
     @api_version("1.0.0", "3.0.0")
     def status_card(self, id: Union[Status, IdType]) -> PreviewCard:
@@ -325,6 +330,65 @@ class Mastodon(Internals):
         """
         return self.status_post(status)
 
+    @api_version("3.1.4", "4.5.0")
+    def status_post_with_media(self, status: str, media: List[Union[PathOrFile, Dict[str, Any]]], in_reply_to_id: Optional[Union[Status, IdType]] = None,
+                               sensitive: bool = False, visibility: Optional[str] = None, spoiler_text: Optional[str] = None, language: Optional[str] = None,
+                               idempotency_key: Optional[str] = None, content_type: Optional[str] = None, scheduled_at: Optional[datetime] = None,
+                               quote_id: Optional[Union[Status, IdType]] = None, strict_content_type: bool = False,
+                               quoted_status_id: Optional[Union[Status, IdType]] = None, quote_approval_policy: Optional[str] = None,
+                               max_workers: int = 4, processing_timeout: float = 300.0, processing_poll_interval: float = 1.0) -> Union[Status, ScheduledStatus]:
+        """
+        Helper function - uploads all the given `media` in parallel, waits for the server
+        to finish processing them and then posts a status with those attachments. End-to-end,
+        this takes roughly as long as the slowest upload instead of the sum of all of them.
+
+        Every entry in `media` is either something that can be passed as `media_file` to
+        :ref:`media_post() <media_post()>` or a dict containing keyword arguments for
+        :ref:`media_post() <media_post()>` (`media_file` and, optionally, `mime_type`,
+        `description`, `focus`, `file_name`, `thumbnail` and `thumbnail_mime_type`).
+        Attachments are added to the status in the order they were given in.
+
+        Up to `max_workers` uploads run at the same time. Uploads go through the normal rate limit
+        handling, so with the default "wait" ratelimit method, uploads that run into the (separate,
+        and fairly strict) media upload rate limit wait and retry individually.
+
+        Processing of the uploaded media is awaited by polling :ref:`media() <media()>` every
+        `processing_poll_interval` seconds. If an attachment is not done processing after
+        `processing_timeout` seconds, a `MastodonAPIError` is raised and no status is posted.
+        If any upload fails, its exception is re-raised once all other uploads are finished.
+
+        All other parameters are as in :ref:`status_post() <status_post()>`.
+
+        Returns the new status.
+        """
+        keyword_args = locals().copy()
+        for arg_name in ["self", "media", "max_workers", "processing_timeout", "processing_poll_interval"]:
+            del keyword_args[arg_name]
+
+        if len(media) == 0:
+            raise MastodonIllegalArgumentError("No media passed - use status_post to post a status without media")
+
+        def upload_one(media_spec):
+            if not isinstance(media_spec, dict):
+                media_spec = {"media_file": media_spec}
+            if not "media_file" in media_spec:
+                raise MastodonIllegalArgumentError("Media dicts must contain a media_file")
+            attachment = self.media_post(**media_spec)
+
+            # Wait for server side processing, if needed
+            wait_until = time.monotonic() + processing_timeout
+            while attachment.get("url") is None:
+                if time.monotonic() > wait_until:
+                    raise MastodonAPIError("Attachment could not be processed in time")
+                time.sleep(processing_poll_interval)
+                attachment = self.media(attachment)
+            return attachment
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(media)))) as executor:
+            futures = [executor.submit(upload_one, media_spec) for media_spec in media]
+        keyword_args["media_ids"] = [future.result() for future in futures]
+        return self.status_post(**keyword_args)
+
 
     def generate_media_edit_attributes(self, id: Union[MediaAttachment, IdType], description: Optional[str] = None, 
                                       focus: Optional[Tuple[float, float]] = None, 
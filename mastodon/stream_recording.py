@@ -0,0 +1,192 @@
+# stream_recording.py - recording raw streaming API traffic, and replaying it to listeners
+
+import json
+import threading
+import time
+
+from mastodon.errors import MastodonIllegalArgumentError
+from mastodon.streaming import StreamListener
+
+from typing import Optional, Union, TextIO
+
+_RECORDING_FORMAT = "mastodon.py-stream-recording"
+_RECORDING_VERSION = 1
+
+def _encode_line(data):
+    # surrogateescape round-trips bytes that are not valid UTF-8, so broken streams can be recorded too
+    return bytes(data).decode("utf-8", "surrogateescape")
+
+def _decode_line(data):
+    return data.encode("utf-8", "surrogateescape")
+
+class _RecordingResponse(object):
+    """
+    Wraps a streaming response, passing everything read from it on to a recording listener.
+    """
+    def __init__(self, response, recorder):
+        self.response = response
+        self.recorder = recorder
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        try:
+            for chunk in self.response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    self.recorder._record(chunk)
+                yield chunk
+        finally:
+            self.recorder._flush()
+
+    def close(self):
+        self.response.close()
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+class RecordingStreamListener(StreamListener):
+    """
+    Wraps a :class:`StreamListener`, passing all events on to it unchanged while writing the raw data
+    received from the streaming API to `file` (a path, or a file object opened for writing text), so that
+    it can be played back later with :class:`StreamReplay`. Pass it to any of the `stream_*()` functions
+    in place of the wrapped listener.
+
+    Recordings are JSON lines files: A header, and then one record per line received, holding the line
+    and the time it arrived at, in seconds since the recording started. Every new connection (e.g. after
+    a reconnect) is marked with a record of its own.
+
+    Only what arrives over the stream is recorded: Events that a stream with `backfill` enabled fetches
+    from the REST API after a reconnect are passed on to the wrapped listener, but are not part of the
+    recording.
+
+    Call `close()` when done, which writes out any incomplete line and closes the file (if it was opened
+    by the listener).
+    """
+    def __init__(self, listener: StreamListener, file: Union[str, TextIO]):
+        super(RecordingStreamListener, self).__init__()
+        self.listener = listener
+        if isinstance(file, str):
+            self.file = open(file, "w", encoding="utf-8")
+            self.owns_file = True
+        else:
+            self.file = file
+            self.owns_file = False
+        self.started = time.monotonic()
+        self.line_buffer = bytearray()
+        self.closed = False
+        self.lock = threading.Lock()
+        self.__write({"format": _RECORDING_FORMAT, "version": _RECORDING_VERSION, "started_at": time.time()})
+
+    def __write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def _record(self, chunk):
+        with self.lock:
+            # The stream thread of an async stream may still deliver data after close()
+            if self.closed:
+                return
+            self.line_buffer.extend(chunk)
+            while True:
+                line_end = self.line_buffer.find(b"\n")
+                if line_end < 0:
+                    break
+                self.__write({"t": round(time.monotonic() - self.started, 6), "d": _encode_line(self.line_buffer[:line_end + 1])})
+                del self.line_buffer[:line_end + 1]
+
+    def _flush(self):
+        with self.lock:
+            if not self.closed:
+                self.file.flush()
+
+    def _wrap_response(self, response):
+        # Called for every new connection, also when this listener is wrapped by another one (like the
+        # stream handles of async streams do), so this is where the recording hooks in
+        with self.lock:
+            if not self.closed:
+                self.__write({"t": round(time.monotonic() - self.started, 6), "connect": True})
+                self.line_buffer = bytearray()
+        return _RecordingResponse(self.listener._wrap_response(response), self)
+
+    def close(self):
+        """
+        Write out what is left over and close the recording. Anything received after this is not recorded.
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            if len(self.line_buffer) > 0:
+                self.__write({"t": round(time.monotonic() - self.started, 6), "d": _encode_line(self.line_buffer)})
+                self.line_buffer = bytearray()
+            if self.owns_file:
+                self.file.close()
+            else:
+                self.file.flush()
+
+    def _dispatch(self, event):
+        self.listener._dispatch(event)
+
+    def _wants_event(self, name):
+        return self.listener._wants_event(name)
+
+    def _dispatch_parsed(self, name, payload, for_stream=None):
+        # Called directly by wrappers that parse events themselves (backfill, QueuedStreamListener). Events
+        # from the stream have already been recorded as raw data by then, so there is nothing left to record.
+        self.listener._dispatch_parsed(name, payload, for_stream)
+
+    def on_abort(self, err):
+        self.listener.on_abort(err)
+
+    def handle_heartbeat(self):
+        self.listener.handle_heartbeat()
+
+class StreamReplay(object):
+    """
+    Plays back a recording made with :class:`RecordingStreamListener`. Stands in for the response object
+    that listeners read from, so a recording can be fed to any listener with `replay()` (or
+    `listener.handle_stream(replay)`), which returns once the recording is over.
+
+    `speed` sets how fast to play back: 1.0 (the default) keeps the original timing, 10.0 plays back
+    ten times as fast, and None does not wait at all, e.g. for benchmarking listeners or for tests.
+
+    The whole recording is read into memory when the replay is created, so reading the file does not
+    count towards the time taken to replay it.
+    """
+    def __init__(self, file: Union[str, TextIO], speed: Optional[float] = 1.0):
+        if speed is not None and speed <= 0:
+            raise MastodonIllegalArgumentError("speed must be positive, or None to not wait at all")
+        self.speed = speed
+        if isinstance(file, str):
+            with open(file, "r", encoding="utf-8") as recording_file:
+                lines = recording_file.readlines()
+        else:
+            lines = file.readlines()
+        if len(lines) == 0:
+            raise MastodonIllegalArgumentError("Empty stream recording")
+        header = json.loads(lines[0])
+        if header.get("format") != _RECORDING_FORMAT or header.get("version", 0) > _RECORDING_VERSION:
+            raise MastodonIllegalArgumentError("Not a stream recording, or a recording in an unsupported format")
+        self.started_at = header.get("started_at")
+        self.records = []
+        for line in lines[1:]:
+            record = json.loads(line)
+            if "d" in record:
+                self.records.append((record["t"], _decode_line(record["d"])))
+        self.status_code = 200
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        started = time.monotonic()
+        for timestamp, data in self.records:
+            if self.speed is not None:
+                wait = started + timestamp / self.speed - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            # Listeners deal with chunks of any size, and whole lines are much faster to replay
+            yield data
+
+    def replay(self, listener: StreamListener):
+        """
+        Feed the recording to `listener`, returns once it has all been played back.
+        """
+        listener.handle_stream(self)
+
+    def close(self):
+        pass
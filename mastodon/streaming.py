@@ -4,15 +4,18 @@ https://github.com/mastodon/documentation/blob/master/content/en/methods/timelin
 """
 
 import json
+import collections
+import threading
+import time
+import socket
 try:
     from inspect import signature
 except:
     pass
 
-from mastodon import Mastodon
-from mastodon.Mastodon import MastodonMalformedEventError, MastodonNetworkError, MastodonReadTimeout
+from mastodon.errors import MastodonMalformedEventError, MastodonNetworkError, MastodonReadTimeout, MastodonIllegalArgumentError
 from mastodon.return_types import AttribAccessDict, Status, Notification, IdType, Conversation, Announcement, StreamReaction, try_cast_recurse
-from typing import Optional, Any
+from typing import Optional, Any, List
 
 from requests.exceptions import ChunkedEncodingError, ReadTimeout, ConnectionError
 
@@ -110,7 +113,8 @@ class StreamListener(object):
         """A generic event handler that is called for every event received.
         The name contains the event name and data contains the content of the event.
 
-        for_stream is currently unused, but might be added in the future if we ever add websocket support.
+        for_stream is only set for events received via `stream_multiplexed()`, and is the stream the
+        event belongs to, as a list (e.g. ["hashtag", "cats"]).
 
         Called before the more specific on_xxx handlers.
         """
@@ -128,6 +132,7 @@ class StreamListener(object):
 
         response; a requests response object with the open stream for reading.
         """
+        response = self._wrap_response(response)
         event = {}
         line_buffer = bytearray()
         try:
@@ -166,6 +171,14 @@ class StreamListener(object):
             self.on_abort(exception)
             raise exception from err
 
+    def _wrap_response(self, response):
+        """
+        Returns what handle_stream() should read from instead of `response`. Lets listeners see the
+        raw stream (e.g. to record it). Listeners that wrap another listener pass this on to it, since
+        only the outermost listener's handle_stream() gets called.
+        """
+        return response
+
     def _parse_line(self, line, event):
         if line.startswith(':'):
             self.handle_heartbeat()
@@ -184,10 +197,53 @@ class StreamListener(object):
                 event[key] = value
         return event
 
+    def __setattr__(self, name, value):
+        super(StreamListener, self).__setattr__(name, value)
+        # Assigning handlers can change which events we need to decode
+        if name.startswith("on_") or name.endswith("_handler"):
+            self.__dict__.pop("_StreamListener__handled_events", None)
+            self.__dict__.pop("_StreamListener__handler_cache", None)
+
+    def _overrides(self, handler_name, base_class=None):
+        """
+        Returns True if `handler_name` was overridden, either in a subclass of `base_class`
+        (default: StreamListener) or by assigning to the instance.
+        """
+        if base_class is None:
+            base_class = StreamListener
+        if handler_name in self.__dict__:
+            return True
+        return getattr(type(self), handler_name, None) is not getattr(base_class, handler_name, None)
+
+    def _handled_events(self):
+        """
+        Returns the names of the known event types that this listener handles, or None if it
+        wants to see every event (because it overrides `on_any_event`). Events of known types
+        that are not handled are dropped before their payload is decoded.
+        """
+        if self._overrides("on_any_event"):
+            return None
+        return frozenset(name for name in self.__EVENT_NAME_TO_TYPE if self._overrides("on_" + name))
+
+    def _wants_event(self, name):
+        try:
+            handled_events = self.__handled_events
+        except AttributeError:
+            handled_events = self.__handled_events = self._handled_events()
+        return handled_events is None or name in handled_events or name not in self.__EVENT_NAME_TO_TYPE
+
     def _dispatch(self, event):
         if not event:
             return
+        if "event" in event and not self._wants_event(event["event"]):
+            return
+        name, payload, for_stream = self._parse_event(event)
+        self._dispatch_parsed(name, payload, for_stream)
 
+    def _parse_event(self, event):
+        """
+        Decode and cast the payload of a raw SSE event. Returns a (name, payload, for_stream) tuple.
+        """
         try:
             name = event['event']
             data = event['data']
@@ -209,35 +265,74 @@ class StreamListener(object):
             exception = MastodonMalformedEventError('Bad JSON', data)
             self.on_abort(exception)
             raise exception from err
+        return name, payload, for_stream
 
+    @staticmethod
+    def __accepts_for_stream(handler):
+        try:
+            return "for_stream" in signature(handler).parameters
+        except:
+            return "for_stream" in handler.__code__.co_varnames[:handler.__code__.co_argcount]
+
+    def __resolve_handler(self, name):
+        """
+        Look up the handler for an event name, and work out how it wants to be called. Returns a
+        (handler, call_style, call_any_event) tuple, where call_style is one of "payload", "no_payload",
+        "for_stream", "unknown" or "unknown_for_stream", and call_any_event is whether on_any_event
+        is to be called before the handler.
+        """
         # New mastodon API also supports event names with dots,
         # specifically, status_update.
         handler_name = 'on_' + name.replace('.', '_')
 
         # A generic way to handle unknown events to make legacy code more stable for future changes
         handler = getattr(self, handler_name, self.on_unknown_event)
+        is_unknown = handler == self.on_unknown_event
+
+        # "for_stream" is only sent on websocket based multiplexed streams, so only pass it on
+        # to handlers that want it.
+        if self.__accepts_for_stream(handler):
+            return handler, "unknown_for_stream" if is_unknown else "for_stream", True
+        if is_unknown:
+            return handler, "unknown", False
+        if handler == self.on_filters_changed:
+            return handler, "no_payload", True
+        return handler, "payload", True
+
+    def __handlers(self):
         try:
-            handler_args = list(signature(handler).parameters)
-        except:
-            handler_args = handler.__code__.co_varnames[:handler.__code__.co_argcount]
-
-        # The "for_stream" is right now only theoretical - it's only supported on websocket,
-        # and we do not support websocket based multiplexed streams (yet).
-        if "for_stream" in handler_args:
-            self.on_any_event(name, payload, for_stream)            
-            if handler != self.on_unknown_event:
-                handler(payload, for_stream)
+            return self.__handler_cache
+        except AttributeError:
+            self.__handler_cache = {None: (self.on_any_event, self.__accepts_for_stream(self.on_any_event))}
+            return self.__handler_cache
+
+    def _dispatch_parsed(self, name, payload, for_stream=None):
+        """
+        Call the handlers for an already parsed event.
+        """
+        handlers = self.__handlers()
+        resolved = handlers.get(name)
+        if resolved is None:
+            resolved = handlers[name] = self.__resolve_handler(name)
+        handler, call_style, call_any_event = resolved
+
+        if call_any_event:
+            on_any_event, any_accepts_for_stream = handlers[None]
+            if call_style in ("for_stream", "unknown_for_stream") or (for_stream is not None and any_accepts_for_stream):
+                on_any_event(name, payload, for_stream)
             else:
-                handler(name, payload, for_stream)
+                on_any_event(name, payload)
+
+        if call_style == "payload":
+            handler(payload)
+        elif call_style == "for_stream":
+            handler(payload, for_stream)
+        elif call_style == "no_payload":
+            handler()
+        elif call_style == "unknown":
+            handler(name, payload)
         else:
-            if handler != self.on_unknown_event:
-                self.on_any_event(name, payload)
-                if handler == self.on_filters_changed:
-                    handler()
-                else:
-                    handler(payload)
-            else:
-                handler(name, payload)
+            handler(name, payload, for_stream)
 
 
 class CallbackStreamListener(StreamListener):
@@ -277,6 +372,26 @@ class CallbackStreamListener(StreamListener):
         self.announcement_delete_handler = announcement_delete_handler
         self.encryted_message_handler = encryted_message_handler
 
+    def _handled_events(self):
+        if self._overrides("on_any_event"):
+            return None
+        handlers = {
+            "update": (self.update_handler, self.local_update_handler),
+            "delete": (self.delete_handler,),
+            "notification": (self.notification_handler,),
+            "filters_changed": (self.filters_changed_handler,),
+            "conversation": (self.conversation_handler,),
+            "announcement": (self.announcement_handler,),
+            "announcement_reaction": (self.announcement_reaction_handler,),
+            "announcement_delete": (self.announcement_delete_handler,),
+            "status_update": (self.status_update_handler,),
+            "encrypted_message": (self.encryted_message_handler,),
+        }
+        return frozenset(
+            name for name, callbacks in handlers.items()
+            if any(callback is not None for callback in callbacks) or self._overrides("on_" + name, CallbackStreamListener)
+        )
+
     def on_update(self, status):
         if self.update_handler is not None:
             self.update_handler(status)
@@ -326,3 +441,639 @@ class CallbackStreamListener(StreamListener):
     def on_unknown_event(self, name: str, unknown_event: Optional[Any] = None):
         if self.unknown_event_handler is not None:
             self.unknown_event_handler(name, unknown_event)
+
+
+class BatchingStreamListener(StreamListener):
+    """
+    Stream listener that collects updates, notifications and deletes and hands them over in batches,
+    e.g. so that they can be written to a database in bulk. Create a subclass and override
+    `on_update_batch`, `on_notification_batch` and / or `on_delete_batch`, which are called with lists
+    of statuses, notifications and deleted status ids.
+
+    A batch is delivered once it holds `max_batch_size` events, or once its oldest event has waited for
+    `max_batch_delay` seconds (checked on a background thread, so batches also go out when the stream
+    is quiet). Whenever that happens, all pending batches are delivered, the one whose oldest event
+    arrived first going first. Events of other types are passed to their on_xxx handlers right away.
+
+    `on_abort` and `close()` deliver everything that is pending. If you override `on_abort`, call
+    `super().on_abort(err)`. Call `close()` once you are done with the listener.
+    """
+    __BATCHED_EVENTS = ("update", "notification", "delete")
+
+    def __init__(self, max_batch_size: int = 100, max_batch_delay: float = 1.0):
+        super(BatchingStreamListener, self).__init__()
+        if max_batch_size < 1:
+            raise MastodonIllegalArgumentError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+        self.__batches = {}
+        self.__lock = threading.Lock()
+        self.__batch_added = threading.Condition(self.__lock)
+        # Reentrant, so that batch handlers can call flush() (or add events that fill a batch) themselves
+        self.__deliver_lock = threading.RLock()
+        self.__timer_thread = None
+        self.__closed = False
+
+    def on_update_batch(self, statuses: List[Status]):
+        """A batch of new statuses has arrived."""
+        pass
+
+    def on_notification_batch(self, notifications: List[Notification]):
+        """A batch of new notifications has arrived."""
+        pass
+
+    def on_delete_batch(self, status_ids: List[IdType]):
+        """A batch of statuses has been deleted."""
+        pass
+
+    def on_update(self, status):
+        self.__add("update", status)
+
+    def on_notification(self, notification):
+        self.__add("notification", notification)
+
+    def on_delete(self, status_id):
+        self.__add("delete", status_id)
+
+    def on_abort(self, err):
+        self.flush()
+
+    def _handled_events(self):
+        handled_events = super(BatchingStreamListener, self)._handled_events()
+        if handled_events is None:
+            return None
+        batched = [
+            name for name in self.__BATCHED_EVENTS
+            if self._overrides("on_" + name + "_batch", BatchingStreamListener) or self._overrides("on_" + name, BatchingStreamListener)
+        ]
+        return frozenset(name for name in handled_events if name not in self.__BATCHED_EVENTS).union(batched)
+
+    def flush(self):
+        """
+        Deliver all pending batches right away.
+        """
+        with self.__deliver_lock:
+            with self.__lock:
+                batches = sorted(self.__batches.items(), key=lambda batch: batch[1][0])
+                self.__batches = {}
+            for name, (_, items) in batches:
+                getattr(self, "on_" + name + "_batch")(items)
+
+    def close(self):
+        """
+        Deliver all pending batches and stop the background thread.
+        """
+        with self.__lock:
+            self.__closed = True
+            self.__batch_added.notify_all()
+        self.flush()
+
+    def __add(self, name, item):
+        with self.__lock:
+            batch = self.__batches.get(name)
+            if batch is None:
+                batch = self.__batches[name] = (time.monotonic(), [])
+                if self.__timer_thread is None or not self.__timer_thread.is_alive():
+                    self.__timer_thread = threading.Thread(target=self.__timer_threadproc)
+                    self.__timer_thread.daemon = True
+                    self.__timer_thread.start()
+                self.__batch_added.notify_all()
+            batch[1].append(item)
+            full = len(batch[1]) >= self.max_batch_size
+        if full:
+            self.flush()
+
+    def __timer_threadproc(self):
+        while True:
+            with self.__lock:
+                while not self.__closed:
+                    if len(self.__batches) == 0:
+                        self.__batch_added.wait()
+                        continue
+                    oldest = min(first_added for first_added, _ in self.__batches.values())
+                    remaining = oldest + self.max_batch_delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.__batch_added.wait(remaining)
+                if self.__closed:
+                    return
+            self.flush()
+
+def _id_sort_key(id):
+    """
+    Sort key for Mastodon ids, which are numeric strings of varying length.
+    """
+    return str(id).rjust(32, "0")
+
+class _BackfillStreamListener(StreamListener):
+    """
+    Internal listener wrapper used for streams with backfill enabled.
+
+    Remembers the newest id seen for every event type that has a backfill function (a function
+    taking a `min_id` and returning the first page of the matching REST endpoint), and fetches the
+    events that were missed while disconnected when `backfill()` is called after a reconnect.
+    Events are passed on to the wrapped listener in order, and de-duplicated against the most
+    recent `dedup_window` ids, since the stream and the REST endpoint can overlap.
+    """
+    def __init__(self, listener, api, backfill_funcs, dedup_window=1000):
+        super(_BackfillStreamListener, self).__init__()
+        self.listener = listener
+        self.api = api
+        self.backfill_funcs = backfill_funcs
+        self.last_ids = {}
+        self.seen_ids = set()
+        self.seen_ids_order = collections.deque()
+        self.dedup_window = dedup_window
+
+    def _dispatch(self, event):
+        if not event:
+            return
+        if "event" in event and not self._wants_event(event["event"]):
+            return
+        name, payload, for_stream = self._parse_event(event)
+        self._deliver(name, payload, for_stream)
+
+    def _deliver(self, name, payload, for_stream=None):
+        if name in self.backfill_funcs and isinstance(payload, dict) and "id" in payload:
+            key = (name, str(payload["id"]))
+            if key in self.seen_ids:
+                return
+            self.seen_ids.add(key)
+            self.seen_ids_order.append(key)
+            if len(self.seen_ids_order) > self.dedup_window:
+                self.seen_ids.discard(self.seen_ids_order.popleft())
+            if name not in self.last_ids or _id_sort_key(payload["id"]) > _id_sort_key(self.last_ids[name]):
+                self.last_ids[name] = payload["id"]
+        self.listener._dispatch_parsed(name, payload, for_stream)
+
+    def _wants_event(self, name):
+        return self.listener._wants_event(name)
+
+    def backfill(self):
+        """
+        Fetch and dispatch everything newer than the last seen ids, oldest first.
+        """
+        for name, backfill_func in self.backfill_funcs.items():
+            if name not in self.last_ids:
+                continue
+            page = backfill_func(self.last_ids[name])
+            while page:
+                for item in sorted(page, key=lambda item: _id_sort_key(item["id"])):
+                    self._deliver(name, item)
+                page = self.api.fetch_previous(page)
+
+    def on_abort(self, err):
+        self.listener.on_abort(err)
+
+    def _wrap_response(self, response):
+        return self.listener._wrap_response(response)
+
+    def handle_heartbeat(self):
+        self.listener.handle_heartbeat()
+
+class _EventQueue(object):
+    """
+    Bounded FIFO queue of parsed events with a configurable overflow policy, for QueuedStreamListener.
+    """
+    def __init__(self, max_size, overflow):
+        self.items = collections.deque()
+        self.max_size = max_size
+        self.overflow = overflow
+        self.condition = threading.Condition()
+        self.closed = False
+
+    def put(self, item):
+        """
+        Add an item, returns the number of items dropped to make that happen (0 or 1).
+        """
+        with self.condition:
+            while len(self.items) >= self.max_size and not self.closed:
+                if self.overflow == "drop_newest":
+                    return 1
+                elif self.overflow == "drop_oldest":
+                    self.items.popleft()
+                    self.items.append(item)
+                    return 1
+                self.condition.wait()
+            if self.closed:
+                return 1
+            self.items.append(item)
+            self.condition.notify_all()
+            return 0
+
+    def get(self):
+        """
+        Remove and return the oldest item, blocking until there is one. Returns None once closed and empty.
+        """
+        with self.condition:
+            while len(self.items) == 0:
+                if self.closed:
+                    return None
+                self.condition.wait()
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class QueuedStreamListener(StreamListener):
+    """
+    Wraps a :class:`StreamListener` so that its handlers run on a pool of `workers` worker threads instead
+    of on the thread that reads from the network, so that slow handlers don't hold up reading from the stream
+    (which the server eventually punishes by dropping the connection). Pass it to any of the stream functions
+    in place of the wrapped listener:
+
+    .. code-block:: python
+
+        listener = QueuedStreamListener(MyListener(), workers=4)
+        mastodon.stream_user(listener, run_async=True, reconnect_async=True)
+
+    Events are parsed on the reading thread (so malformed events still abort the stream like they normally
+    would) and then put into a queue holding up to `max_queue_size` events. When the queue is full,
+    `overflow` decides what happens: "block" (the default) makes the reading thread wait for space, pushing
+    back on the server, "drop_oldest" discards the oldest queued event and "drop_newest" discards the new one.
+
+    If `ordered` is set (the default), all events of one type (e.g. all updates) are handled by the same worker,
+    one after the other, in the order they arrived. Events of different types may be handled out of order
+    relative to each other. Each worker then has its own queue of `max_queue_size`. If `ordered` is not set,
+    all workers take events from one shared queue, and events of the same type may be handled concurrently.
+
+    `on_abort` and `handle_heartbeat` are called right away on the reading thread. Exceptions raised by
+    handlers on the worker threads are counted in `metrics()` and otherwise ignored.
+    """
+    def __init__(self, listener: StreamListener, workers: int = 1, max_queue_size: int = 1000, overflow: str = "block", ordered: bool = True):
+        super(QueuedStreamListener, self).__init__()
+        if overflow not in ("block", "drop_oldest", "drop_newest"):
+            raise MastodonIllegalArgumentError('overflow must be one of "block", "drop_oldest" or "drop_newest"')
+        if workers < 1 or max_queue_size < 1:
+            raise MastodonIllegalArgumentError("Need at least one worker and space for at least one event")
+        self.listener = listener
+        self.ordered = ordered
+        self.closed = False
+        self.__metrics = {
+            "enqueued": 0,
+            "processed": 0,
+            "dropped": 0,
+            "handler_errors": 0,
+            "max_queue_depth": 0,
+            "total_latency": 0.0,
+            "max_latency": 0.0,
+            "last_error": None,
+        }
+        self.__metrics_lock = threading.Lock()
+        self.__worker_for_name = {}
+        self.__queues = [_EventQueue(max_queue_size, overflow) for _ in range(workers if ordered else 1)]
+        self.__threads = []
+        for index in range(workers):
+            worker_queue = self.__queues[index if ordered else 0]
+            thread = threading.Thread(target=self.__worker, args=(worker_queue,))
+            thread.daemon = True
+            thread.start()
+            self.__threads.append(thread)
+
+    def _wants_event(self, name):
+        return self.listener._wants_event(name)
+
+    def _dispatch_parsed(self, name, payload, for_stream=None):
+        if self.closed:
+            return
+        if self.ordered:
+            # Assign event types to workers round robin, in order of first appearance
+            index = self.__worker_for_name.get(name)
+            if index is None:
+                index = len(self.__worker_for_name) % len(self.__queues)
+                self.__worker_for_name[name] = index
+            event_queue = self.__queues[index]
+        else:
+            event_queue = self.__queues[0]
+        dropped = event_queue.put((name, payload, for_stream, time.monotonic()))
+        with self.__metrics_lock:
+            self.__metrics["enqueued"] += 1
+            self.__metrics["dropped"] += dropped
+            self.__metrics["max_queue_depth"] = max(self.__metrics["max_queue_depth"], self.queue_depth())
+
+    def __worker(self, event_queue):
+        while True:
+            item = event_queue.get()
+            if item is None:
+                return
+            name, payload, for_stream, enqueued_at = item
+            latency = time.monotonic() - enqueued_at
+            error = None
+            try:
+                self.listener._dispatch_parsed(name, payload, for_stream)
+            except Exception as e:
+                error = e
+            with self.__metrics_lock:
+                self.__metrics["processed"] += 1
+                self.__metrics["total_latency"] += latency
+                self.__metrics["max_latency"] = max(self.__metrics["max_latency"], latency)
+                if error is not None:
+                    self.__metrics["handler_errors"] += 1
+                    self.__metrics["last_error"] = repr(error)
+
+    def queue_depth(self) -> int:
+        """
+        Number of events currently waiting to be handled.
+        """
+        return sum(len(event_queue.items) for event_queue in self.__queues)
+
+    def metrics(self) -> AttribAccessDict:
+        """
+        Returns statistics about the queue: The current `queue_depth` and the highest it has been
+        (`max_queue_depth`), the number of events `enqueued`, `processed` and `dropped`, the number of
+        `handler_errors` and the last one (`last_error`), and the average and maximum time in seconds that
+        events spent waiting in the queue (`average_latency` and `max_latency`).
+        """
+        with self.__metrics_lock:
+            result = AttribAccessDict(**self.__metrics)
+        result["queue_depth"] = self.queue_depth()
+        result["average_latency"] = result["total_latency"] / result["processed"] if result["processed"] > 0 else 0.0
+        del result["total_latency"]
+        return result
+
+    def wait_empty(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued events have been handled, or until `timeout` seconds have passed.
+        Returns True if the queue was emptied.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.__metrics_lock:
+                done = self.__metrics["processed"] + self.__metrics["dropped"] >= self.__metrics["enqueued"]
+            if done:
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+
+    def close(self, wait: bool = True):
+        """
+        Stop the worker threads. Events that are already queued are still handled, if `wait` is set this
+        waits for that to finish. Events arriving after the close are discarded.
+        """
+        self.closed = True
+        for event_queue in self.__queues:
+            event_queue.close()
+        if wait:
+            for thread in self.__threads:
+                if thread is not threading.current_thread():
+                    thread.join()
+
+    def on_abort(self, err):
+        self.listener.on_abort(err)
+
+    def _wrap_response(self, response):
+        return self.listener._wrap_response(response)
+
+    def handle_heartbeat(self):
+        self.listener.handle_heartbeat()
+
+class _ActivityTrackingStreamListener(StreamListener):
+    """
+    Internal listener wrapper used by the stream handles, remembers when the last event and heartbeat
+    arrived (as unix timestamps), and when anything last arrived at all (as time.monotonic(), for the
+    heartbeat watchdog).
+    """
+    def __init__(self, listener):
+        super(_ActivityTrackingStreamListener, self).__init__()
+        self.listener = listener
+        self.last_event_at = None
+        self.last_heartbeat_at = None
+        self.last_activity = time.monotonic()
+
+    def _dispatch(self, event):
+        if event:
+            self.last_event_at = time.time()
+            self.last_activity = time.monotonic()
+        self.listener._dispatch(event)
+
+    def on_abort(self, err):
+        self.listener.on_abort(err)
+
+    def _wrap_response(self, response):
+        return self.listener._wrap_response(response)
+
+    def handle_heartbeat(self):
+        self.last_heartbeat_at = time.time()
+        self.last_activity = time.monotonic()
+        self.listener.handle_heartbeat()
+
+def _shutdown_response(response):
+    """
+    Shut down the socket underneath a streaming requests response, which (unlike closing the response)
+    makes a read blocked on it in another thread fail right away.
+    """
+    sock = None
+    raw = getattr(response, "raw", None)
+    connection = getattr(raw, "_connection", None)
+    if connection is not None:
+        # urllib3 2.x
+        sock = getattr(connection, "sock", None)
+    else:
+        # urllib3 1.x: socket file object of the http.client response
+        try:
+            sock = raw._fp.fp.raw._sock
+        except AttributeError:
+            pass
+    if sock is None or not hasattr(sock, "shutdown"):
+        response.close()
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+def _stream_key(stream, tag=None, list=None):
+    """
+    Validate a stream name as the streaming API knows it (with tag / list parameter) and
+    turn it into a tuple that matches the `stream` field of events from that stream.
+    """
+    if stream in ("hashtag", "hashtag:local"):
+        if tag is None:
+            raise MastodonIllegalArgumentError("Hashtag streams require a tag")
+        if tag.startswith("#"):
+            raise MastodonIllegalArgumentError("Tag parameter should omit leading #")
+    if stream == "list" and list is None:
+        raise MastodonIllegalArgumentError("List streams require a list id")
+    key = [stream]
+    if tag is not None:
+        key.append(tag)
+    if list is not None:
+        if isinstance(list, dict):
+            list = list["id"]
+        key.append(str(list))
+    return tuple(key)
+
+class MultiplexedStream(object):
+    """
+    Handle for a WebSocket connection to the streaming API that many streams are multiplexed over,
+    as returned by :ref:`stream_multiplexed() <stream_multiplexed()>`.
+
+    Use `subscribe()` and `unsubscribe()` to add and remove streams at any time. Events are routed to the
+    listener of the stream they belong to (by the `stream` field the server sends along), and handlers that
+    take a `for_stream` argument receive it. If the connection is lost and `reconnect_async` was set, the
+    handle reconnects and re-subscribes to all streams.
+
+    Like the handles returned by the other streaming functions, it has `close()`, `is_alive()` and `is_receiving()`.
+    """
+    def __init__(self, connect_func, reconnect_async=False, reconnect_async_wait_sec=5):
+        self.connect_func = connect_func
+        self.reconnect_async = reconnect_async
+        self.reconnect_async_wait_sec = reconnect_async_wait_sec
+        self.closed = False
+        self.running = True
+        self.connection = None
+        self.subscriptions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @staticmethod
+    def _subscription_message(message_type, key):
+        message = {"type": message_type, "stream": key[0]}
+        if len(key) > 1:
+            message["list" if key[0] == "list" else "tag"] = key[1]
+        return json.dumps(message)
+
+    def subscribe(self, listener: StreamListener, stream: str, tag: Optional[str] = None, list: Optional[IdType] = None):
+        """
+        Subscribe `listener` to a stream. `stream` is the name of the stream as the Mastodon streaming API
+        knows it: "user", "user:notification", "public", "public:local", "public:remote", "public:media",
+        "hashtag" and "hashtag:local" (with `tag` given), "list" (with `list` given) or "direct".
+
+        Subscribing to the same stream again replaces the listener.
+        """
+        key = _stream_key(stream, tag, list)
+        with self._lock:
+            self.subscriptions[key] = listener
+            connection = self.connection
+        if connection is not None:
+            try:
+                connection.send(self._subscription_message("subscribe", key))
+            except Exception:
+                # The receiving thread will notice and reconnect, subscribing to everything again
+                pass
+
+    def unsubscribe(self, stream: str, tag: Optional[str] = None, list: Optional[IdType] = None):
+        """
+        Unsubscribe from a stream previously subscribed to with `subscribe()`.
+        """
+        key = _stream_key(stream, tag, list)
+        with self._lock:
+            if key not in self.subscriptions:
+                return
+            del self.subscriptions[key]
+            connection = self.connection
+        if connection is not None:
+            try:
+                connection.send(self._subscription_message("unsubscribe", key))
+            except Exception:
+                pass
+
+    def close(self):
+        """
+        Close the connection and stop the receiving thread.
+        """
+        self.closed = True
+        connection = self.connection
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_receiving(self):
+        if self.closed or not self.running or self.connection is None or not self.is_alive():
+            return False
+        return True
+
+    def _listeners(self):
+        with self._lock:
+            listeners = []
+            for listener in self.subscriptions.values():
+                if not any(listener is other for other in listeners):
+                    listeners.append(listener)
+        return listeners
+
+    def _route(self, message):
+        try:
+            message = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or "event" not in message or "stream" not in message:
+            # Errors and other non-event messages from the server
+            return
+        stream = message["stream"]
+        if not isinstance(stream, (tuple, list)) or len(stream) == 0:
+            return
+        with self._lock:
+            listener = self.subscriptions.get(tuple(str(part) for part in stream))
+            if listener is None:
+                listener = self.subscriptions.get((stream[0],))
+        if listener is None:
+            return
+        payload = message.get("payload", "null")
+        if not isinstance(payload, str):
+            payload = json.dumps(payload)
+        event = {"event": message["event"], "data": payload, "stream": json.dumps(stream)}
+        try:
+            listener._dispatch(event)
+        except MastodonMalformedEventError:
+            # Listener has already been notified via on_abort, other streams go on
+            pass
+
+    def _sleep_attentive(self):
+        time_remaining = self.reconnect_async_wait_sec
+        while time_remaining > 0 and not self.closed:
+            time.sleep(0.5)
+            time_remaining -= 0.5
+
+    def _threadproc(self):
+        self._thread = threading.current_thread()
+        while not self.closed:
+            if self.connection is None:
+                try:
+                    connection = self.connect_func()
+                    with self._lock:
+                        self.connection = connection
+                        keys = self.subscriptions.keys()
+                        for key in keys:
+                            connection.send(self._subscription_message("subscribe", key))
+                except Exception as e:
+                    self.connection = None
+                    if self.closed:
+                        break
+                    if not self.reconnect_async:
+                        exception = MastodonNetworkError(f"Could not connect to streaming server: {e}")
+                        for listener in self._listeners():
+                            listener.on_abort(exception)
+                        break
+                    self._sleep_attentive()
+                    continue
+
+            try:
+                message = self.connection.recv()
+            except Exception as e:
+                if self.closed:
+                    break
+                exception = MastodonNetworkError(f"Lost connection to streaming server: {e}")
+                for listener in self._listeners():
+                    listener.on_abort(exception)
+                try:
+                    self.connection.close()
+                except Exception:
+                    pass
+                self.connection = None
+                if not self.reconnect_async:
+                    break
+                continue
+            if message:
+                self._route(message)
+        self.running = False
+        return 0
@@ -1,9 +1,14 @@
 # streaming_endpoints.py - endpoints for getting streaming data using the HTTP SSE streaming API
 
 import warnings
+import threading
 
 from mastodon.errors import MastodonIllegalArgumentError, MastodonWarning
-from mastodon.defaults import _DEFAULT_STREAM_TIMEOUT, _DEFAULT_STREAM_RECONNECT_WAIT_SEC
+from mastodon.defaults import _DEFAULT_STREAM_TIMEOUT, _DEFAULT_STREAM_RECONNECT_WAIT_SEC, _DEFAULT_STREAM_MAX_RECONNECT_WAIT_SEC
+from mastodon.compat import IMPL_HAS_WEBSOCKET, websocket
+from mastodon.compat import urlparse
+from mastodon.streaming import MultiplexedStream
+from mastodon.streaming_hub import StreamHub
 from mastodon.utility import api_version
 
 from mastodon.internals import Mastodon as Internals
@@ -14,20 +19,36 @@ class Mastodon(Internals):
     # Streaming
     ###
     @api_version("1.1.0", "1.4.2")
-    def stream_user(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC):
+    def stream_user(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                    backfill=False, heartbeat_timeout=None):
         """
         Streams events that are relevant to the authorized user, i.e. home
         timeline and notifications.
+
+        Set `backfill` to True to fetch statuses and notifications that were missed
+        while reconnecting from the home timeline and notifications endpoints. Since this
+        happens on reconnects, it requires `run_async` and `reconnect_async`.
         """
-        return self.__stream('/api/v1/streaming/user', listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
+        backfill_funcs = None
+        if backfill:
+            backfill_funcs = {
+                "update": lambda min_id: self.timeline_home(min_id=min_id),
+                "notification": lambda min_id: self.notifications(min_id=min_id),
+            }
+        return self.__stream('/api/v1/streaming/user', listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec,
+                             backfill_funcs=backfill_funcs, heartbeat_timeout=heartbeat_timeout)
 
     @api_version("1.1.0", "1.4.2")
-    def stream_public(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC, local=False, remote=False):
+    def stream_public(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC, local=False, remote=False,
+                      backfill=False, heartbeat_timeout=None):
         """
         Streams public events.
 
         Set `local` to True to only get local statuses.
         Set `remote` to True to only get remote statuses.
+
+        Set `backfill` to True to fetch statuses that were missed while reconnecting
+        from the public timeline endpoint. Requires `run_async` and `reconnect_async`.
         """
         if not self.timeline_is_available("public", local=local, remote=remote, with_auth=self.access_token is not None, fail_hard=False):
             warnings.warn(
@@ -42,25 +63,35 @@ class Mastodon(Internals):
             if local:
                 raise MastodonIllegalArgumentError("Cannot pass both local and remote - use either one or the other.")
             base += '/remote'
-        return self.__stream(base, listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
+        backfill_funcs = None
+        if backfill:
+            backfill_funcs = {"update": lambda min_id: self.timeline_public(min_id=min_id, local=local, remote=remote)}
+        return self.__stream(base, listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec,
+                             backfill_funcs=backfill_funcs, heartbeat_timeout=heartbeat_timeout)
 
     @api_version("1.1.0", "1.4.2")
-    def stream_local(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC):
+    def stream_local(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                     backfill=False, heartbeat_timeout=None):
         """
         Streams local public events.
 
         This function is deprecated. Please use stream_public() with parameter `local` set to True instead.
         """
         #return self.__stream('/api/v1/streaming/public/local', listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
-        return self.stream_public(listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec, local=True)
+        return self.stream_public(listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec, local=True,
+                                  backfill=backfill, heartbeat_timeout=heartbeat_timeout)
 
     @api_version("1.1.0", "1.4.2")
-    def stream_hashtag(self, tag, listener, local=False, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC):
+    def stream_hashtag(self, tag, listener, local=False, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                       backfill=False, heartbeat_timeout=None):
         """
         Stream for all public statuses for the hashtag 'tag' seen by the connected
         instance.
 
         Set `local` to True to only get local statuses.
+
+        Set `backfill` to True to fetch statuses that were missed while reconnecting
+        from the hashtag timeline endpoint. Requires `run_async` and `reconnect_async`.
         """
         if tag.startswith("#"):
             raise MastodonIllegalArgumentError("Tag parameter should omit leading #")
@@ -74,23 +105,101 @@ class Mastodon(Internals):
         base = '/api/v1/streaming/hashtag'
         if local:
             base += '/local'
-        return self.__stream(f"{base}?tag={tag}", listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
+        backfill_funcs = None
+        if backfill:
+            backfill_funcs = {"update": lambda min_id: self.timeline_hashtag(tag, min_id=min_id, local=local)}
+        return self.__stream(f"{base}?tag={tag}", listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec,
+                             backfill_funcs=backfill_funcs, heartbeat_timeout=heartbeat_timeout)
 
     @api_version("2.1.0", "2.1.0")
-    def stream_list(self, id, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC):
+    def stream_list(self, id, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                    backfill=False, heartbeat_timeout=None):
         """
         Stream events for the current user, restricted to accounts on the given
         list.
+
+        Set `backfill` to True to fetch statuses that were missed while reconnecting
+        from the list timeline endpoint. Requires `run_async` and `reconnect_async`.
         """
         id = self.__unpack_id(id)
-        return self.__stream(f"/api/v1/streaming/list?list={id}", listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
+        backfill_funcs = None
+        if backfill:
+            backfill_funcs = {"update": lambda min_id: self.timeline_list(id, min_id=min_id)}
+        return self.__stream(f"/api/v1/streaming/list?list={id}", listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec,
+                             backfill_funcs=backfill_funcs, heartbeat_timeout=heartbeat_timeout)
 
     @api_version("2.6.0", "2.6.0")
-    def stream_direct(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC):
+    def stream_direct(self, listener, run_async=False, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                      heartbeat_timeout=None):
         """
         Streams direct message events for the logged-in user, as conversation events.
         """
-        return self.__stream('/api/v1/streaming/direct', listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
+        return self.__stream('/api/v1/streaming/direct', listener, run_async=run_async, timeout=timeout, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec,
+                             heartbeat_timeout=heartbeat_timeout)
+
+    @api_version("3.3.0", "3.3.0")
+    def stream_multiplexed(self, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async=False, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC) -> MultiplexedStream:
+        """
+        Open a single WebSocket connection to the streaming API that any number of streams can be multiplexed
+        over, instead of one HTTP connection (and thread) per stream. Returns a :class:`MultiplexedStream`
+        handle: Use its `subscribe()` method to subscribe listeners to streams, e.g.
+        `handle.subscribe(listener, "hashtag", tag="cats")`.
+
+        The connection is always handled on a background thread. `timeout` is the number of seconds without
+        any message from the server after which the connection is considered dead. `reconnect_async` and
+        `reconnect_async_wait_sec` work as for the other streaming functions, and all streams are subscribed
+        to again after reconnecting.
+
+        Requires the optional websocket-client dependency.
+        """
+        if not IMPL_HAS_WEBSOCKET:
+            raise NotImplementedError(
+                'To use multiplexed streaming, please install the websocket-client Python module.')
+
+        parse = urlparse(self.__get_streaming_base())
+        scheme = "wss" if parse.scheme == "https" else "ws"
+        url = f"{scheme}://{parse.netloc}{parse.path.rstrip('/')}/api/v1/streaming"
+
+        def connect_func():
+            headers = []
+            if self.access_token:
+                headers.append("Authorization: Bearer " + self.access_token)
+            if self.user_agent:
+                headers.append("User-Agent: " + self.user_agent)
+            return websocket.create_connection(url, header=headers, timeout=timeout)
+
+        handle = MultiplexedStream(connect_func, reconnect_async=reconnect_async, reconnect_async_wait_sec=reconnect_async_wait_sec)
+        t = threading.Thread(args=(), target=handle._threadproc)
+        t.daemon = True
+        t.start()
+        return handle
+
+    @api_version("1.1.0", "2.1.0")
+    def stream_hub(self, timeout=_DEFAULT_STREAM_TIMEOUT, reconnect_async_wait_sec=_DEFAULT_STREAM_RECONNECT_WAIT_SEC,
+                   max_reconnect_wait_sec=_DEFAULT_STREAM_MAX_RECONNECT_WAIT_SEC) -> StreamHub:
+        """
+        Start a :class:`StreamHub`, which runs any number of regular HTTP streams on one background thread,
+        instead of one thread per stream as `run_async` does. Use its `subscribe()` method to add streams,
+        e.g. `hub.subscribe(listener, "hashtag", tag="cats")`, and `close_all()` to stop everything.
+
+        Streams reconnect on their own after errors, waiting `reconnect_async_wait_sec` at first and then
+        exponentially longer, up to `max_reconnect_wait_sec`. A stream that receives nothing for `timeout`
+        seconds is reconnected.
+
+        The hub makes its own connections, so proxy settings and adapters of the requests session are not used.
+        If you need those, or a single connection is fine, use `stream_multiplexed()` instead.
+        """
+        headers = {}
+        if self.access_token:
+            headers["Authorization"] = "Bearer " + self.access_token
+        if self.user_agent:
+            headers["User-Agent"] = self.user_agent
+        hub = StreamHub(self.__get_streaming_base(), headers, timeout=timeout, connect_timeout=self.request_timeout,
+                        reconnect_async_wait_sec=reconnect_async_wait_sec, max_reconnect_wait_sec=max_reconnect_wait_sec)
+        t = threading.Thread(args=(), target=hub._threadproc)
+        t.daemon = True
+        t.start()
+        return hub
 
     @api_version("2.5.0", "2.5.0")
     def stream_healthy(self) -> bool:
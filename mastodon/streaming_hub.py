@@ -0,0 +1,435 @@
+# streaming_hub.py - many HTTP SSE streams on a single thread
+
+import selectors
+import socket
+import ssl
+import threading
+import time
+import copy
+from urllib.parse import urlencode
+
+from mastodon.compat import urlparse
+from mastodon.errors import MastodonNetworkError, MastodonMalformedEventError, MastodonReadTimeout
+from mastodon.streaming import StreamListener, _stream_key
+from mastodon.return_types import AttribAccessDict, IdType
+
+from typing import Optional, Dict, Tuple
+
+class _ChunkedDecoder(object):
+    """
+    Incremental decoder for HTTP chunked transfer encoding.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.remaining = None
+        self.done = False
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        decoded = bytearray()
+        while not self.done:
+            if self.remaining is None:
+                # Waiting for a chunk size line
+                line_end = self.buffer.find(b"\r\n")
+                if line_end < 0:
+                    break
+                size_line = bytes(self.buffer[:line_end]).split(b";")[0].strip()
+                del self.buffer[:line_end + 2]
+                try:
+                    self.remaining = int(size_line, 16)
+                except ValueError:
+                    raise MastodonMalformedEventError("Malformed chunk size", size_line)
+                if self.remaining == 0:
+                    self.done = True
+            elif self.remaining > 0:
+                take = min(self.remaining, len(self.buffer))
+                if take == 0:
+                    break
+                decoded.extend(self.buffer[:take])
+                del self.buffer[:take]
+                self.remaining -= take
+            else:
+                # End of chunk, skip the CRLF after it
+                if len(self.buffer) < 2:
+                    break
+                del self.buffer[:2]
+                self.remaining = None
+        return bytes(decoded)
+
+class _HubStream(object):
+    """
+    State of one stream in a StreamHub.
+    """
+    def __init__(self, key, listener, path):
+        self.key = key
+        self.listener = listener
+        self.path = path
+        self.sock = None
+        self.state = "waiting"
+        self.next_attempt = 0.0
+        self.backoff = None
+        self.last_data = None
+        self.metrics = {
+            "connects": 0,
+            "reconnects": 0,
+            "errors": 0,
+            "events": 0,
+            "heartbeats": 0,
+            "bytes_received": 0,
+            "last_event_at": None,
+            "last_error": None,
+        }
+        self.reset_connection()
+
+    def reset_connection(self):
+        self.header_buffer = bytearray()
+        self.headers_done = False
+        self.decoder = None
+        self.line_buffer = bytearray()
+        self.event = {}
+
+class StreamHub(object):
+    """
+    Runs many HTTP (SSE) streams on a single thread, as returned by :ref:`stream_hub() <stream_hub()>`.
+
+    Streams are added with `subscribe()` and removed with `unsubscribe()`, using the same stream names as
+    :class:`MultiplexedStream`. Every stream has its own connection and reconnects on its own after errors,
+    with exponential backoff starting at `reconnect_async_wait_sec` and capped at `max_reconnect_wait_sec`.
+    A stream that receives nothing (not even a heartbeat, which Mastodon sends every 15 seconds) for
+    `timeout` seconds is considered dead and reconnected. Listeners are informed about all errors via
+    `on_abort`, but streams keep running until they are unsubscribed or `close_all()` is called. An
+    exception raised by a listener callback is passed to that listener's `on_abort` and does not affect
+    the other streams.
+
+    Connections are established on short-lived worker threads, so a slow or unreachable server does not
+    block streams that are already connected. Listener callbacks are called on the hub thread, so a slow
+    handler holds up all streams.
+    """
+    def __init__(self, base_url, headers, timeout=300, connect_timeout=300, reconnect_async_wait_sec=5, max_reconnect_wait_sec=300):
+        parse = urlparse(base_url)
+        self.scheme = parse.scheme
+        self.host = parse.hostname
+        self.port = parse.port or (443 if parse.scheme == "https" else 80)
+        host_header = "[" + self.host + "]" if ":" in self.host else self.host
+        if self.port != (443 if parse.scheme == "https" else 80):
+            host_header += f":{self.port}"
+        self.host_header = host_header
+        self.base_path = parse.path.rstrip("/")
+        self.headers = headers
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.reconnect_async_wait_sec = reconnect_async_wait_sec
+        self.max_reconnect_wait_sec = max_reconnect_wait_sec
+        self.closed = False
+        self.streams = {}
+        self._commands = []
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_receive, self._wakeup_send = socket.socketpair()
+        self._wakeup_receive.setblocking(False)
+        self._selector.register(self._wakeup_receive, selectors.EVENT_READ, None)
+        self._thread = None
+        self._finished = False
+
+    ###
+    # Public interface
+    ###
+    def subscribe(self, listener: StreamListener, stream: str, tag: Optional[str] = None, list: Optional[IdType] = None):
+        """
+        Subscribe `listener` to a stream, opening a new connection for it. Stream names are as in
+        :ref:`MultiplexedStream.subscribe() <MultiplexedStream.subscribe()>`.
+
+        Subscribing to the same stream again replaces the listener.
+        """
+        key = _stream_key(stream, tag, list)
+        self.__command(("subscribe", key, listener))
+
+    def unsubscribe(self, stream: str, tag: Optional[str] = None, list: Optional[IdType] = None):
+        """
+        Unsubscribe from a stream and close its connection.
+        """
+        key = _stream_key(stream, tag, list)
+        self.__command(("unsubscribe", key, None))
+
+    def close_all(self):
+        """
+        Close all connections and stop the hub thread.
+        """
+        self.closed = True
+        self.__wakeup()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_receiving(self, stream: str, tag: Optional[str] = None, list: Optional[IdType] = None) -> bool:
+        """
+        Returns True if the given stream is currently connected.
+        """
+        hub_stream = self.streams.get(_stream_key(stream, tag, list))
+        return self.is_alive() and hub_stream is not None and hub_stream.state == "connected"
+
+    def metrics(self) -> Dict[Tuple[str, ...], AttribAccessDict]:
+        """
+        Returns statistics for every stream, keyed by the stream (as a tuple like ("hashtag", "cats")):
+        The current `state` ("connecting", "connected" or "waiting" to reconnect), the number of `connects`,
+        `reconnects` and `errors`, the number of `events` and `heartbeats` and `bytes_received`, and the
+        time of the last event (`last_event_at`, as a unix timestamp) and the last error (`last_error`).
+        """
+        result = {}
+        for key, hub_stream in list(self.streams.items()):
+            stream_metrics = AttribAccessDict(**copy.copy(hub_stream.metrics))
+            stream_metrics["state"] = hub_stream.state
+            result[key] = stream_metrics
+        return result
+
+    ###
+    # Hub thread
+    ###
+    def __wakeup(self):
+        try:
+            self._wakeup_send.send(b"\0")
+        except OSError:
+            pass
+
+    def __command(self, command):
+        with self._lock:
+            self._commands.append(command)
+        self.__wakeup()
+
+    def __process_commands(self):
+        with self._lock:
+            commands = self._commands
+            self._commands = []
+        for command, key, listener in commands:
+            if command == "connected":
+                self.__connected(key, *listener)
+            elif command == "subscribe":
+                if key in self.streams:
+                    self.streams[key].listener = listener
+                else:
+                    self.streams[key] = _HubStream(key, listener, self.__stream_path(key))
+            elif key in self.streams:
+                self.__disconnect(self.streams[key])
+                del self.streams[key]
+
+    def __stream_path(self, key):
+        path = self.base_path + "/api/v1/streaming/" + key[0].replace(":", "/")
+        if key[0] in ("hashtag", "hashtag:local"):
+            path += "?" + urlencode({"tag": key[1]})
+        elif key[0] == "list":
+            path += "?" + urlencode({"list": key[1]})
+        return path
+
+    def __connect(self, hub_stream):
+        """
+        Start connecting a stream. Name resolution, the TCP and TLS handshakes and sending the request all
+        block, so they happen on a worker thread, which hands the result back as a "connected" command.
+        """
+        hub_stream.state = "connecting"
+        hub_stream.reset_connection()
+        worker = threading.Thread(target=self.__connect_worker, args=(hub_stream,), daemon=True)
+        worker.start()
+
+    def __connect_worker(self, hub_stream):
+        sock = None
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            if self.scheme == "https":
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+            request = f"GET {hub_stream.path} HTTP/1.1\r\nHost: {self.host_header}\r\nAccept: text/event-stream\r\n"
+            for header, value in self.headers.items():
+                request += f"{header}: {value}\r\n"
+            sock.sendall((request + "\r\n").encode("utf-8"))
+            sock.setblocking(False)
+            result = sock
+        except (OSError, ssl.SSLError) as e:
+            if sock is not None:
+                sock.close()
+            result = MastodonNetworkError(f"Could not connect to streaming server: {e}")
+        with self._lock:
+            if not self._finished:
+                self._commands.append(("connected", hub_stream.key, (hub_stream, result)))
+                result = None
+        if result is None:
+            self.__wakeup()
+        elif not isinstance(result, Exception):
+            # Hub has shut down in the meantime
+            result.close()
+
+    def __connected(self, key, hub_stream, result):
+        if self.streams.get(key) is not hub_stream or hub_stream.state != "connecting" or hub_stream.sock is not None:
+            # Unsubscribed (or resubscribed) while connecting
+            if not isinstance(result, Exception):
+                result.close()
+            return
+        if isinstance(result, Exception):
+            self.__fail(hub_stream, result)
+            return
+        hub_stream.sock = result
+        hub_stream.last_data = time.monotonic()
+        self._selector.register(result, selectors.EVENT_READ, hub_stream)
+
+    def __disconnect(self, hub_stream):
+        if hub_stream.sock is not None:
+            try:
+                self._selector.unregister(hub_stream.sock)
+            except (KeyError, ValueError):
+                pass
+            try:
+                hub_stream.sock.close()
+            except OSError:
+                pass
+            hub_stream.sock = None
+
+    def __fail(self, hub_stream, exception, notify_listener=True):
+        self.__disconnect(hub_stream)
+        if hub_stream.backoff is None:
+            hub_stream.backoff = self.reconnect_async_wait_sec
+        else:
+            hub_stream.backoff = min(hub_stream.backoff * 2, self.max_reconnect_wait_sec)
+        hub_stream.state = "waiting"
+        hub_stream.next_attempt = time.monotonic() + hub_stream.backoff
+        hub_stream.metrics["errors"] += 1
+        hub_stream.metrics["last_error"] = str(exception)
+        if notify_listener:
+            self.__notify_abort(hub_stream, exception)
+
+    def __notify_abort(self, hub_stream, exception):
+        # Whatever on_abort raises must not take the other streams down with it
+        try:
+            hub_stream.listener.on_abort(exception)
+        except Exception:
+            pass
+
+    def __listener_error(self, hub_stream, exception):
+        hub_stream.metrics["errors"] += 1
+        hub_stream.metrics["last_error"] = str(exception)
+        self.__notify_abort(hub_stream, exception)
+
+    def __read(self, hub_stream):
+        while hub_stream.sock is not None:
+            try:
+                data = hub_stream.sock.recv(65536)
+            except (BlockingIOError, ssl.SSLWantReadError):
+                return
+            except (OSError, ssl.SSLError) as e:
+                self.__fail(hub_stream, MastodonNetworkError(f"Requests reports connection error: {e}"))
+                return
+            if not data:
+                self.__fail(hub_stream, MastodonNetworkError("Server ceased communication."))
+                return
+            hub_stream.metrics["bytes_received"] += len(data)
+            hub_stream.last_data = time.monotonic()
+            try:
+                self.__handle_data(hub_stream, data)
+            except MastodonMalformedEventError as e:
+                # Listener has already been told via on_abort, just reconnect
+                self.__fail(hub_stream, e, notify_listener=False)
+                return
+
+    def __handle_data(self, hub_stream, data):
+        if not hub_stream.headers_done:
+            hub_stream.header_buffer.extend(data)
+            header_end = hub_stream.header_buffer.find(b"\r\n\r\n")
+            if header_end < 0:
+                return
+            header_lines = bytes(hub_stream.header_buffer[:header_end]).decode("latin-1").split("\r\n")
+            data = bytes(hub_stream.header_buffer[header_end + 4:])
+            status = header_lines[0].split(" ", 2)
+            if len(status) < 2 or status[1] != "200":
+                self.__fail(hub_stream, MastodonNetworkError(f"Could not connect to streaming server: {header_lines[0]}"))
+                return
+            for header_line in header_lines[1:]:
+                name, _, value = header_line.partition(":")
+                if name.strip().lower() == "transfer-encoding" and "chunked" in value.lower():
+                    hub_stream.decoder = _ChunkedDecoder()
+            hub_stream.headers_done = True
+            hub_stream.state = "connected"
+            hub_stream.backoff = None
+            if hub_stream.metrics["connects"] > 0:
+                hub_stream.metrics["reconnects"] += 1
+            hub_stream.metrics["connects"] += 1
+
+        if hub_stream.decoder is not None:
+            data = hub_stream.decoder.feed(data)
+        self.__handle_sse(hub_stream, data)
+        if hub_stream.decoder is not None and hub_stream.decoder.done:
+            self.__fail(hub_stream, MastodonNetworkError("Server ceased communication."))
+
+    def __handle_sse(self, hub_stream, data):
+        hub_stream.line_buffer.extend(data)
+        listener = hub_stream.listener
+        while hub_stream.sock is not None:
+            line_end = hub_stream.line_buffer.find(b"\n")
+            if line_end < 0:
+                return
+            line = bytes(hub_stream.line_buffer[:line_end])
+            del hub_stream.line_buffer[:line_end + 1]
+            try:
+                line = line.decode("utf-8")
+            except UnicodeDecodeError as err:
+                exception = MastodonMalformedEventError("Malformed UTF-8")
+                self.__notify_abort(hub_stream, exception)
+                raise exception from err
+            if line == "":
+                if hub_stream.event:
+                    hub_stream.metrics["events"] += 1
+                    hub_stream.metrics["last_event_at"] = time.time()
+                event = hub_stream.event
+                hub_stream.event = {}
+                try:
+                    listener._dispatch(event)
+                except MastodonMalformedEventError:
+                    raise
+                except Exception as e:
+                    # A failing handler only affects its own stream, which keeps running
+                    self.__listener_error(hub_stream, e)
+            else:
+                if line.startswith(":"):
+                    hub_stream.metrics["heartbeats"] += 1
+                hub_stream.event = listener._parse_line(line, hub_stream.event)
+
+    def _threadproc(self):
+        self._thread = threading.current_thread()
+        try:
+            while not self.closed:
+                self.__process_commands()
+
+                # Connect what needs connecting, and find streams that have gone quiet
+                now = time.monotonic()
+                select_timeout = 1.0
+                for hub_stream in list(self.streams.values()):
+                    if hub_stream.state == "waiting":
+                        if now >= hub_stream.next_attempt:
+                            self.__connect(hub_stream)
+                        else:
+                            select_timeout = min(select_timeout, hub_stream.next_attempt - now)
+                    elif hub_stream.sock is not None and now - hub_stream.last_data > self.timeout:
+                        self.__fail(hub_stream, MastodonReadTimeout("Timed out while reading from server."))
+                if self.closed:
+                    break
+
+                for selector_key, _ in self._selector.select(timeout=max(select_timeout, 0.0)):
+                    if selector_key.data is None:
+                        try:
+                            while self._wakeup_receive.recv(4096):
+                                pass
+                        except BlockingIOError:
+                            pass
+                    elif not self.closed:
+                        self.__read(selector_key.data)
+        finally:
+            with self._lock:
+                self._finished = True
+                commands = self._commands
+                self._commands = []
+            for command, key, result in commands:
+                if command == "connected" and not isinstance(result[1], Exception):
+                    result[1].close()
+            for hub_stream in list(self.streams.values()):
+                self.__disconnect(hub_stream)
+                hub_stream.state = "closed"
+            self._selector.close()
+            self._wakeup_receive.close()
+            self._wakeup_send.close()
+        return 0
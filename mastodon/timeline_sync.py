@@ -0,0 +1,313 @@
+"""
+Keeping a local copy of a timeline in sync with the server.
+"""
+
+import sqlite3
+import threading
+
+from mastodon.errors import MastodonIllegalArgumentError
+from mastodon.defaults import _MAX_TIMELINE_PAGE_SIZE
+from mastodon.streaming import StreamListener, _id_sort_key as _sort_key
+from mastodon.return_types import Status, IdType
+from mastodon.types_base import Entity
+
+from typing import Optional, List, Tuple, Union
+
+class TimelineStore(object):
+    """
+    Storage backend interface for :class:`TimelineSync`. Subclass this and implement all the
+    methods to store timelines somewhere other than in SQLite.
+
+    Stores have to be safe to use from multiple threads, since updates from the streaming
+    API arrive on the stream's thread.
+    """
+    def add_statuses(self, statuses: List[Status]):
+        """Insert the given statuses, replacing any that are already stored."""
+        raise NotImplementedError
+
+    def update_status(self, status: Status):
+        """Replace a stored status with an edited version. Does nothing if the status is not stored."""
+        raise NotImplementedError
+
+    def remove_status(self, id: IdType):
+        """Remove the status with the given id, if it is stored."""
+        raise NotImplementedError
+
+    def get_status(self, id: IdType) -> Optional[Status]:
+        """Return the stored status with the given id, or None."""
+        raise NotImplementedError
+
+    def get_statuses(self, limit: Optional[int] = None, max_id: Optional[IdType] = None, min_id: Optional[IdType] = None) -> List[Status]:
+        """Return stored statuses, newest first, with ids strictly between `min_id` and `max_id`."""
+        raise NotImplementedError
+
+    def get_gaps(self) -> List[Tuple[IdType, IdType]]:
+        """Return all known gaps as (older_id, newer_id) tuples, newest first."""
+        raise NotImplementedError
+
+    def add_gap(self, older_id: IdType, newer_id: IdType):
+        """Record that statuses between `older_id` and `newer_id` (exclusive) are possibly missing."""
+        raise NotImplementedError
+
+    def remove_gap(self, older_id: IdType, newer_id: IdType):
+        """Remove a gap previously added with add_gap."""
+        raise NotImplementedError
+
+    def get_value(self, key: str) -> Optional[str]:
+        """Return a stored bookkeeping value, or None."""
+        raise NotImplementedError
+
+    def set_value(self, key: str, value: Optional[str]):
+        """Store a bookkeeping value."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the store."""
+        pass
+
+class SQLiteTimelineStore(TimelineStore):
+    """
+    Default :class:`TimelineStore`, keeps statuses (serialized with `to_json`) in an SQLite
+    database at `path`. The default, ":memory:", keeps everything in memory only.
+    """
+    def __init__(self, path: str = ":memory:"):
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path, check_same_thread=False)
+        with self.__lock, self.__db:
+            self.__db.execute("CREATE TABLE IF NOT EXISTS statuses (sort_key TEXT PRIMARY KEY, id TEXT NOT NULL, data TEXT NOT NULL)")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS gaps (older_id TEXT NOT NULL, newer_id TEXT NOT NULL, PRIMARY KEY (older_id, newer_id))")
+            self.__db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def add_statuses(self, statuses):
+        rows = [(_sort_key(status.id), str(status.id), status.to_json(pretty=False)) for status in statuses]
+        with self.__lock, self.__db:
+            self.__db.executemany("INSERT OR REPLACE INTO statuses (sort_key, id, data) VALUES (?, ?, ?)", rows)
+
+    def update_status(self, status):
+        with self.__lock, self.__db:
+            self.__db.execute("UPDATE statuses SET data = ? WHERE sort_key = ?", (status.to_json(pretty=False), _sort_key(status.id)))
+
+    def remove_status(self, id):
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM statuses WHERE sort_key = ?", (_sort_key(id),))
+
+    def get_status(self, id):
+        with self.__lock:
+            row = self.__db.execute("SELECT data FROM statuses WHERE sort_key = ?", (_sort_key(id),)).fetchone()
+        if row is None:
+            return None
+        return Entity.from_json(row[0])
+
+    def get_statuses(self, limit=None, max_id=None, min_id=None):
+        query = "SELECT data FROM statuses WHERE 1 = 1"
+        params = []
+        if max_id is not None:
+            query += " AND sort_key < ?"
+            params.append(_sort_key(max_id))
+        if min_id is not None:
+            query += " AND sort_key > ?"
+            params.append(_sort_key(min_id))
+        query += " ORDER BY sort_key DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        with self.__lock:
+            rows = self.__db.execute(query, params).fetchall()
+        return [Entity.from_json(row[0]) for row in rows]
+
+    def get_gaps(self):
+        with self.__lock:
+            rows = self.__db.execute("SELECT older_id, newer_id FROM gaps").fetchall()
+        return sorted(rows, key=lambda gap: _sort_key(gap[1]), reverse=True)
+
+    def add_gap(self, older_id, newer_id):
+        with self.__lock, self.__db:
+            self.__db.execute("INSERT OR IGNORE INTO gaps (older_id, newer_id) VALUES (?, ?)", (str(older_id), str(newer_id)))
+
+    def remove_gap(self, older_id, newer_id):
+        with self.__lock, self.__db:
+            self.__db.execute("DELETE FROM gaps WHERE older_id = ? AND newer_id = ?", (str(older_id), str(newer_id)))
+
+    def get_value(self, key):
+        with self.__lock:
+            row = self.__db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def set_value(self, key, value):
+        with self.__lock, self.__db:
+            self.__db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+class TimelineSync(StreamListener):
+    """
+    Keeps a local copy of a timeline (by default, the home timeline) in a :class:`TimelineStore`,
+    so that reads don't need to go to the network, and only new statuses need to be fetched.
+
+    Call `sync()` to fetch everything that is new since the last sync. If more statuses arrived since
+    then than fit into one page, the part that wasn't fetched is recorded as a gap, which `fill_gaps()`
+    (called by `sync()` by default) then fetches page by page, going backwards in time.
+
+    `TimelineSync` is also a :class:`StreamListener`: Pass it to the matching stream function (e.g.
+    `stream_user()` for the home timeline) and new, deleted and edited statuses are applied to the store
+    as they happen. Statuses from the stream don't count as synced, so calling `sync()` after a stream
+    was interrupted will still find anything that was missed in the meantime.
+
+    `store` can be a :class:`TimelineStore` or the path of an SQLite database to use. `timeline`
+    is as in `timeline()`. `page_size` is the number of statuses requested per page. Servers silently
+    return at most 40 statuses per page, so larger values are reduced to that.
+    """
+    def __init__(self, api, store: Union[TimelineStore, str] = ":memory:", timeline: str = "home", page_size: int = 40):
+        super(TimelineSync, self).__init__()
+        if isinstance(store, str):
+            store = SQLiteTimelineStore(store)
+        self.api = api
+        self.store = store
+        self.timeline = timeline
+        self.page_size = min(page_size, _MAX_TIMELINE_PAGE_SIZE)
+        self.__sync_lock = threading.Lock()
+
+    def sync(self, fill_gaps: bool = True, max_gap_pages: Optional[int] = None) -> List[Status]:
+        """
+        Fetch the statuses that were posted since the last sync (or, on the first sync, the most recent page
+        of statuses) and add them to the store. If `fill_gaps` is set, `fill_gaps()` is called afterwards
+        with `max_gap_pages`.
+
+        Returns the newly fetched statuses, newest first (not including those fetched while filling gaps).
+
+        For the home timeline, this also forgets the read marker, so that `unread()` fetches it again.
+        """
+        with self.__sync_lock:
+            sync_position = self.store.get_value("sync_position")
+            new_statuses = self.api.timeline(self.timeline, since_id=sync_position, limit=self.page_size)
+            if len(new_statuses) > 0:
+                self.store.add_statuses(new_statuses)
+                newest_id = max((status.id for status in new_statuses), key=_sort_key)
+                oldest_id = min((status.id for status in new_statuses), key=_sort_key)
+
+                # There may be more statuses between the last sync and this page if the page is full, or if
+                # the server says there is a next page (which it may do even for pages shorter than asked for)
+                page_full = len(new_statuses) >= self.page_size
+                has_next = getattr(new_statuses, "_pagination_next", None) is not None
+                if sync_position is not None and (page_full or has_next):
+                    self.store.add_gap(sync_position, oldest_id)
+                self.store.set_value("sync_position", str(newest_id))
+            if self.timeline == "home":
+                self.store.set_value("last_read_id", None)
+        if fill_gaps:
+            self.fill_gaps(max_pages=max_gap_pages)
+        return new_statuses
+
+    def fill_gaps(self, max_pages: Optional[int] = None) -> int:
+        """
+        Fetch the statuses that are missing from the store because they were posted while more statuses than
+        fit into one page came in between two syncs. Works on the newest gap first, and stops after `max_pages`
+        requests if that is set (leaving the rest of the gaps to be filled later).
+
+        Returns the number of statuses that were added.
+        """
+        pages = 0
+        added = 0
+        for older_id, newer_id in self.store.get_gaps():
+            page = None
+            while True:
+                if max_pages is not None and pages >= max_pages:
+                    return added
+                if page is None:
+                    page = self.api.timeline(self.timeline, max_id=newer_id, limit=self.page_size)
+                else:
+                    page = self.api.fetch_next(page)
+                pages += 1
+                if page is None:
+                    page = []
+                in_gap = [status for status in page if _sort_key(status.id) > _sort_key(older_id)]
+                self.store.add_statuses(in_gap)
+                added += len(in_gap)
+
+                # Gap is closed once we reach its older end or run out of statuses, otherwise it shrinks
+                self.store.remove_gap(older_id, newer_id)
+                if len(in_gap) == 0 or len(in_gap) < len(page):
+                    break
+                newer_id = min((status.id for status in in_gap), key=_sort_key)
+                self.store.add_gap(older_id, newer_id)
+        return added
+
+    def gaps(self) -> List[Tuple[IdType, IdType]]:
+        """
+        Return the ranges of the timeline that are known to be missing from the store, as (older_id, newer_id)
+        tuples, newest first. Statuses with ids strictly between the two ids may be missing.
+        """
+        return self.store.get_gaps()
+
+    def statuses(self, limit: Optional[int] = 20, max_id: Optional[Union[Status, IdType]] = None, min_id: Optional[Union[Status, IdType]] = None) -> List[Status]:
+        """
+        Read statuses from the store, newest first, without going to the network. `max_id` and `min_id`
+        work as in `timeline()`. Set `limit` to None to read everything.
+        """
+        if isinstance(max_id, dict):
+            max_id = max_id["id"]
+        if isinstance(min_id, dict):
+            min_id = min_id["id"]
+        return self.store.get_statuses(limit=limit, max_id=max_id, min_id=min_id)
+
+    def status(self, id: Union[Status, IdType]) -> Optional[Status]:
+        """
+        Read a single status from the store, or return None if it is not stored.
+        """
+        if isinstance(id, dict):
+            id = id["id"]
+        return self.store.get_status(id)
+
+    def unread(self, limit: Optional[int] = None) -> List[Status]:
+        """
+        Read the statuses in the store that are newer than the timeline's read marker, newest first.
+        Only the home timeline has a read marker. The marker is fetched from the server on the first call
+        after every `sync()` (so that marking statuses read in other apps is picked up) and remembered in
+        between, `mark_read()` updates it.
+        """
+        if self.timeline != "home":
+            raise MastodonIllegalArgumentError("Only the home timeline has a read marker")
+        last_read_id = self.store.get_value("last_read_id")
+        if last_read_id is None:
+            markers = self.api.markers_get("home")
+            if "home" in markers:
+                last_read_id = str(markers["home"].last_read_id)
+                self.store.set_value("last_read_id", last_read_id)
+        return self.store.get_statuses(limit=limit, min_id=last_read_id)
+
+    def mark_read(self, id: Optional[Union[Status, IdType]] = None):
+        """
+        Set the read marker of the home timeline to the status with the given id, or to the newest
+        status in the store if no id is given.
+        """
+        if self.timeline != "home":
+            raise MastodonIllegalArgumentError("Only the home timeline has a read marker")
+        if id is None:
+            newest = self.store.get_statuses(limit=1)
+            if len(newest) == 0:
+                return
+            id = newest[0].id
+        if isinstance(id, dict):
+            id = id["id"]
+        self.api.markers_set("home", id)
+        self.store.set_value("last_read_id", str(id))
+
+    def close(self):
+        """
+        Close the underlying store.
+        """
+        self.store.close()
+
+    ###
+    # Streaming API event handlers
+    ###
+    def on_update(self, status):
+        self.store.add_statuses([status])
+
+    def on_delete(self, status_id):
+        self.store.remove_status(status_id)
+
+    def on_status_update(self, status):
+        self.store.update_status(status)
@@ -5,10 +5,14 @@ from datetime import datetime, timezone
 import dateutil
 import dateutil.parser
 from collections import OrderedDict
+from collections.abc import MutableMapping
 from mastodon.compat import PurePath
 import sys
 import json
 import copy
+import functools
+import threading
+from contextlib import contextmanager
 
 # A type representing a file name as a PurePath or string, or a file-like object, for convenience
 PathOrFile = Union[str, PurePath, IO[bytes]]
@@ -54,9 +58,11 @@ This is a breaking change, and I'm sorry about it, but this will make every piec
 of software using Mastodon.py more robust in the long run.
 """
 
+@functools.lru_cache(maxsize=256)
 def _str_to_type(mastopy_type):
     """
-    String name to internal type resolver
+    String name to internal type resolver. Cached, since the same few type names come up over and over
+    (in from_json, and in the pagination and async refresh info).
     """
     # See if we need to parse a sub-type (i.e. [<something>] in the type name
     sub_type = None
@@ -248,6 +254,34 @@ def stringify_type(tp):
     except Exception:
         return str(tp)
 
+@functools.lru_cache(maxsize=1024)
+def _mastopy_type_name(tp):
+    """
+    Name of a type as stored in _mastopy_type, and as understood by _str_to_type. Cached per type, since
+    every cast entity and list gets one.
+    """
+    try:
+        type_name = stringify_type(tp)
+    except Exception:
+        # If the new robust method doesn't work, try the old and less robust method
+        type_name = repr(tp)
+    type_name = type_name.replace("mastodon.return_types.", "").replace("mastodon.types_base.", "")
+    if type_name.startswith("<class '") and type_name.endswith("'>"):
+        type_name = type_name[8:-2]
+    # There are only a few distinct type names, no need to keep a copy in every entity
+    return sys.intern(type_name)
+
+@functools.lru_cache(maxsize=1024)
+def _field_type_hints(cls):
+    """
+    Type hints for the fields of an AttribAccessDict subclass, including those of its constructor. Resolving
+    these is slow, so they are resolved once per class. Raises if they can't be resolved (yet), in which case
+    nothing is cached.
+    """
+    type_hints = get_type_hints(cls)
+    type_hints.update(get_type_hints(cls.__init__))
+    return type_hints
+
 # Function that gets a type class but doesn't break in lower python versions as much
 def get_type_class(typ):
     try:
@@ -272,6 +306,46 @@ def real_issubclass(type1, type2orig):
         valid_types = [type2]
     return issubclass(type1, tuple(valid_types))
 
+# Entity interning: While active (per thread), nested entities of these types that have the exact same
+# content are only cast once, and then shared
+_interning_state = threading.local()
+_interned_types = None
+
+@contextmanager
+def entity_interning(table: Optional[Dict[Any, Any]] = None):
+    """
+    Context manager that, while active, makes casting turn identical :class:`Account`, :class:`CustomEmoji`
+    and :class:`Tag` dicts into one shared object instead of casting each of them separately - e.g. the
+    author of several statuses on a timeline page.
+
+    By default, interning only applies within the block. To share objects across several blocks,
+    pass the same `table`, e.g. a `weakref.WeakValueDictionary` to share them for as long as they are
+    in use.
+
+    Shared objects are the same object wherever they appear, so modifying one modifies it everywhere.
+    """
+    global _interned_types
+    if _interned_types is None:
+        from mastodon.return_types import Account, CustomEmoji, Tag
+        _interned_types = (Account, CustomEmoji, Tag)
+    previous_table = getattr(_interning_state, "table", None)
+    _interning_state.table = table if table is not None else {}
+    try:
+        yield
+    finally:
+        _interning_state.table = previous_table
+
+def _intern_key(t, value):
+    """
+    Returns the interning table key for casting `value` to `t`, or None if it should not be interned.
+    """
+    if getattr(_interning_state, "table", None) is None or t not in _interned_types or not isinstance(value, dict):
+        return None
+    try:
+        return (t, json.dumps(value, sort_keys=True, default=str))
+    except Exception:
+        return None
+
 # Helper functions for typecasting attempts
 def try_cast(t, value, retry = True, union_specializer = None):
     """
@@ -293,9 +367,16 @@ def try_cast(t, value, retry = True, union_specializer = None):
             return value
     try:
         if real_issubclass(t, AttribAccessDict):
+            intern_key = _intern_key(t, value) if union_specializer is None else None
+            if intern_key is not None:
+                interned = _interning_state.table.get(intern_key)
+                if interned is not None:
+                    return interned
             if union_specializer is not None:
                 value["__union_specializer"] = union_specializer
             value = t(**value)
+            if intern_key is not None:
+                _interning_state.table[intern_key] = value
 
             # Did we have type arguments on the dict? If so, we need to try to cast the values
             # This will not work in 3.7 and 3.8, which is unfortunate, but them's the breaks of using
@@ -433,17 +514,13 @@ def try_cast_recurse(t, value, union_specializer=None):
         if real_type is not None and use_real_type:
             save_type = real_type
         try:
-            value._mastopy_type = stringify_type(save_type)
-        except Exception as e:
-            try:
-                # If the new robust method doesn't work, try the old and less robust method
-                value._mastopy_type = repr(save_type)
-            except:
-                # Failures are silently ignored. We care about maximum not breaking here.
-                pass
-        value._mastopy_type = value._mastopy_type.replace("mastodon.return_types.", "").replace("mastodon.types_base.", "")
-        if value._mastopy_type.startswith("<class '") and value._mastopy_type.endswith("'>"):
-            value._mastopy_type = value._mastopy_type[8:-2]
+            type_name = _mastopy_type_name(save_type)
+        except TypeError:
+            # Unhashable type, can't be cached
+            type_name = _mastopy_type_name.__wrapped__(save_type)
+        # Entity classes carry their own name already, only store it on the instance when it differs
+        if getattr(value, "_mastopy_type", None) != type_name:
+            value._mastopy_type = type_name
     return value
 
 class Entity():
@@ -598,12 +675,44 @@ EntityList = Union[NonPaginatableList[T], PaginatableList[T]]
 """Lists in Mastodon.py are either regular or paginatable, so this is a union of
    :class:`NonPaginatableList` and :class:`PaginatableList`."""
 
-try:
-    OrderedStrDict = OrderedDict[str, Any]
-except:
-    OrderedStrDict = OrderedDict
+# Attributes of AttribAccessDict that live on the object rather than in the dict
+_OBJECT_ATTRIBUTES = frozenset(["_AttribAccessDict__union_specializer", "_mastopy_type", "_async_refresh", "_timing"])
+
+# Marker for "no such key", since None is a valid value
+_MISSING = object()
 
-class AttribAccessDict(OrderedStrDict, Entity):
+class _FieldAccessor():
+    """
+    Descriptor for the annotated fields of AttribAccessDict subclasses: reads the field straight
+    from the dict, following the class's _access_map redirect (if any) when the field is unset or None.
+
+    Accessing it on the class raises AttributeError, like for a plain annotation without a default.
+    """
+    __slots__ = ("name", "redirect")
+
+    def __init__(self, name, redirect):
+        self.name = name
+        self.redirect = redirect
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            raise AttributeError(f"Attribute not found: {self.name}")
+        val = dict.get(instance, self.name, _MISSING)
+        if self.redirect is None:
+            if val is _MISSING:
+                raise AttributeError(f"Attribute not found: {self.name}")
+            return val
+        if val is not None and val is not _MISSING:
+            return val
+        try:
+            cur_attr = instance
+            for attr_path_part in self.redirect:
+                cur_attr = getattr(cur_attr, attr_path_part)
+            return cur_attr
+        except:
+            raise AttributeError(f"Attribute not found: {self.name}")
+
+class AttribAccessDict(Dict[str, Any], Entity):
     """
     Base return object class for Mastodon.py.
 
@@ -641,50 +750,52 @@ class AttribAccessDict(OrderedStrDict, Entity):
             if not attr in self:
                 self[attr] = kwargs[attr]
                 
-    def __getattribute__(self, attr):
+    def __init_subclass__(cls, **kwargs):
         """
-        Override to force access of normal attributes to go through __getattr__
+        Installs a _FieldAccessor for every annotated field, so that reading a field is a single
+        descriptor call instead of a trip through __getattribute__ and __getattr__, and sets the
+        class's _mastopy_type, so that instances don't need their own.
         """
-        if attr in ["_AttribAccessDict__union_specializer", "_mastopy_type", "_async_refresh", "__class__"]:
-            return super(AttribAccessDict, self).__getattribute__(attr)
-        if attr in self.__class__.__annotations__:
-            return self.__getattr__(attr)
-        return super(AttribAccessDict, self).__getattribute__(attr)
+        super(AttribAccessDict, cls).__init_subclass__(**kwargs)
+        cls._mastopy_type = _mastopy_type_name(cls)
+        access_map = getattr(cls, "_access_map", {})
+        for attr in cls.__dict__.get("__annotations__", {}):
+            redirect = None
+            if attr in access_map:
+                redirect = tuple(access_map[attr].split('.'))
+            setattr(cls, attr, _FieldAccessor(attr, redirect))
 
     def __getattr__(self, attr):
         """
         Basic attribute getter that throws if attribute is not in dict and supports redirecting access.
-        """        
-        if not hasattr(self.__class__, "_access_map"):
-            # Base case: no redirecting
-            if attr in self:
-                return self[attr]
-            else:
-                return super(AttribAccessDict, self).__getattribute__(attr)
-        else:
-            if attr in self and self[attr] is not None:
-                return self[attr]
-            elif attr in getattr(self.__class__, "_access_map"):
-                try:
-                    attr_path = getattr(self.__class__, "_access_map")[attr].split('.')
-                    cur_attr = self
-                    for attr_path_part in attr_path:
-                        cur_attr = getattr(cur_attr, attr_path_part)
-                    return cur_attr
-                except:
-                    raise AttributeError(f"Attribute not found: {attr}")
-            else:
-                return super(AttribAccessDict, self).__getattribute__(attr)
-            
+
+        Only called for keys that are not annotated fields (those go through _FieldAccessor).
+        """
+        val = dict.get(self, attr, _MISSING)
+        access_map = getattr(self.__class__, "_access_map", None)
+        if val is not _MISSING and (val is not None or access_map is None):
+            return val
+        if access_map is not None and attr in access_map:
+            try:
+                attr_path = access_map[attr].split('.')
+                cur_attr = self
+                for attr_path_part in attr_path:
+                    cur_attr = getattr(cur_attr, attr_path_part)
+                return cur_attr
+            except:
+                raise AttributeError(f"Attribute not found: {attr}")
+        if val is not _MISSING:
+            return val
+        return super(AttribAccessDict, self).__getattribute__(attr)
+
     def __setattr__(self, attr, val):
         """
         Attribute setter that calls through to dict setter but will throw if attribute is not in dict
         """
-        if attr in self or attr in ["_AttribAccessDict__union_specializer", "_mastopy_type", "_async_refresh"]:
-            if attr in ["_mastopy_type", "_async_refresh"]:
-                super(AttribAccessDict, self).__setattr__(attr, val)
-            else:
-                self[attr] = val
+        if attr in _OBJECT_ATTRIBUTES:
+            super(AttribAccessDict, self).__setattr__(attr, val)
+        elif attr in self:
+            self[attr] = val
         else:
             raise AttributeError(f"Attribute not found: {attr}")
 
@@ -698,17 +809,20 @@ class AttribAccessDict(OrderedStrDict, Entity):
         # If we're already an AttribAccessDict subclass, skip all the casting
         if not isinstance(val, AttribAccessDict):
             # Collate type hints that we may have
-            type_hints = {}
-            try:
-                type_hints = get_type_hints(self.__class__)
-            except:
-                pass
-            init_hints = {}
             try:
-                init_hints = get_type_hints(self.__class__.__init__)
+                type_hints = _field_type_hints(self.__class__)
             except:
-                pass
-            type_hints.update(init_hints)
+                type_hints = {}
+                try:
+                    type_hints = get_type_hints(self.__class__)
+                except:
+                    pass
+                init_hints = {}
+                try:
+                    init_hints = get_type_hints(self.__class__.__init__)
+                except:
+                    pass
+                type_hints.update(init_hints)
 
             # Ugly hack: We have to specialize unions by hand because you can't just guess by content generally
             # Note for developers: This means type MUST be set before meta. fortunately, we can enforce this via
@@ -733,14 +847,37 @@ class AttribAccessDict(OrderedStrDict, Entity):
                 elif isinstance(val, list):
                     val = try_cast_recurse(EntityList, val, union_specializer)
 
-        # Finally, call out to setattr and setitem proper
-        super(AttribAccessDict, self).__setattr__(key, val)
+        # Finally, call out to setitem proper. Values are stored only once, in the dict, and attribute access
+        # finds them via __getattr__ - except for keys that a class attribute (like a dict method) would
+        # shadow, which additionally get an instance attribute so that the field still wins.
+        if isinstance(key, str) and hasattr(self.__class__, key):
+            super(AttribAccessDict, self).__setattr__(key, val)
         super(AttribAccessDict, self).__setitem__(key, val)
 
         # Remove union specializer if we have one
         if "_AttribAccessDict__union_specializer" in self:
             del self["_AttribAccessDict__union_specializer"]
 
+    # dict's own update, setdefault, copy and |= don't go through __setitem__, so they would neither cast
+    # values nor keep the entity type. These go through __setitem__, like they did with OrderedDict.
+    update = MutableMapping.update
+    setdefault = MutableMapping.setdefault
+
+    def copy(self):
+        """
+        Shallow copy that keeps the entity type.
+        """
+        copied = self.__class__()
+        for key, val in self.items():
+            copied[key] = val
+        if "_mastopy_type" in self.__dict__:
+            copied._mastopy_type = self._mastopy_type
+        return copied
+
+    def __ior__(self, other):
+        MutableMapping.update(self, other)
+        return self
+
     def __eq__(self, other):
         """
         Equality checker with casting
@@ -748,6 +885,12 @@ class AttribAccessDict(OrderedStrDict, Entity):
         if isinstance(other, self.__class__):
             return super(AttribAccessDict, self).__eq__(other)
         else:
+            # Entities with different (string) ids are never equal, no need to cast for that
+            if isinstance(other, dict):
+                self_id = dict.get(self, "id")
+                other_id = other.get("id")
+                if isinstance(self_id, str) and isinstance(other_id, str) and self_id != other_id:
+                    return False
             try:
                 casted = try_cast_recurse(self.__class__, other)
                 if isinstance(casted, self.__class__):
@@ -758,6 +901,18 @@ class AttribAccessDict(OrderedStrDict, Entity):
                 pass
         return False
 
+    def __hash__(self):
+        """
+        Entities that have an id hash by it, so that they can be put into sets or used as dict keys,
+        e.g. to de-duplicate statuses from several timelines. Entities without an id are not hashable.
+
+        Like any dict, entities are mutable - don't change the id of one that is in a set.
+        """
+        entity_id = dict.get(self, "id")
+        if entity_id is None:
+            raise TypeError(f"unhashable type: '{type(self).__name__}' (entity has no id)")
+        return hash(str(entity_id))
+
 WebpushCryptoParamsPubkey = Dict[str, str]
 """A type containing the parameters for a encrypting webpush data. Considered opaque / implementation detail."""
 
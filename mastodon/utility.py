@@ -9,14 +9,16 @@ import copy
 import warnings
 
 from mastodon.errors import MastodonAPIError, MastodonIllegalArgumentError, MastodonNotFoundError, MastodonVersionError
-from mastodon.compat import IMPL_HAS_BLURHASH, blurhash, IMPL_HAS_GRAPHEME, grapheme
+from mastodon.compat import IMPL_HAS_BLURHASH, blurhash, IMPL_HAS_GRAPHEME, grapheme, IMPL_HAS_NUMPY, numpy
+from mastodon import _blurhash
 from mastodon.internals import Mastodon as Internals
 
 from mastodon.versions import parse_version_string, max_version, api_version
 
-from typing import Optional, Union, Dict, Iterator, Tuple, List
+from typing import Optional, Union, Dict, Iterator, Tuple, List, Any, Iterable, Callable
 from mastodon.return_types import PaginatableList, PaginationInfo, PaginatableList, MediaAttachment
 from mastodon.types_base import Entity, try_cast
+from mastodon.instrumentation import RequestObserver
 
 from ._url_regex import url_regex
 import unicodedata
@@ -71,6 +73,29 @@ class Mastodon(Internals):
             warnings.warn("Mastodon version is detected as >= 4.3.0, but no API version found. Please report this.")
         return version_str
 
+    ###
+    # Request instrumentation
+    ###
+    def add_request_observer(self, observer: RequestObserver):
+        """
+        Add a :class:`RequestObserver <mastodon.RequestObserver>` that gets called for every API request this
+        instance makes, e.g. a :class:`RequestMetricsCollector <mastodon.RequestMetricsCollector>` to collect
+        per-endpoint latency and error statistics, or a :class:`LoggingRequestObserver <mastodon.LoggingRequestObserver>`.
+
+        Observers are called in the order they were added. When no observers are added, requests are not
+        instrumented at all.
+        """
+        if observer not in self.__request_observers:
+            # Copy, so that requests running in other threads keep iterating the old list
+            self.__request_observers = self.__request_observers + [observer]
+
+    def remove_request_observer(self, observer: RequestObserver):
+        """
+        Remove a request observer added with :ref:`add_request_observer() <add_request_observer()>`. Does
+        nothing if the observer was not added.
+        """
+        self.__request_observers = [added for added in self.__request_observers if added is not observer]
+
     def verify_minimum_version(self, version_str: str, cached: bool = False) -> bool:
         """
         Update version info from server and verify that at least the specified version is present.
@@ -148,6 +173,80 @@ class Mastodon(Internals):
         # And that's pretty much it.
         return decoded_image
 
+    def decode_blurhash_batch(self, media_dicts: List[MediaAttachment], out_size: Tuple[int, int] = (16, 16), size_per_component: bool = True,
+                              return_linear: bool = True, stack: bool = False) -> Union[List[Any], Any]:
+        """
+        Decode the blurhashes of many media dicts at once. Parameters are as in
+        :ref:`decode_blurhash() <decode_blurhash()>`.
+
+        If numpy is installed, decoding is vectorized, the cosine bases are computed only
+        once for every distinct combination of component count and output size, and the
+        result is a list of numpy arrays of shape (height, width, 3) - float arrays
+        for linear RGB, uint8 arrays otherwise. Media dicts without a blurhash
+        give None. Set `stack` to True to get one array of shape (count, height, width, 3)
+        instead, which requires that all images decode to the same size (i.e. use
+        `size_per_component = False` or media with identical component counts) and
+        that all media dicts have a blurhash.
+
+        Without numpy, this falls back to decoding one by one with the blurhash module,
+        returning the same nested lists as :ref:`decode_blurhash() <decode_blurhash()>`.
+        """
+        if not IMPL_HAS_NUMPY:
+            if stack:
+                raise NotImplementedError(
+                    'To stack decoded blurhashes, please install the numpy Python module.')
+            return [self.decode_blurhash(media_dict, out_size, size_per_component, return_linear) if media_dict.get("blurhash") else None
+                    for media_dict in media_dicts]
+
+        decoded_images = []
+        for media_dict in media_dicts:
+            blurhash_str = media_dict.get("blurhash")
+            if not blurhash_str:
+                if stack:
+                    raise MastodonIllegalArgumentError("Can't stack decoded blurhashes if some media dicts have no blurhash.")
+                decoded_images.append(None)
+                continue
+            decode_size_x, decode_size_y = out_size
+            if size_per_component:
+                components_x, components_y = _blurhash.components(blurhash_str)
+                decode_size_x *= components_x
+                decode_size_y *= components_y
+            decoded_images.append(_blurhash.decode(blurhash_str, decode_size_x, decode_size_y, linear=return_linear))
+
+        if stack:
+            if len(decoded_images) == 0:
+                raise MastodonIllegalArgumentError("Can't stack an empty list of decoded blurhashes.")
+            if len(set(image.shape for image in decoded_images)) > 1:
+                raise MastodonIllegalArgumentError("Can't stack decoded blurhashes of different sizes.")
+            return numpy.stack(decoded_images)
+        return decoded_images
+
+    def encode_blurhash(self, image: Any, components: Tuple[int, int] = (4, 4), linear: bool = False, max_size: Optional[int] = 64) -> str:
+        """
+        Basic blurhash encoding, e.g. to generate a placeholder for an image locally while
+        it is still uploading instead of waiting for the server to process it.
+
+        `image` should be something that converts to a numpy array of shape (height, width, 3),
+        such as a PIL RGB image or a nested list, containing 0-255 sRGB values. Pass linear RGB
+        in the 0.0-1.0 range instead and set `linear` to True if you have that already.
+
+        `components` is the number of blurhash components in x and y direction, between 1 and 9.
+        The default matches what Mastodon uses for its own blurhashes.
+
+        Before encoding, the image is downscaled in linear colour so that neither side is larger
+        than `max_size` pixels, which makes encoding a lot faster and affects the result very
+        little. Set `max_size` to None to encode at full resolution, which gives exactly the
+        same result as the blurhash module does.
+
+        Returns the blurhash as a string.
+
+        Requires the optional numpy dependency.
+        """
+        if not IMPL_HAS_NUMPY:
+            raise NotImplementedError(
+                'To use the encode_blurhash function, please install the numpy Python module.')
+        return _blurhash.encode(image, components[0], components[1], linear=linear, max_size=max_size)
+
     ###
     # Pagination
     ###
@@ -325,6 +424,36 @@ class Mastodon(Internals):
             else:
                 current_page = self.fetch_previous(current_page)
 
+    @staticmethod
+    def deduplicate_entities(entities: Iterable[_T], key: Union[str, Callable[[_T], Any]] = "id") -> List[_T]:
+        """
+        Removes duplicates from a list of entities (e.g. statuses or notifications merged from several
+        timelines or pages), keeping the first occurrence of each and otherwise preserving the order.
+
+        Entities are compared by `key`, which is either the name of a field (by default, the `id`) or a
+        function that returns something hashable for an entity. Field values are compared as strings, so
+        that ids match whether they are str or int. Entities for which the key is None are always kept.
+
+        This runs in linear time and does not cast or compare whole entities. Note that ids are only unique
+        per server: to merge statuses fetched from different instances, use `key="uri"` instead.
+        """
+        if isinstance(key, str):
+            field_name = key
+            def key(entity):
+                value = entity.get(field_name)
+                return None if value is None else str(value)
+
+        seen = set()
+        deduplicated = []
+        for entity in entities:
+            entity_key = key(entity)
+            if entity_key is not None:
+                if entity_key in seen:
+                    continue
+                seen.add(entity_key)
+            deduplicated.append(entity)
+        return deduplicated
+
     @staticmethod
     def get_status_length(text: str, spoiler_text: str = "") -> int:
         """
@@ -0,0 +1,598 @@
+# fake_server.py - a lightweight, in-process stand-in for a Mastodon server
+#
+# Serves synthetic timelines and notifications (and, optionally, responses recorded in cassettes)
+# with pagination Link headers, X-RateLimit-* headers and 429s, Mastodon-Async-Refresh, delayed
+# media processing and SSE streaming - enough to integration- and load-test rate limiting,
+# pagination, prefetching and streaming code without a full Mastodon install.
+#
+# The server logic lives in FakeMastodon. It can be reached either in-process through a requests
+# transport adapter (fake_api(), no sockets at all, fastest) or over HTTP on localhost through
+# FakeMastodonServer, which is also what streaming code that wants a real connection should use:
+#
+#     fake = FakeMastodon(status_count=500)
+#     api = fake_api(fake)
+#
+#     with FakeMastodonServer(fake) as server:
+#         api = server.api()
+
+import datetime
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from mastodon import Mastodon
+
+CASSETTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+IN_PROCESS_BASE_URL = "http://fake-mastodon.invalid"
+
+_FIRST_ID = 110000000000000000
+_STREAM_END = object()
+
+def _timestamp(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+def _reset_time(epoch):
+    # Round up to what _timestamp() can represent, so that clients never think the window resets earlier than it does
+    return math.ceil(epoch * 1000.0) / 1000.0
+
+def _json_response(status_code, data, headers=None):
+    response_headers = {"Content-Type": "application/json; charset=utf-8"}
+    if headers is not None:
+        response_headers.update(headers)
+    return status_code, response_headers, json.dumps(data).encode("utf-8")
+
+class _EventStream(object):
+    """
+    The body of a streaming API response: Iterating it yields SSE data as it is pushed to the
+    stream, with a heartbeat every `heartbeat_interval` seconds, until the stream is closed.
+    """
+    def __init__(self, fake, name, heartbeat_interval):
+        self.fake = fake
+        self.name = name
+        self.heartbeat_interval = heartbeat_interval
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        yield b":)\n"
+        while True:
+            try:
+                data = self.queue.get(timeout=self.heartbeat_interval)
+            except queue.Empty:
+                data = b":thump\n"
+            if data is _STREAM_END:
+                return
+            yield data
+
+    def close(self):
+        self.fake._unsubscribe(self)
+        self.queue.put(_STREAM_END)
+
+class FakeMastodon(object):
+    """
+    The fake server: Holds the state (statuses, notifications, media, rate limit, open streams) and
+    answers requests. Thread safe.
+
+    `status_count` statuses and `notification_count` mention notifications are generated up front,
+    all visible on the home, public and #fake hashtag timelines. The rate limit allows `ratelimit_limit`
+    requests per `ratelimit_window` seconds (streaming connections don't count) and answers with 429
+    once used up. Context requests for statuses are answered with a `Mastodon-Async-Refresh` header
+    until the refresh has been polled `async_refresh_polls` times, and uploaded media takes
+    `media_processing_time` seconds to process. Open streams get a heartbeat every
+    `heartbeat_interval` seconds.
+    """
+    def __init__(self, status_count=100, notification_count=20, ratelimit_limit=300, ratelimit_window=300.0,
+                 async_refresh_polls=2, media_processing_time=0.5, heartbeat_interval=15.0):
+        self.ratelimit_limit = ratelimit_limit
+        self.ratelimit_window = ratelimit_window
+        self.async_refresh_polls = async_refresh_polls
+        self.media_processing_time = media_processing_time
+        self.heartbeat_interval = heartbeat_interval
+
+        self.lock = threading.RLock()
+        self.request_count = 0
+        self.ratelimited_count = 0
+        self.ratelimit_remaining = ratelimit_limit
+        self.ratelimit_reset = _reset_time(time.time() + ratelimit_window)
+
+        self.account = {
+            "id": "1", "username": "fake", "acct": "fake", "display_name": "Fake User", "locked": False, "bot": False,
+            "created_at": _timestamp(time.time() - 86400), "note": "", "url": "http://fake-mastodon.invalid/@fake",
+            "avatar": "", "avatar_static": "", "header": "", "header_static": "", "followers_count": 0,
+            "following_count": 0, "statuses_count": 0, "emojis": [], "fields": [],
+        }
+        self.next_id = _FIRST_ID
+        self.statuses = {}
+        self.notifications = {}
+        self.media = {}
+        self.async_refreshes = {}
+        self.refreshed_contexts = set()
+        self.streams = []
+        self.recorded = {}
+        for index in range(status_count):
+            self.create_status(f"Fake status number {index} #fake", push=False)
+        status_ids = sorted(self.statuses.keys())
+        for index in range(notification_count):
+            status = self.statuses[status_ids[index % len(status_ids)]] if len(status_ids) > 0 else None
+            self.create_notification("mention", status, push=False)
+
+    ###
+    # State
+    ###
+    def __new_id(self):
+        with self.lock:
+            self.next_id += 1
+            return self.next_id
+
+    def create_status(self, text, visibility="public", push=True):
+        """
+        Add a status to the timelines, and send it to open user and public streams.
+        """
+        status_id = self.__new_id()
+        status = {
+            "id": str(status_id), "created_at": _timestamp(time.time()), "in_reply_to_id": None,
+            "in_reply_to_account_id": None, "sensitive": False, "spoiler_text": "", "visibility": visibility,
+            "language": "en", "uri": f"http://fake-mastodon.invalid/statuses/{status_id}",
+            "url": f"http://fake-mastodon.invalid/@fake/{status_id}", "replies_count": 0, "reblogs_count": 0,
+            "favourites_count": 0, "content": f"<p>{text}</p>", "reblog": None, "account": self.account,
+            "media_attachments": [], "mentions": [], "tags": [{"name": "fake", "url": "http://fake-mastodon.invalid/tags/fake"}],
+            "emojis": [], "card": None, "poll": None,
+        }
+        with self.lock:
+            self.statuses[status_id] = status
+        if push:
+            self.push_event("update", status, streams=("user", "public", "public/local", "hashtag"))
+        return status
+
+    def delete_status(self, status_id):
+        """
+        Remove a status, and send a delete event to open streams. Returns the deleted status, or None.
+        """
+        with self.lock:
+            status = self.statuses.pop(int(status_id), None)
+        if status is not None:
+            self.push_event("delete", status["id"], streams=("user", "public", "public/local", "hashtag"))
+        return status
+
+    def create_notification(self, notification_type, status=None, push=True):
+        """
+        Add a notification, and send it to open user streams.
+        """
+        notification_id = self.__new_id()
+        notification = {
+            "id": str(notification_id), "type": notification_type, "created_at": _timestamp(time.time()),
+            "account": self.account, "status": status,
+        }
+        with self.lock:
+            self.notifications[notification_id] = notification
+        if push:
+            self.push_event("notification", notification, streams=("user", "user/notification"))
+        return notification
+
+    def add_cassette(self, name):
+        """
+        Serve the responses recorded in the test cassette `name` (without .yaml) for the requests they were
+        recorded for (matching method, path and query), in preference to the synthetic responses.
+        """
+        import yaml
+        with open(os.path.join(CASSETTE_DIR, name + ".yaml"), "r", encoding="utf-8") as cassette_file:
+            cassette = yaml.safe_load(cassette_file)
+        for interaction in cassette["interactions"]:
+            request = interaction["request"]
+            response = interaction["response"]
+            split_url = urlsplit(request["uri"])
+            headers = {key: ", ".join(value) if isinstance(value, list) else value for key, value in response["headers"].items()
+                       if key.lower() not in ("content-length", "transfer-encoding", "content-encoding", "connection")}
+            body = response["body"]["string"]
+            if isinstance(body, str):
+                body = body.encode("utf-8")
+            key = (request["method"], split_url.path, tuple(sorted(parse_qsl(split_url.query))))
+            self.recorded.setdefault(key, (response["status"]["code"], headers, body))
+
+    ###
+    # Streaming
+    ###
+    def push_event(self, event, payload, streams=("user",)):
+        """
+        Send an event to all open streams with one of the given names (e.g. "user", "public", "hashtag").
+        `payload` is JSON-encoded unless it is a string.
+        """
+        if not isinstance(payload, str):
+            payload = json.dumps(payload)
+        data = f"event: {event}\ndata: {payload}\n\n".encode("utf-8")
+        with self.lock:
+            targets = [stream for stream in self.streams if stream.name in streams]
+        for stream in targets:
+            stream.queue.put(data)
+
+    def open_stream_count(self):
+        with self.lock:
+            return len(self.streams)
+
+    def close_streams(self):
+        """
+        End all open streams, as if the server had dropped the connections.
+        """
+        with self.lock:
+            streams = list(self.streams)
+        for stream in streams:
+            stream.close()
+
+    def _unsubscribe(self, stream):
+        with self.lock:
+            if stream in self.streams:
+                self.streams.remove(stream)
+
+    ###
+    # Request handling
+    ###
+    def __ratelimit_headers(self):
+        return {
+            "X-RateLimit-Limit": str(self.ratelimit_limit),
+            "X-RateLimit-Remaining": str(self.ratelimit_remaining),
+            "X-RateLimit-Reset": _timestamp(self.ratelimit_reset),
+        }
+
+    def handle(self, method, url, body=None, content_type=None, base_url=None):
+        """
+        Answer a request. Returns (status code, headers, body), where body is bytes, or an iterable of
+        bytes with a close() method for streaming responses.
+        """
+        split_url = urlsplit(url)
+        path = split_url.path
+        query = dict(parse_qsl(split_url.query))
+        if base_url is None:
+            base_url = f"{split_url.scheme}://{split_url.netloc}"
+
+        if path.startswith("/api/v1/streaming"):
+            return self.__handle_streaming(path, query)
+
+        with self.lock:
+            self.request_count += 1
+            now = time.time()
+            if now >= self.ratelimit_reset:
+                self.ratelimit_remaining = self.ratelimit_limit
+                self.ratelimit_reset = _reset_time(now + self.ratelimit_window)
+            if self.ratelimit_remaining <= 0:
+                self.ratelimited_count += 1
+                return _json_response(429, {"error": "Too many requests"}, self.__ratelimit_headers())
+            self.ratelimit_remaining -= 1
+            ratelimit_headers = self.__ratelimit_headers()
+
+        recorded = self.recorded.get((method, path, tuple(sorted(parse_qsl(split_url.query)))))
+        if recorded is not None:
+            status_code, headers, response_body = recorded
+            headers = dict(headers)
+            headers.update(ratelimit_headers)
+            return status_code, headers, response_body
+
+        params = dict(query)
+        if body:
+            params.update(self.__parse_body(body, content_type))
+        for route_method, route, handler in self.__routes():
+            match = route.fullmatch(path)
+            if route_method == method and match is not None:
+                status_code, headers, response_body = handler(self, base_url, path, params, *match.groups())
+                headers.update(ratelimit_headers)
+                return status_code, headers, response_body
+        return _json_response(404, {"error": "Record not found"}, ratelimit_headers)
+
+    @staticmethod
+    def __parse_body(body, content_type):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        content_type = content_type or ""
+        if content_type.startswith("application/json"):
+            return json.loads(body)
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return dict(parse_qsl(body.decode("utf-8")))
+        # Multipart uploads: The file content does not matter here
+        return {}
+
+    def __handle_streaming(self, path, query):
+        name = path[len("/api/v1/streaming"):].strip("/")
+        if name == "health":
+            return 200, {"Content-Type": "text/plain"}, b"OK"
+        stream = _EventStream(self, name, self.heartbeat_interval)
+        with self.lock:
+            self.streams.append(stream)
+        return 200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}, stream
+
+    def __paginate(self, items, base_url, path, params):
+        """
+        Page through `items` (a dict of int id -> entity) like Mastodon does, with max_id, since_id,
+        min_id and limit, and Link headers pointing at the next and previous pages.
+        """
+        limit = min(int(params.get("limit", 20)), 40)
+        with self.lock:
+            ids = sorted(items.keys(), reverse=True)
+        if "max_id" in params:
+            ids = [entity_id for entity_id in ids if entity_id < int(params["max_id"])]
+        if "since_id" in params:
+            ids = [entity_id for entity_id in ids if entity_id > int(params["since_id"])]
+        if "min_id" in params:
+            # Closest to min_id first, then back to newest first
+            ids = sorted([entity_id for entity_id in ids if entity_id > int(params["min_id"])])[:limit][::-1]
+        page_ids = ids[:limit]
+        with self.lock:
+            page = [items[entity_id] for entity_id in page_ids if entity_id in items]
+
+        headers = {}
+        if len(page_ids) > 0:
+            link_params = {key: value for key, value in params.items() if key not in ("max_id", "since_id", "min_id")}
+            link_params["limit"] = limit
+            next_url = f"{base_url}{path}?{urlencode(dict(link_params, max_id=page_ids[-1]))}"
+            prev_url = f"{base_url}{path}?{urlencode(dict(link_params, min_id=page_ids[0]))}"
+            headers["Link"] = f'<{next_url}>; rel="next", <{prev_url}>; rel="prev"'
+        return _json_response(200, page, headers)
+
+    def __instance_v1(self, base_url, path, params):
+        return _json_response(200, {
+            "uri": urlsplit(base_url).netloc, "title": "Fake Mastodon", "short_description": "", "description": "",
+            "email": "", "version": "4.4.0", "urls": {"streaming_api": base_url}, "languages": ["en"],
+            "stats": {"user_count": 1, "status_count": len(self.statuses), "domain_count": 0},
+        })
+
+    def __instance_v2(self, base_url, path, params):
+        return _json_response(200, {
+            "domain": urlsplit(base_url).netloc, "title": "Fake Mastodon", "version": "4.4.0", "description": "",
+            "api_versions": {"mastodon": 6}, "configuration": {"urls": {"streaming": base_url}}, "languages": ["en"],
+        })
+
+    def __verify_credentials(self, base_url, path, params):
+        return _json_response(200, self.account)
+
+    def __timeline(self, base_url, path, params, *args):
+        return self.__paginate(self.statuses, base_url, path, params)
+
+    def __notifications(self, base_url, path, params):
+        return self.__paginate(self.notifications, base_url, path, params)
+
+    def __status(self, base_url, path, params, status_id):
+        with self.lock:
+            status = self.statuses.get(int(status_id))
+        if status is None:
+            return _json_response(404, {"error": "Record not found"})
+        return _json_response(200, status)
+
+    def __status_post(self, base_url, path, params):
+        if not params.get("status"):
+            return _json_response(422, {"error": "Validation failed: Text can't be blank"})
+        return _json_response(200, self.create_status(params["status"], visibility=params.get("visibility", "public")))
+
+    def __status_delete(self, base_url, path, params, status_id):
+        status = self.delete_status(status_id)
+        if status is None:
+            return _json_response(404, {"error": "Record not found"})
+        return _json_response(200, status)
+
+    def __status_context(self, base_url, path, params, status_id):
+        headers = {}
+        with self.lock:
+            if self.async_refresh_polls > 0 and status_id not in self.refreshed_contexts:
+                refresh_id = next((refresh_id for refresh_id, refresh in self.async_refreshes.items() if refresh["status_id"] == status_id), None)
+                if refresh_id is None:
+                    refresh_id = uuid.uuid4().hex
+                    self.async_refreshes[refresh_id] = {"status_id": status_id, "polls_left": self.async_refresh_polls}
+                headers["Mastodon-Async-Refresh"] = f'id="{refresh_id}", retry=0'
+        return _json_response(200, {"ancestors": [], "descendants": []}, headers)
+
+    def __async_refresh(self, base_url, path, params, refresh_id):
+        with self.lock:
+            refresh = self.async_refreshes.get(refresh_id)
+            if refresh is None:
+                return _json_response(404, {"error": "Record not found"})
+            refresh["polls_left"] -= 1
+            if refresh["polls_left"] <= 0:
+                self.refreshed_contexts.add(refresh["status_id"])
+                del self.async_refreshes[refresh_id]
+                status = "finished"
+            else:
+                status = "running"
+        return _json_response(200, {"async_refresh": {"id": refresh_id, "status": status, "result_count": 0}})
+
+    def __media_json(self, media):
+        ready = time.time() >= media["ready_at"]
+        url = f"http://fake-mastodon.invalid/media/{media['id']}.png" if ready else None
+        return {"id": media["id"], "type": "image", "url": url, "preview_url": url, "remote_url": None,
+                "description": media["description"], "blurhash": None, "meta": {}}
+
+    def __media_post(self, base_url, path, params):
+        media = {"id": str(self.__new_id()), "description": params.get("description"), "ready_at": time.time() + self.media_processing_time}
+        with self.lock:
+            self.media[media["id"]] = media
+        media_json = self.__media_json(media)
+        return _json_response(200 if media_json["url"] is not None else 202, media_json)
+
+    def __media(self, base_url, path, params, media_id):
+        with self.lock:
+            media = self.media.get(media_id)
+        if media is None:
+            return _json_response(404, {"error": "Record not found"})
+        media_json = self.__media_json(media)
+        return _json_response(200 if media_json["url"] is not None else 206, media_json)
+
+    @classmethod
+    def __routes(cls):
+        routes = getattr(cls, "_FakeMastodon__compiled_routes", None)
+        if routes is None:
+            routes = cls.__compiled_routes = [(method, re.compile(route), handler) for method, route, handler in (
+                ("GET", r"/api/v1/instance/?", cls.__instance_v1),
+                ("GET", r"/api/v2/instance/?", cls.__instance_v2),
+                ("GET", r"/api/v1/accounts/verify_credentials", cls.__verify_credentials),
+                ("GET", r"/api/v1/timelines/(home|public)", cls.__timeline),
+                ("GET", r"/api/v1/timelines/tag/([^/]+)", cls.__timeline),
+                ("GET", r"/api/v1/notifications", cls.__notifications),
+                ("POST", r"/api/v1/statuses", cls.__status_post),
+                ("GET", r"/api/v1/statuses/([0-9]+)", cls.__status),
+                ("DELETE", r"/api/v1/statuses/([0-9]+)", cls.__status_delete),
+                ("GET", r"/api/v1/statuses/([0-9]+)/context", cls.__status_context),
+                ("GET", r"/api/v1_alpha/async_refreshes/([^/]+)", cls.__async_refresh),
+                ("POST", r"/api/v(?:1|2)/media", cls.__media_post),
+                ("GET", r"/api/v1/media/([0-9]+)", cls.__media),
+            )]
+        return routes
+
+###
+# Reaching the fake server in-process
+###
+class _StreamRaw(object):
+    """
+    Stands in for the urllib3 response of a streaming request, reading from an _EventStream.
+    """
+    def __init__(self, event_stream):
+        self.event_stream = event_stream
+        self.iterator = iter(event_stream)
+        self.buffer = b""
+        self.closed = False
+
+    def read(self, amt=None, decode_content=None):
+        while not self.closed and len(self.buffer) == 0:
+            self.buffer = next(self.iterator, b"")
+            if len(self.buffer) == 0:
+                break
+        if amt is None:
+            amt = len(self.buffer)
+        data, self.buffer = self.buffer[:amt], self.buffer[amt:]
+        return data
+
+    def close(self):
+        self.closed = True
+        self.event_stream.close()
+
+class FakeMastodonAdapter(BaseAdapter):
+    """
+    requests transport adapter that hands requests straight to a FakeMastodon, without any sockets.
+    """
+    def __init__(self, fake, base_url=IN_PROCESS_BASE_URL):
+        super(FakeMastodonAdapter, self).__init__()
+        self.fake = fake
+        self.base_url = base_url
+
+    def send(self, request, stream=False, **kwargs):
+        status_code, headers, body = self.fake.handle(request.method, request.url, request.body, request.headers.get("Content-Type"), self.base_url)
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        if isinstance(body, bytes):
+            response._content = body
+        else:
+            response.raw = _StreamRaw(body)
+        return response
+
+    def close(self):
+        pass
+
+def fake_api(fake, **kwargs):
+    """
+    Returns a Mastodon instance that talks to `fake` in-process. Keyword arguments are passed on to the
+    Mastodon constructor.
+    """
+    kwargs.setdefault("access_token", "fake-token")
+    kwargs.setdefault("version_check_mode", "none")
+    api = Mastodon(api_base_url=IN_PROCESS_BASE_URL, **kwargs)
+    api.session.mount(IN_PROCESS_BASE_URL, FakeMastodonAdapter(fake))
+    return api
+
+###
+# Reaching the fake server over HTTP
+###
+class _FakeMastodonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would delay by tens of milliseconds
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def __handle(self):
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        body = self.rfile.read(length) if length > 0 else None
+        status_code, headers, response_body = self.server.fake.handle(self.command, self.path, body, self.headers.get("Content-Type"), self.server.url)
+        self.send_response(status_code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if isinstance(response_body, bytes):
+            self.send_header("Content-Length", str(len(response_body)))
+            self.end_headers()
+            self.wfile.write(response_body)
+            return
+
+        # Streaming: chunked, until the stream or the connection is closed
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for data in response_body:
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError, OSError):
+            pass
+        finally:
+            response_body.close()
+
+    do_GET = __handle
+    do_POST = __handle
+    do_PUT = __handle
+    do_PATCH = __handle
+    do_DELETE = __handle
+    do_HEAD = __handle
+
+class FakeMastodonServer(object):
+    """
+    Serves a FakeMastodon over HTTP on localhost, on a free port, from a background thread.
+    Use as a context manager, or call start() and stop().
+    """
+    def __init__(self, fake):
+        self.fake = fake
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return self.httpd.url
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), _FakeMastodonRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self.fake
+        self.httpd.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.fake.close_streams()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+    def api(self, **kwargs):
+        """
+        Returns a Mastodon instance that talks to this server. Keyword arguments are passed on to the
+        Mastodon constructor.
+        """
+        kwargs.setdefault("access_token", "fake-token")
+        kwargs.setdefault("version_check_mode", "none")
+        return Mastodon(api_base_url=self.url, **kwargs)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -2,6 +2,8 @@ import pytest
 from mastodon.Mastodon import MastodonAPIError, MastodonIllegalArgumentError
 import re
 import time
+import threading
+import requests_mock
 
 from mastodon.errors import MastodonDeprecationWarning
 import warnings
@@ -20,6 +22,32 @@ def test_accounts(api):
     accounts = api.accounts(account_ids)
     assert len(accounts) == 2
 
+def test_accounts_chunked(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    requested_chunks = []
+    chunks_lock = threading.Lock()
+    def accounts_callback(request, context):
+        ids = request.qs["id[]"]
+        with chunks_lock:
+            requested_chunks.append(ids)
+        # Pretend that every id divisible by 7 doesn't exist, and return out of order
+        return [{"id": id, "username": f"user{id}", "acct": f"user{id}"} for id in reversed(ids) if int(id) % 7 != 0]
+    rmock.register_uri('GET', '/api/v1/accounts', json=accounts_callback)
+
+    ids = list(range(1, 101)) + [3, 5, {"id": 8}, 100]
+    accounts = api.accounts(ids)
+    assert len(requested_chunks) == 3
+    assert all(len(chunk) <= 40 for chunk in requested_chunks)
+    assert sorted(int(id) for chunk in requested_chunks for id in chunk) == list(range(1, 101))
+    assert [int(account.id) for account in accounts] == [id for id in range(1, 101) if id % 7 != 0]
+    assert accounts[0].username == "user1"
+    assert accounts._missing_ids == [id for id in range(1, 101) if id % 7 == 0]
+
+    relationships = api.account_familiar_followers([])
+    assert len(relationships) == 0
+    assert relationships._missing_ids == []
+
 @pytest.mark.vcr()
 def test_verify_credentials(api):
     account_a = api.account_verify_credentials()
@@ -23,3 +23,71 @@ def test_blurhash_decode(api):
     assert len(decoded_image_2) == 240
     assert len(decoded_image_2[0]) == 320
     
+
+def test_blurhash_decode_batch(api):
+    import blurhash
+    fake_media_dicts = [
+        {'blurhash': '=~NdOWof1PbIPUXSvgbI$f'},
+        {'blurhash': 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'},
+        {'blurhash': None},
+    ]
+    decoded_images = api.decode_blurhash_batch(fake_media_dicts)
+    assert decoded_images[2] is None
+    for media_dict, decoded_image in zip(fake_media_dicts[:2], decoded_images):
+        reference = api.decode_blurhash(media_dict)
+        assert len(decoded_image) == len(reference)
+        assert len(decoded_image[0]) == len(reference[0])
+        for row, reference_row in zip(decoded_image, reference):
+            for pixel, reference_pixel in zip(row, reference_row):
+                for value, reference_value in zip(pixel, reference_pixel):
+                    assert abs(value - reference_value) < 1e-9
+
+    decoded_srgb = api.decode_blurhash_batch(fake_media_dicts[:2], out_size=(32, 24), size_per_component=False, return_linear=False)
+    for media_dict, decoded_image in zip(fake_media_dicts, decoded_srgb):
+        reference = blurhash.decode(media_dict['blurhash'], 32, 24)
+        for row, reference_row in zip(decoded_image, reference):
+            for pixel, reference_pixel in zip(row, reference_row):
+                assert [int(x) for x in pixel] == reference_pixel
+
+def test_blurhash_decode_batch_stacked(api):
+    numpy = pytest.importorskip("numpy")
+    fake_media_dicts = [
+        {'blurhash': '=~NdOWof1PbIPUXSvgbI$f'},
+        {'blurhash': 'LEHV6nWB2yk8pyo0adR*.7kCMdnj'},
+    ]
+    stacked = api.decode_blurhash_batch(fake_media_dicts, out_size=(32, 24), size_per_component=False, stack=True)
+    assert isinstance(stacked, numpy.ndarray)
+    assert stacked.shape == (2, 24, 32, 3)
+    with pytest.raises(ValueError):
+        api.decode_blurhash_batch(fake_media_dicts, stack=True)
+
+def test_blurhash_decode_batch_fallback(api, monkeypatch):
+    import mastodon.utility
+    monkeypatch.setattr(mastodon.utility, "IMPL_HAS_NUMPY", False)
+    fake_media_dict = {'blurhash': '=~NdOWof1PbIPUXSvgbI$f'}
+    decoded_images = api.decode_blurhash_batch([fake_media_dict, {}])
+    assert decoded_images == [api.decode_blurhash(fake_media_dict), None]
+    with pytest.raises(NotImplementedError):
+        api.decode_blurhash_batch([fake_media_dict], stack=True)
+
+def test_blurhash_encode(api):
+    numpy = pytest.importorskip("numpy")
+    import blurhash
+
+    rng = numpy.random.default_rng(1234)
+    image = rng.integers(0, 256, (24, 32, 3))
+    assert api.encode_blurhash(image, max_size=None) == blurhash.encode(image.tolist(), 4, 4)
+    assert api.encode_blurhash(image.tolist(), components=(5, 3), max_size=None) == blurhash.encode(image.tolist(), 5, 3)
+
+    # Downscaling first should not change much for smooth images
+    y, x = numpy.mgrid[0:480, 0:640]
+    gradient = numpy.stack([x / 640.0 * 255.0, y / 480.0 * 255.0, numpy.full(x.shape, 128.0)], axis=-1)
+    hash_small = api.encode_blurhash(gradient, components=(4, 3))
+    assert blurhash.components(hash_small) == (4, 3)
+    hash_full = api.encode_blurhash(gradient, components=(4, 3), max_size=None)
+    decoded_small = numpy.array(blurhash.decode(hash_small, 16, 12, linear=True))
+    decoded_full = numpy.array(blurhash.decode(hash_full, 16, 12, linear=True))
+    assert numpy.abs(decoded_small - decoded_full).max() < 0.1
+
+    with pytest.raises(ValueError):
+        api.encode_blurhash(image, components=(10, 3))
@@ -181,4 +181,9 @@ def test_timeline_is_available_invalid_timeline_raises(api):
 def test_timeline_is_available_live_server_disabled(mastodon_base):
     assert isinstance(mastodon_base.timeline_is_available("public"), bool)
     assert isinstance(mastodon_base.timeline_is_available("local"), bool)
-    assert isinstance(mastodon_base.timeline_is_available("remote"), bool)
\ No newline at end of file
+    assert isinstance(mastodon_base.timeline_is_available("remote"), bool)
+
+
+def test_constructor_illegal_entity_interning():
+    with pytest.raises(MastodonIllegalArgumentError):
+        api = Mastodon(access_token='baz', api_base_url="whatever", entity_interning="always")
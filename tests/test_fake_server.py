@@ -0,0 +1,131 @@
+import pytest
+import io
+import time
+import threading
+
+from mastodon import StreamListener
+from mastodon.Mastodon import MastodonRatelimitError, MastodonNotFoundError
+from tests.fake_server import FakeMastodon, FakeMastodonServer, fake_api
+
+
+class EventCollector(StreamListener):
+    def __init__(self):
+        self.updates = []
+        self.deletes = []
+        self.event = threading.Event()
+
+    def on_update(self, status):
+        self.updates.append(status)
+        self.event.set()
+
+    def on_delete(self, status_id):
+        self.deletes.append(status_id)
+        self.event.set()
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_fake_server_pagination():
+    fake = FakeMastodon(status_count=12)
+    api = fake_api(fake)
+    first_page = api.timeline_home(limit=5)
+    assert len(first_page) == 5
+    statuses = api.fetch_remaining(first_page)
+    assert len(statuses) == 12
+    ids = [int(status.id) for status in statuses]
+    assert ids == sorted(set(ids), reverse=True)
+
+    newer = api.fetch_previous(api.timeline_home(limit=5, max_id=ids[4]))
+    assert [int(status.id) for status in newer] == ids[:5]
+
+def test_fake_server_ratelimit():
+    fake = FakeMastodon(status_count=0, notification_count=0, ratelimit_limit=3, ratelimit_window=60.0)
+    api = fake_api(fake, ratelimit_method="throw")
+    for _ in range(3):
+        api.account_verify_credentials()
+    assert api.ratelimit_remaining == 0
+    with pytest.raises(MastodonRatelimitError):
+        api.account_verify_credentials()
+
+    # Hit the limit early in the window, so that "wait" mode has to sleep until the reset and retry
+    fake = FakeMastodon(status_count=0, notification_count=0, ratelimit_limit=2, ratelimit_window=1.0)
+    api = fake_api(fake, ratelimit_method="wait")
+    for _ in range(3):
+        assert api.account_verify_credentials().acct == "fake"
+    assert fake.ratelimited_count == 1
+    assert fake.request_count == 4
+
+    # "pace" mode spreads requests out instead, and never hits the limit
+    fake = FakeMastodon(status_count=0, notification_count=0, ratelimit_limit=4, ratelimit_window=0.5)
+    api = fake_api(fake, ratelimit_method="pace")
+    for _ in range(6):
+        api.account_verify_credentials()
+    assert fake.ratelimited_count == 0
+
+def test_fake_server_pace_concurrent():
+    # Requests from several threads at once have to pace themselves relative to each other
+    fake = FakeMastodon(status_count=0, notification_count=0, ratelimit_limit=4, ratelimit_window=1.0)
+    api = fake_api(fake, ratelimit_method="pace")
+    api.account_verify_credentials()
+    threads = [threading.Thread(target=api.account_verify_credentials) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fake.request_count == 7
+    assert fake.ratelimited_count == 0
+
+def test_fake_server_errors():
+    api = fake_api(FakeMastodon(status_count=1))
+    with pytest.raises(MastodonNotFoundError):
+        api.status(1)
+
+def test_fake_server_async_refresh():
+    fake = FakeMastodon(status_count=1, async_refresh_polls=2)
+    api = fake_api(fake)
+    status = api.timeline_home()[0]
+    context = api.status_context(status)
+    assert context._async_refresh["retry"] == 0
+    refreshed = api.await_async_refresh(context)
+    assert refreshed is not None
+    assert refreshed.descendants == []
+    assert getattr(api.status_context(status), "_async_refresh", None) is None
+
+def test_fake_server_media_processing():
+    fake = FakeMastodon(status_count=0, media_processing_time=0.2)
+    api = fake_api(fake)
+    media = api.media_post(io.BytesIO(b"\x89PNG\r\n\x1a\n"), mime_type="image/png", description="test")
+    assert media.url is None
+    assert api.media(media).url is None
+    time.sleep(0.25)
+    assert api.media(media).url is not None
+
+@pytest.mark.parametrize("over_http", [False, True])
+def test_fake_server_streaming(over_http):
+    fake = FakeMastodon(status_count=0, notification_count=0, heartbeat_interval=0.05)
+    server = FakeMastodonServer(fake).start() if over_http else None
+    try:
+        api = server.api() if over_http else fake_api(fake)
+        listener = EventCollector()
+        handle = api.stream_user(listener, run_async=True)
+        assert wait_for(lambda: fake.open_stream_count() == 1)
+        assert wait_for(lambda: handle.last_heartbeat_at is not None)
+
+        status = api.status_post("Hello, stream")
+        assert wait_for(lambda: len(listener.updates) == 1)
+        assert listener.updates[0].id == status.id
+        api.status_delete(status)
+        assert wait_for(lambda: len(listener.deletes) == 1)
+        assert str(listener.deletes[0]) == str(status.id)
+
+        handle.close()
+        assert wait_for(lambda: not handle.is_alive())
+        assert wait_for(lambda: fake.open_stream_count() == 0)
+    finally:
+        if server is not None:
+            server.stop()
@@ -0,0 +1,174 @@
+import pytest
+import logging
+import datetime
+import requests_mock
+
+from mastodon import RequestObserver, RequestMetricsCollector, LoggingRequestObserver
+from mastodon.Mastodon import MastodonNotFoundError
+from mastodon.instrumentation import _endpoint_key
+
+
+class RecordingObserver(RequestObserver):
+    def __init__(self):
+        self.events = []
+
+    def on_request(self, call):
+        self.events.append(("request", call.attempt))
+
+    def on_response(self, call):
+        self.events.append(("response", call.status_code))
+
+    def on_cast(self, call):
+        self.events.append(("cast", call.cast_time is not None))
+
+    def on_ratelimit_wait(self, call, seconds, reason):
+        self.events.append(("wait", reason))
+
+    def on_error(self, call, exception):
+        self.events.append(("error", type(exception)))
+
+
+@pytest.mark.parametrize("method, endpoint, expected", [
+    ("GET", "/api/v1/statuses/123456", "GET /api/v1/statuses/:id"),
+    ("POST", "/api/v1/statuses/123/favourite", "POST /api/v1/statuses/:id/favourite"),
+    ("GET", "/api/v1/timelines/tag/cats?limit=5", "GET /api/v1/timelines/tag/:name"),
+    ("GET", "/api/v1/timelines/home", "GET /api/v1/timelines/home"),
+    ("GET", "/api/v1/statuses/AbCdEf0123456789xY", "GET /api/v1/statuses/:id"),
+    ("POST", "/api/v1/accounts/01ARZ3NDEKTSV4RRFFQ69G5FAV/follow", "POST /api/v1/accounts/:id/follow"),
+    ("GET", "/api/v1/lists/9zV2kXTx3dJ0FbFxyq/accounts", "GET /api/v1/lists/:id/accounts"),
+    ("GET", "/api/v2/notifications/ungrouped-34975861", "GET /api/v2/notifications/:id"),
+    ("GET", "/api/v1/accounts/relationships", "GET /api/v1/accounts/relationships"),
+    ("GET", "/api/v1/notifications/unread_count", "GET /api/v1/notifications/unread_count"),
+    ("GET", "/api/v1/instance/peers", "GET /api/v1/instance/peers"),
+])
+def test_endpoint_key(method, endpoint, expected):
+    assert _endpoint_key(method, endpoint) == expected
+
+def test_observer_hooks(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/statuses/1', json={"id": "1", "content": "hello"})
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/statuses/2', status_code=404, json={"error": "Record not found"})
+
+    observer = RecordingObserver()
+    api.add_request_observer(observer)
+    api.status(1)
+    assert observer.events == [("request", 1), ("response", 200), ("cast", True)]
+
+    observer.events = []
+    with pytest.raises(MastodonNotFoundError):
+        api.status(2)
+    assert observer.events == [("request", 1), ("response", 404), ("error", MastodonNotFoundError)]
+
+    observer.events = []
+    api.remove_request_observer(observer)
+    api.status(1)
+    assert observer.events == []
+
+def test_metrics_collector(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    rmock.register_uri('GET', requests_mock.ANY, json={"id": "1", "content": "hello"})
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/statuses/3', status_code=404, json={"error": "Record not found"})
+
+    metrics = RequestMetricsCollector()
+    api.add_request_observer(metrics)
+    api.status(1)
+    api.status(2)
+    with pytest.raises(MastodonNotFoundError):
+        api.status(3)
+    api.timeline_hashtag("cats")
+
+    collected = metrics.metrics()
+    assert "GET /api/v1/statuses/:id" in collected
+    assert "GET /api/v1/timelines/tag/:name" in collected
+    statuses = collected["GET /api/v1/statuses/:id"]
+    assert statuses.requests == 3
+    assert statuses.errors == 1
+    assert statuses.retries == 0
+    assert statuses.status_codes == {200: 2, 404: 1}
+    assert statuses.bytes_received > 0
+    assert statuses.latency_p50 is not None
+    assert statuses.latency_p50 <= statuses.latency_p99 <= statuses.latency_max
+
+    exported = metrics.to_prometheus()
+    assert '# TYPE mastodonpy_requests_total counter' in exported
+    assert 'mastodonpy_requests_total{method="GET",endpoint="/api/v1/statuses/:id",code="404"} 1' in exported
+    assert 'mastodonpy_request_errors_total{method="GET",endpoint="/api/v1/statuses/:id"} 1' in exported
+    assert 'mastodonpy_request_latency_seconds_count{method="GET",endpoint="/api/v1/timelines/tag/:name"} 1' in exported
+
+    metrics.reset()
+    assert metrics.metrics() == {}
+
+def test_metrics_ratelimit_retry(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    reset = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=0.2)
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/statuses/1', [
+        {"status_code": 429, "json": {"error": "Too many requests"},
+         "headers": {"X-RateLimit-Limit": "300", "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset.isoformat()}},
+        {"status_code": 200, "json": {"id": "1", "content": "hello"}},
+    ])
+    api.ratelimit_method = "wait"
+
+    observer = RecordingObserver()
+    metrics = RequestMetricsCollector()
+    api.add_request_observer(observer)
+    api.add_request_observer(metrics)
+    api.status(1)
+
+    assert observer.events == [("request", 1), ("response", 429), ("wait", "limit"), ("request", 2), ("response", 200), ("cast", True)]
+    collected = metrics.metrics()["GET /api/v1/statuses/:id"]
+    assert collected.requests == 2
+    assert collected.retries == 1
+    assert collected.errors == 0
+    assert collected.ratelimit_waits == 1
+
+def test_logging_observer_has_no_secrets(api, caplog):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    rmock.register_uri('POST', requests_mock.ANY, json={"id": "1", "content": "hello"})
+
+    api.add_request_observer(LoggingRequestObserver(level=logging.INFO))
+    with caplog.at_level(logging.INFO, logger="mastodon"):
+        api.status_post("secret post text")
+    assert "POST /api/v1/statuses -> 200" in caplog.text
+    assert api.access_token not in caplog.text
+    assert "secret post text" not in caplog.text
+
+def test_request_timing(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/statuses/1', json={"id": "1", "content": "hello"})
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/timelines/home', json=[{"id": "2", "content": "hi"}],
+                       headers={"Link": '<https://example.com/api/v1/timelines/home?max_id=2>; rel="next"'})
+
+    status = api.status(1)
+    assert not hasattr(status, "_timing")
+
+    api.request_timing = True
+    status = api.status(1)
+    timing = status._timing
+    for phase in ("ratelimit_wait", "ttfb", "download", "json_parse", "cast", "link_parse", "total"):
+        assert timing[phase] is not None and timing[phase] >= 0
+    assert timing.total >= timing.ttfb + timing.download + timing.json_parse + timing.cast
+
+    timeline = api.timeline_home()
+    assert timeline._timing.link_parse >= 0
+    assert timeline._pagination_next is not None
+
+def test_observer_complete_timing(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    rmock.register_uri('GET', api.api_base_url + '/api/v1/statuses/1', json={"id": "1", "content": "hello"})
+
+    completed = []
+    class CompletionObserver(RequestObserver):
+        def on_complete(self, call):
+            completed.append(call.timing)
+
+    api.add_request_observer(CompletionObserver())
+    status = api.status(1)
+    assert not hasattr(status, "_timing")
+    assert len(completed) == 1
+    assert completed[0].total >= completed[0].cast
@@ -1,5 +1,9 @@
 import pytest
 import time
+import threading
+import requests_mock
+from urllib.parse import parse_qs
+from mastodon.errors import MastodonAPIError
 
 @pytest.fixture()
 def mastodon_list(api):
@@ -60,4 +64,86 @@ def test_list_timeline(api, api2, mastodon_list):
 
     api2.status_delete(status)
     api.account_unfollow(user)
-    
\ No newline at end of file
+    
+def test_list_accounts_sync(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    members = set(str(i) for i in range(1, 101))
+    bad_ids = {"150", "170"}
+    members_lock = threading.Lock()
+    request_count = {'POST': 0, 'DELETE': 0}
+
+    def page_callback(request, context):
+        # Two pages, to make sure we walk all of them
+        page = sorted(members, key=int)
+        if "max_id" in request.qs:
+            return [{"id": x} for x in page if int(x) > int(request.qs["max_id"][0])]
+        context.headers["Link"] = f'<{api.api_base_url}/api/v1/lists/1/accounts?max_id=50>; rel="next"'
+        return [{"id": x} for x in page if int(x) <= 50]
+
+    def change_callback(request, context):
+        ids = set(parse_qs(request.text)["account_ids[]"])
+        with members_lock:
+            request_count[request.method] += 1
+            if request.method == "POST":
+                if ids & bad_ids:
+                    context.status_code = 422
+                    return {"error": "Validation failed"}
+                members.update(ids)
+            else:
+                members.difference_update(ids)
+        return {}
+
+    rmock.register_uri('GET', '/api/v1/lists/1/accounts', json=page_callback)
+    rmock.register_uri('POST', '/api/v1/lists/1/accounts', json=change_callback)
+    rmock.register_uri('DELETE', '/api/v1/lists/1/accounts', json=change_callback)
+
+    desired = [str(i) for i in range(51, 201)] + ["60"]
+    result = api.list_accounts_sync(1, desired)
+    assert members == set(str(i) for i in range(51, 201)) - bad_ids
+    assert sorted(result.added, key=int) == [str(i) for i in range(101, 201) if str(i) not in bad_ids]
+    assert sorted(result.removed, key=int) == [str(i) for i in range(1, 51)]
+    assert sorted(result.failed_add) == sorted(bad_ids)
+    assert result.failed_remove == []
+    assert request_count['DELETE'] == 2
+
+def test_list_accounts_sync_missing_account(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    members = set()
+    deleted_ids = {"7"}
+
+    def change_callback(request, context):
+        ids = set(parse_qs(request.text)["account_ids[]"])
+        if ids & deleted_ids:
+            context.status_code = 404
+            return {"error": "Record not found"}
+        members.update(ids)
+        return {}
+
+    rmock.register_uri('GET', '/api/v1/lists/1/accounts', json=[])
+    rmock.register_uri('POST', '/api/v1/lists/1/accounts', json=change_callback)
+
+    # One deleted account in a chunk does not keep the others from being added
+    result = api.list_accounts_sync(1, [str(i) for i in range(1, 11)])
+    assert members == set(str(i) for i in range(1, 11)) - deleted_ids
+    assert result.failed_add == ["7"]
+    assert len(result.added) == 9
+
+def test_list_accounts_sync_forbidden(api):
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    request_count = {'POST': 0}
+
+    def change_callback(request, context):
+        request_count[request.method] += 1
+        context.status_code = 403
+        return {"error": "This action is outside the authorized scopes"}
+
+    rmock.register_uri('GET', '/api/v1/lists/1/accounts', json=[])
+    rmock.register_uri('POST', '/api/v1/lists/1/accounts', json=change_callback)
+
+    # Errors that are not about individual accounts are raised, not bisected
+    with pytest.raises(MastodonAPIError):
+        api.list_accounts_sync(1, [str(i) for i in range(1, 41)])
+    assert request_count['POST'] == 1
@@ -136,4 +136,97 @@ def test_media_post_pathlib(api):
     path = pathlib.Path(".") / "tests" / "image.jpg"
     media = api.media_post(path)
     assert media
-    
\ No newline at end of file
+    
+def test_status_post_with_media(api):
+    import requests_mock
+    import itertools
+
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+
+    media_ids = itertools.count(100)
+    media_polls = []
+    status_params = []
+    def media_post_callback(request, context):
+        media_id = str(next(media_ids))
+        # Video is still processing, everything else is done immediately
+        url = None if b"video/mp4" in request.body else f"http://localhost:3000/media/{media_id}"
+        return {"id": media_id, "type": "image", "url": url, "description": None}
+    def media_get_callback(request, context):
+        media_polls.append(request.path)
+        media_id = request.path.split("/")[-1]
+        return {"id": media_id, "type": "video", "url": f"http://localhost:3000/media/{media_id}"}
+    def status_post_callback(request, context):
+        params = request.body.split("&")
+        status_params.append(params)
+        media_ids = [x.split("=")[1] for x in params if x.startswith("media_ids")]
+        return {"id": "1", "content": "hi", "media_attachments": [{"id": x} for x in media_ids]}
+    rmock.register_uri('POST', 'http://localhost:3000/api/v2/media', json=media_post_callback)
+    rmock.register_uri('GET', requests_mock.ANY, json=media_get_callback)
+    rmock.register_uri('POST', 'http://localhost:3000/api/v1/statuses', json=status_post_callback)
+
+    status = api.status_post_with_media(
+        "look at these",
+        [
+            'tests/image.jpg',
+            {"media_file": 'tests/video.mp4', "description": "a video"},
+            {"media_file": 'tests/amewatson.jpg', "focus": (0.5, 0.5)},
+        ],
+        quoted_status_id="5",
+        processing_poll_interval=0.01
+    )
+    assert len(status.media_attachments) == 3
+    assert "quoted_status_id=5" in status_params[0]
+    assert len(media_polls) == 1
+
+    posted_ids = [x.id for x in status.media_attachments]
+    video_id = media_polls[0].split("/")[-1]
+    assert posted_ids[1] == video_id
+
+    with pytest.raises(ValueError):
+        api.status_post_with_media("no media", [])
+
+@pytest.mark.parametrize('header, mime_type', [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR", "image/png"),
+    (b"GIF89a\x01\x00\x01\x00", "image/gif"),
+    (b"RIFF\x24\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"RIFF\x24\x00\x00\x00WAVEfmt ", "audio/wav"),
+    (b"\x00\x00\x00\x1cftypavif\x00\x00\x00\x00avifmif1miaf", "image/avif"),
+    (b"\x00\x00\x00\x18ftypmif1\x00\x00\x00\x00mif1heic", "image/heic"),
+    (b"\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2", "video/mp4"),
+    (b"\x00\x00\x00\x14ftypqt  \x00\x00\x02\x00qt  ", "video/quicktime"),
+    (b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01\x42\x82\x84webm", "video/webm"),
+    (b"ID3\x04\x00\x00\x00\x00\x00\x00", "audio/mpeg"),
+    (b"\xff\xfb\x90\x64\x00", "audio/mpeg"),
+    (b"\xff\xf1\x50\x80\x02", "audio/aac"),
+    (b"\xff\xf9\x50\x80\x02", "audio/aac"),
+    (b"OggS\x00\x02\x00\x00\x00\x00\x00\x00\x00\x00", "audio/ogg"),
+    (b"fLaC\x00\x00\x00\x22", "audio/flac"),
+    (b"definitely not media", None),
+])
+def test_media_type_sniffing(header, mime_type):
+    from mastodon.internals import _sniff_mime_type
+    assert _sniff_mime_type(header) == mime_type
+
+def test_media_type_sniffing_files_and_data(api):
+    import io
+    from mastodon.internals import _sniff_file_mime_type
+
+    assert api._Mastodon__guess_type('tests/image.jpg') == "image/jpeg"
+    assert api._Mastodon__guess_type('tests/video.mp4') == "video/mp4"
+    assert _sniff_file_mime_type.cache_info().currsize > 0
+
+    with open('tests/image.jpg', 'rb') as f:
+        data = f.read()
+    buffer = io.BytesIO(data)
+    file_name, media_file, mime_type = api._Mastodon__load_media_file(buffer)
+    assert mime_type == "image/jpeg"
+    assert file_name.endswith(".jpg")
+    assert media_file.tell() == 0
+
+    _, _, mime_type = api._Mastodon__load_media_file(data)
+    assert mime_type == "image/jpeg"
+
+    with pytest.raises(ValueError):
+        api._Mastodon__load_media_file(b"definitely not media")
@@ -0,0 +1,137 @@
+import pytest
+import requests_mock
+
+from mastodon import TimelineSync, SQLiteTimelineStore
+from mastodon.return_types import Status, try_cast_recurse
+
+def _status(id):
+    return {"id": str(id), "content": f"<p>status {id}</p>", "created_at": "2025-01-01T00:00:00.000Z", "account": {"id": "1", "username": "test"}}
+
+@pytest.fixture()
+def fake_home(api):
+    """
+    Fake home timeline: a list of numeric status ids, with since_id / max_id / limit and next links.
+    Like Mastodon, limits are capped (at server["max_limit"]) and there is a next link only if the page is
+    full, unless server["always_next"] is set.
+    """
+    rmock = requests_mock.Adapter()
+    api.session.mount(api.api_base_url, rmock)
+    timeline = []
+    requests = []
+    server = {"max_limit": 40, "always_next": False}
+
+    def home_callback(request, context):
+        requests.append(request.qs)
+        statuses = sorted(timeline, reverse=True)
+        if "max_id" in request.qs:
+            statuses = [x for x in statuses if x < int(request.qs["max_id"][0])]
+        if "since_id" in request.qs:
+            statuses = [x for x in statuses if x > int(request.qs["since_id"][0])]
+        limit = min(int(request.qs.get("limit", ["20"])[0]), server["max_limit"])
+        page = statuses[:limit]
+        if len(page) > 0 and (len(page) == limit or server["always_next"]):
+            context.headers["Link"] = f'<{api.api_base_url}/api/v1/timelines/home?max_id={page[-1]}>; rel="next"'
+        return [_status(x) for x in page]
+
+    def markers_callback(request, context):
+        if request.method == "POST":
+            markers["home"]["last_read_id"] = request.json()["home"]["last_read_id"]
+        return markers
+    markers = {"home": {"last_read_id": "0", "version": 1, "updated_at": "2025-01-01T00:00:00.000Z"}}
+
+    rmock.register_uri('GET', '/api/v1/timelines/home', json=home_callback)
+    rmock.register_uri('GET', '/api/v1/markers', json=markers_callback)
+    rmock.register_uri('POST', '/api/v1/markers', json=markers_callback)
+    return timeline, requests, markers, server
+
+def test_timeline_sync_gaps(api, fake_home, tmp_path):
+    timeline, requests, markers, server = fake_home
+    timeline.extend(range(1, 11))
+    sync = TimelineSync(api, str(tmp_path / "home.db"), page_size=5)
+
+    # Initial sync: only the newest page
+    assert [int(x.id) for x in sync.sync()] == [10, 9, 8, 7, 6]
+    assert sync.gaps() == []
+    assert [int(x.id) for x in sync.statuses(limit=None)] == [10, 9, 8, 7, 6]
+
+    # Nothing new: one request, nothing changes
+    requests.clear()
+    assert sync.sync() == []
+    assert len(requests) == 1
+    assert requests[0]["since_id"] == ["10"]
+
+    # "Downtime", more new statuses than fit on one page: gap gets detected, then filled
+    timeline.extend(range(11, 24))
+    new_statuses = sync.sync(fill_gaps=False)
+    assert [int(x.id) for x in new_statuses] == [23, 22, 21, 20, 19]
+    assert sync.gaps() == [("10", "19")]
+    assert sync.fill_gaps(max_pages=1) == 5
+    assert sync.gaps() == [("10", "14")]
+    assert sync.fill_gaps() == 3
+    assert sync.gaps() == []
+    assert [int(x.id) for x in sync.statuses(limit=None)] == list(range(23, 5, -1))
+    assert [int(x.id) for x in sync.statuses(limit=3, max_id=20)] == [19, 18, 17]
+
+    # Streaming events apply to the store, but don't move the sync position
+    timeline.append(24)
+    timeline.append(25)
+    sync.on_update(try_cast_recurse(Status, _status(25)))
+    sync.on_delete("22")
+    edited = sync.status("21")
+    edited.content = "<p>edited</p>"
+    sync.on_status_update(edited)
+    assert sync.status("22") is None
+    assert sync.status(21).content == "<p>edited</p>"
+    assert [int(x.id) for x in sync.sync()] == [25, 24]
+
+    # Markers and reads from the store
+    assert len(sync.unread()) == 19
+    sync.mark_read(20)
+    assert str(markers["home"]["last_read_id"]) == "20"
+    assert [int(x.id) for x in sync.unread()] == [25, 24, 23, 21]
+    sync.close()
+
+    # Everything is persisted
+    sync = TimelineSync(api, SQLiteTimelineStore(str(tmp_path / "home.db")), page_size=5)
+    requests.clear()
+    assert sync.sync() == []
+    assert requests[0]["since_id"] == ["25"]
+    assert len(sync.statuses(limit=None)) == 19
+    sync.close()
+
+def test_timeline_sync_page_size_capped(api, fake_home):
+    timeline, requests, markers, server = fake_home
+    timeline.extend(range(1, 11))
+    sync = TimelineSync(api, page_size=100)
+    assert sync.page_size == 40
+    sync.sync()
+
+    # More new statuses than the server returns per page
+    timeline.extend(range(11, 71))
+    assert len(sync.sync(fill_gaps=False)) == 40
+    assert sync.gaps() == [("10", "31")]
+    sync.fill_gaps()
+    assert [int(x.id) for x in sync.statuses(limit=None)] == list(range(70, 0, -1))
+
+    # A server that returns fewer statuses than asked for, but links to the next page
+    server["max_limit"] = 20
+    server["always_next"] = True
+    timeline.extend(range(71, 101))
+    assert len(sync.sync(fill_gaps=False)) == 20
+    assert sync.gaps() == [("70", "81")]
+    sync.fill_gaps()
+    assert sync.gaps() == []
+    assert len(sync.statuses(limit=None)) == 100
+
+def test_timeline_sync_marker_refresh(api, fake_home):
+    timeline, requests, markers, server = fake_home
+    timeline.extend(range(1, 6))
+    sync = TimelineSync(api)
+    sync.sync()
+    assert len(sync.unread()) == 5
+
+    # Marked as read elsewhere: picked up after the next sync
+    markers["home"]["last_read_id"] = "3"
+    assert len(sync.unread()) == 5
+    sync.sync()
+    assert [int(x.id) for x in sync.unread()] == [5, 4]
@@ -108,3 +108,164 @@ def test_str_to_type_dangling_open_bracket():
 def test_str_to_type_dangling_close_bracket():
     with pytest.raises(ValueError, match="Invalid type"):
         _str_to_type("Status]")
+
+def test_entity_fields_stored_once():
+    from mastodon.return_types import Status, Account
+    from mastodon.types_base import try_cast_recurse
+    status = try_cast_recurse(Status, {"id": "1", "content": "<p>hi</p>", "account": {"id": "2", "acct": "test"}, "extra_field": None})
+    assert status.content == "<p>hi</p>"
+    assert status.extra_field is None
+    assert isinstance(status.account, Account)
+    assert status.account.acct == "test"
+    assert "content" not in vars(status)
+    assert "extra_field" not in vars(status)
+
+    status.content = "<p>changed</p>"
+    assert status["content"] == "<p>changed</p>"
+    del status["extra_field"]
+    assert not hasattr(status, "extra_field")
+
+def test_entity_fields_shadowing_dict_methods():
+    from mastodon.return_types import Status
+    from mastodon.types_base import try_cast_recurse
+    status = try_cast_recurse(Status, {"id": "1", "items": [1, 2], "keys": "value"})
+    assert status.items == [1, 2]
+    assert status.keys == "value"
+    assert status["keys"] == "value"
+
+def test_entity_dict_methods_cast():
+    from mastodon.return_types import Status, Account, WebPushSubscriptionAlerts
+    from mastodon.types_base import try_cast_recurse, AttribAccessDict
+    status = try_cast_recurse(Status, {"id": "1", "content": "<p>hi</p>", "account": {"id": "2", "acct": "test"}})
+
+    copied = status.copy()
+    assert isinstance(copied, Status)
+    assert copied == status
+    assert copied is not status
+    assert copied.account.acct == "test"
+
+    status.update({"account": {"id": "3", "acct": "other"}})
+    assert isinstance(status.account, Account)
+    assert status.account.acct == "other"
+    status.update(account={"id": "4", "acct": "kwarg"})
+    assert status.account.acct == "kwarg"
+
+    status.setdefault("extra", {"a": 1})
+    assert isinstance(status.extra, AttribAccessDict)
+    assert status.extra.a == 1
+    assert status.setdefault("content", "unused") == "<p>hi</p>"
+
+    status |= {"account": {"id": "5", "acct": "ior"}}
+    assert isinstance(status, Status)
+    assert status.account.acct == "ior"
+
+    # Fields that shadow dict methods still win
+    alerts = try_cast_recurse(WebPushSubscriptionAlerts, {"update": True, "mention": False})
+    assert alerts.update is True
+    alerts |= {"mention": True}
+    assert alerts.mention is True
+
+def test_entity_access_map_extra_none_field():
+    from mastodon.return_types import Instance
+    from mastodon.types_base import try_cast_recurse
+    instance = try_cast_recurse(Instance, {"domain": "example.com", "unknown_field": None})
+    assert instance.uri == "example.com"
+    assert instance.unknown_field is None
+
+def test_entity_field_access():
+    from mastodon.return_types import Status, Instance, Collection
+    from mastodon.types_base import try_cast_recurse
+    status = try_cast_recurse(Status, {"id": "1", "content": "hi"})
+    assert status.in_reply_to_id is None
+    assert not hasattr(Status, "content")
+    del status["content"]
+    with pytest.raises(AttributeError):
+        status.content
+
+    # Redirects from the access map, for fields and for keys that are not fields
+    instance = try_cast_recurse(Instance, {"domain": "example.com", "uri": None, "contact": {"email": "admin@example.com"}})
+    assert instance.uri == "example.com"
+    assert instance.email == "admin@example.com"
+    instance = try_cast_recurse(Instance, {"uri": "example.org"})
+    assert instance.uri == "example.org"
+
+    # Fields that shadow dict methods win on instances, the dict methods still work
+    collection = try_cast_recurse(Collection, {"id": "1", "items": []})
+    assert collection.items == []
+    assert dict(dict.items(collection))["id"] == "1"
+
+def test_entity_interning():
+    import weakref
+    from mastodon.return_types import Status, Account
+    from mastodon.types_base import try_cast_recurse, entity_interning
+    account = {"id": "2", "acct": "test", "emojis": [{"shortcode": "blob", "url": "https://example.com/blob.png"}]}
+    other_account = {"id": "3", "acct": "other", "emojis": []}
+    page = [
+        {"id": "1", "account": dict(account), "tags": [{"name": "cats"}]},
+        {"id": "2", "account": dict(account), "tags": [{"name": "cats"}]},
+        {"id": "3", "account": other_account},
+    ]
+
+    statuses = try_cast_recurse(PaginatableList[Status], page)
+    assert statuses[0].account is not statuses[1].account
+
+    with entity_interning():
+        statuses = try_cast_recurse(PaginatableList[Status], page)
+    assert statuses[0].account is statuses[1].account
+    assert statuses[0].tags[0] is statuses[1].tags[0]
+    assert statuses[0].account is not statuses[2].account
+    assert isinstance(statuses[0].account, Account)
+    assert statuses[0].account.emojis[0].shortcode == "blob"
+    assert statuses[0].account == try_cast_recurse(Account, dict(account))
+
+    # Tables can be shared between blocks
+    table = weakref.WeakValueDictionary()
+    with entity_interning(table):
+        first = try_cast_recurse(Account, dict(account))
+    with entity_interning(table):
+        second = try_cast_recurse(Account, dict(account))
+    assert first is second
+    with entity_interning():
+        third = try_cast_recurse(Account, dict(account))
+    assert third is not first
+
+def test_entity_hash_and_fast_equality():
+    from mastodon.return_types import Status, Account
+    from mastodon.types_base import try_cast_recurse
+    status = try_cast_recurse(Status, {"id": "1", "content": "hi"})
+    same = try_cast_recurse(Status, {"id": "1", "content": "hi"})
+    assert status == same
+    assert hash(status) == hash(same)
+    assert len({status, same, try_cast_recurse(Status, {"id": "2"})}) == 2
+    assert status == {"id": "1", "content": "hi"}
+    assert status != {"id": "2", "content": "hi"}
+    with pytest.raises(TypeError):
+        hash(try_cast_recurse(Account, {"acct": "no_id"}))
+
+def test_deduplicate_entities():
+    from mastodon import Mastodon
+    from mastodon.return_types import Status
+    from mastodon.types_base import try_cast_recurse
+    page_one = try_cast_recurse(PaginatableList[Status], [{"id": "3", "uri": "a"}, {"id": "2", "uri": "b"}])
+    page_two = try_cast_recurse(PaginatableList[Status], [{"id": "2", "uri": "b"}, {"id": "1", "uri": "b"}, {"uri": "c"}])
+    merged = Mastodon.deduplicate_entities(page_one + page_two)
+    assert [status.id for status in merged] == ["3", "2", "1", None]
+    assert merged[1] is page_one[1]
+    assert [status.id for status in Mastodon.deduplicate_entities(page_one + page_two, key="uri")] == ["3", "2", None]
+    assert len(Mastodon.deduplicate_entities(page_two, key=lambda status: status.uri)) == 2
+
+def test_type_name_caching():
+    from mastodon.return_types import Status, Account
+    from mastodon.types_base import try_cast_recurse, Entity
+    assert _str_to_type("PaginatableList[Status]") is _str_to_type("PaginatableList[Status]")
+    assert Status._mastopy_type == "Status"
+
+    statuses = try_cast_recurse(PaginatableList[Status], [{"id": "1", "account": {"id": "2"}, "extra": {"a": 1}}])
+    assert statuses._mastopy_type == "PaginatableList[Status]"
+    assert statuses[0]._mastopy_type == "Status"
+    assert "_mastopy_type" not in vars(statuses[0])
+    assert statuses[0].extra._mastopy_type == "AttribAccessDict"
+
+    round_tripped = Entity.from_json(statuses.to_json())
+    assert isinstance(round_tripped[0].account, Account)
+    assert round_tripped == statuses